@@ -12,6 +12,9 @@ from copy import copy, deepcopy
 import time
 from uuid import uuid4
 from logging import warning
+from hashlib import md5
+from queue import Queue
+from threading import Thread
 
 # Plotting
 import plotly.graph_objs as go
@@ -20,6 +23,7 @@ import pickle
 
 # Custom
 from utils import toolbox as tb
+from utils.database import Candles
 from errors.exceptions import DiscontinuousError, ImplementationError
 
 
@@ -80,7 +84,13 @@ class Core:
     def _get_data(self):
         """Parse user-supplied data into dict of DataEngine objects."""
 
-        data = self.get_data()
+        requirements = self._get_data_requirements()
+        if requirements and requirements.get('stream'):
+            return self._get_stream(requirements)
+        elif requirements:
+            data = self._query_data(requirements)
+        else:
+            data = self.get_data()
 
         required_data = ['open','close','open_date','high','low']
         if not np.isin(required_data, data.columns).all():
@@ -88,7 +98,9 @@ class Core:
                 Data must contain columns: {required_data}
             ''')
 
-        data = data.sort_values('open_date')
+        # Declared queries are already ordered by open_date
+        if not requirements:
+            data = data.sort_values('open_date')
         data.index = data.open_date
 
         temp_dates = pd.unique(data.open_date)
@@ -99,7 +111,10 @@ class Core:
         data_dict = {}
         for symbol in self.symbols.symbol:
             try:
-                data_dict[symbol] = DataEngine(data[data.symbol == symbol])
+                data_dict[symbol] = DataEngine(
+                    data[data.symbol == symbol],
+                    timeframes = (requirements or {}).get('timeframes')
+                    )
             except DiscontinuousError as err:
                 print(f'There are missing dates in data for {symbol}')
                 raise err
@@ -110,6 +125,68 @@ class Core:
         return data_dict
 
 
+    def _get_data_requirements(self):
+        """Validate the user-declared data requirements, if any."""
+
+        requirements = self.get_data_requirements()
+        if not requirements:
+            return None
+
+        keys = ['table', 'columns', 'from_date', 'to_date', 'stream',
+                'timeframes']
+        unknown = [k for k in requirements if k not in keys]
+        if unknown:
+            raise ImplementationError(f'''
+                Unknown data requirements: {unknown}. Options are: {keys}
+            ''')
+
+        if requirements.get('stream') and requirements.get('timeframes'):
+            raise ImplementationError('''
+                Higher timeframes are built from all candles at load time
+                and can't be combined with a streamed data requirement.
+            ''')
+
+        return requirements
+
+
+    def _query_data(self, requirements):
+        """
+        Build a single query from the declared data requirements, selecting
+        only the declared columns for the portfolio symbols within the
+        declared date range, ordered by open_date.
+        """
+
+        columns = requirements.get('columns')
+        if columns:
+            required = ['symbol','open_date','open','close','high','low']
+            columns = required + [c for c in columns if c not in required]
+
+        return Candles().get_columns(
+            columns = columns,
+            symbols = list(self.symbols.symbol),
+            from_date = requirements.get('from_date'),
+            to_date = requirements.get('to_date'),
+            table = requirements.get('table', 'engineered_data')
+            )
+
+
+    def _get_stream(self, requirements):
+        """
+        Create a DataFeed from the declared data requirements and return its
+        dict of StreamingDataEngine objects, which grows as symbols appear.
+        """
+
+        feed = DataFeed(requirements, list(self.symbols.symbol))
+
+        self.total_candles = feed.total_candles
+        self.start_date, self.end_date = feed.start_date, feed.end_date
+
+        # Engines are created by the feed with the first chunk holding
+        # candles of their symbol
+        feed.load_next()
+        return feed.engines
+
+
     # TODO Automatically find symbols from DB?
     def _get_symbols(self):
         """Ensure that user-supplied symbols are formatted correctly."""
@@ -148,6 +225,51 @@ class Core:
         ''')
 
 
+    def get_data_requirements(self):
+        """
+        Optionally declare the data the strategy needs instead of implementing
+        get_data. Core then builds one query that selects only the declared
+        columns for the symbols returned by get_symbols, in time order.
+        Return a dict with optional keys:
+
+            'table': string
+                Table to read from. Default 'engineered_data'.
+            'columns': list of strings
+                Extra columns needed by generate_signals. symbol, open_date,
+                open, close, high and low are always included. Omit to
+                select every column.
+            'from_date', 'to_date': datetime | date string
+                Inclusive date range of candles to load. Omit for all dates.
+            'stream': dict
+                Stream candles in time-ordered chunks instead of loading
+                them all at once, keeping only a bounded window per symbol
+                in memory. Optional keys:
+                    'chunk_size': timedelta, default 30 days
+                    'lookback': int, candles kept behind the current
+                        candle, default 500
+                    'cache_dir': path to keep a local copy of each
+                        completed chunk, read instead of the database
+                        on later runs while the chunk's row count and
+                        latest date are unchanged. Values updated in
+                        place aren't detected, delete the directory to
+                        refresh them. Default None.
+            'timeframes': list of strings
+                Higher timeframes, like ['4h', '1d'], to aggregate the
+                candles into at load time. generate_signals reads them with
+                self.data[symbol].timeframe('4h'), which only exposes bars
+                completed by the current candle. Can't be combined with
+                'stream'.
+
+        For example:
+
+            {'columns':['MA_48H'], 'from_date':'2018-06-01 00:00:00'}
+
+        Return None (the default) to use get_data.
+        """
+
+        return None
+
+
     def get_symbols(self):
         """
         If no symbols are provided at initialization, the get_symbols method
@@ -279,27 +401,16 @@ class Core:
         # Keep track of iterations for progress bar
         count = 1
 
-        # Initialize symbol and DataEngine
-        symbol = self.symbols.symbol.iloc[0]
-        self.data = self.data_dict[symbol]
-
-        while not self.data.finished:
+        while not all(e.finished for e in list(self.data_dict.values())):
             for symbol in self.symbols.symbol:
 
-                self.data = self.data_dict[symbol]
-                if self.data.finished:
+                # Streamed symbols have no engine before their first candle
+                self.data = self.data_dict.get(symbol)
+                if self.data is None or self.data.finished or \
+                   self.data.waiting:
                     continue
 
-                # Update state variables
-                self.symbol = symbol
-                self.date = self.data[0].open_date
-                self.currency = self.symbols.loc[symbol].to_symbol
-                self.unresolved_trade = self.trade_manager.unresolved_trade[symbol]
-                self.last_buy = self.trade_manager.last_buy[self.symbol]
-                self.num_unresolved = self.trade_manager.num_unresolved[self.symbol]
-
-                self.generate_signals()
-                self.data_dict[symbol].increment()
+                self._step(symbol)
 
             # Update progress bar
             if self.verbose:
@@ -311,6 +422,39 @@ class Core:
                 count += 1
 
 
+    def _step(self, symbol):
+        """Generate signals for the current candle of symbol and move on."""
+
+        # Update state variables
+        self.data = self.data_dict[symbol]
+        self.symbol = symbol
+        self.date = self.data[0].open_date
+        self.currency = self.symbols.loc[symbol].to_symbol
+        self.unresolved_trade = self.trade_manager.unresolved_trade[symbol]
+        self.last_buy = self.trade_manager.last_buy[self.symbol]
+        self.num_unresolved = self.trade_manager.num_unresolved[self.symbol]
+
+        self.generate_signals()
+        self.data.increment()
+
+
+    def run_pending(self):
+        """
+        Generate signals for candles appended to the StreamingDataEngines
+        since the bot finished, in time order across symbols. Used to keep a
+        bot running on new data, see ingestion.events.ShadowBacktest.
+        Trades are kept by the TradeManager, not inserted.
+        """
+        pending = True
+        while pending:
+            pending = False
+            for symbol in self.symbols.symbol:
+                engine = self.data_dict.get(symbol)
+                if engine is not None and not engine.finished:
+                    self._step(symbol)
+                    pending = True
+
+
 class TradeManager:
     """Keeps track of bot trades."""
     def __init__(self, symbols, portfolio, sql_config):
@@ -575,7 +719,7 @@ class TradeManager:
 
 class DataEngine:
     """Manages candles such that the 'current' candle is always at index 0."""
-    def __init__(self, data):
+    def __init__(self, data, timeframes=None):
         if data.empty:
             raise ValueError('DataEngine was given an empty dataframe')
 
@@ -583,23 +727,20 @@ class DataEngine:
         self._check_data_continuity()
         self.length = len(self.data)
         self.increments = 0
+        self.offset = 0
         self.finished = False
 
+        self.timeframes = {}
+        for interval in timeframes or []:
+            self.timeframes[interval] = Timeframe(self, interval)
+
 
     def _check_data_continuity(self):
         """Ensure that candles provided form a continuous timeseries."""
-        dates = list(self.data.open_date.unique())
-        dates.sort()
-
-        f = lambda x : tb.DateConvert(x).datetime
-        dates = list(map(f, dates))
-
-        delta = []
-        for i, _ in enumerate(dates, start=1):
-            if i < len(dates):
-                delta.append(dates[i]-dates[i-1])
+        # Spacing is inferred, so any constant candle interval is accepted
+        continuity = tb.DateContinuity(self.data.open_date.values, freq=None)
 
-        if len(pd.unique(delta)) > 1:
+        if not continuity.gaps.empty or len(continuity.misaligned):
             raise DiscontinuousError(
                 'There appear to be missing dates in the market data.'
             )
@@ -613,17 +754,25 @@ class DataEngine:
         try:
 
             if isinstance(ind, slice):
+                position = self.increments - self.offset
                 if ind.start is None:
-                    start = self.increments
+                    start = position
                 else:
-                    start = ind.start + self.increments
+                    start = ind.start + position
 
+                stop = None
                 if ind.stop is not None:
-                    stop = ind.stop + self.increments
+                    stop = ind.stop + position
+
+                # Candles trimmed from a streaming window are gone
+                if self.offset and start < 0:
+                    raise IndexError
 
                 ind = slice(start, stop)
             else:
-                ind += self.increments
+                ind += self.increments - self.offset
+                if self.offset and ind < 0:
+                    raise IndexError
 
             return self.data.iloc[ind,:]
 
@@ -647,6 +796,369 @@ class DataEngine:
         """Reset candle index to the begining."""
         self.increments = 0
 
+    @property
+    def waiting(self):
+        """All loaded candles are used, but more may still be appended."""
+        return not self.finished and self.increments == self.length
+
+    @property
+    def initial_close(self):
+        """Close price of the first candle."""
+        return self.data.close.iloc[0]
+
+    @property
+    def final_close(self):
+        """Close price of the most recent candle available."""
+        return self.data.close.iloc[-1]
+
+    def timeframe(self, interval):
+        """Return the Timeframe of <interval> aligned to the current candle."""
+        try:
+            return self.timeframes[interval]
+        except KeyError:
+            raise ImplementationError(f'''
+                No {interval} timeframe was built. Declare it in
+                get_data_requirements, like {{'timeframes':['{interval}']}}.
+            ''')
+
+
+class Timeframe:
+    """
+    Candles of a DataEngine aggregated into bars of a higher timeframe, like
+    '4h' or '1d', and aligned to the engine's current candle.
+
+    Bars are aligned to multiples of the interval since the epoch, like the
+    rollup tables. Everything is computed once at load time, so lookups while
+    iterating are constant time. Only bars that closed by the end of the
+    current candle are visible: the most recent completed bar is at index 0
+    and earlier bars at negative indices. The bar still in progress is
+    available as Timeframe.current, built from the candles up to and
+    including the current one.
+    """
+    columns = ['open', 'high', 'low', 'close', 'volume']
+
+    def __init__(self, engine, interval):
+        self.engine = engine
+        self.interval = interval
+
+        data = engine.data
+        step = int(pd.Timedelta(interval).total_seconds())
+        seconds = tb.DateArrayConvert(data.open_date).timestamp
+        spacing = np.diff(seconds).min() if len(seconds) > 1 else 3600
+        if step % spacing:
+            raise ImplementationError(f'''
+                Timeframe {interval} is not a multiple of the candle spacing.
+            ''')
+
+        bucket = pd.Series(seconds//step*step, index=data.index)
+        columns = [c for c in self.columns if c in data.columns]
+        aggregations = dict(open='first', high='max', low='min', close='last',
+                            volume='sum')
+        aggregations = {c:aggregations[c] for c in columns}
+
+        groups = data[columns].groupby(bucket.values)
+        bars = groups.agg(aggregations)[columns]
+        bars['num_candles'] = groups.close.count()
+        open_seconds = bars.index.values.astype('int64')
+        bars.index = open_seconds.astype('datetime64[s]')
+        bars.index.name = 'open_date'
+        self.bars = bars
+
+        # Number of bars whose close is at or before each candle's close
+        closes = seconds + spacing
+        self.completed = np.searchsorted(open_seconds + step, closes,
+                                         side='right')
+
+        # The bar in progress at each candle, from the candles so far
+        partial = {}
+        by_bar = data.groupby(bucket.values)
+        if 'open' in columns:
+            partial['open'] = by_bar.open.transform('first').values
+        if 'high' in columns:
+            partial['high'] = by_bar.high.cummax().values
+        if 'low' in columns:
+            partial['low'] = by_bar.low.cummin().values
+        partial['close'] = data.close.values
+        if 'volume' in columns:
+            partial['volume'] = by_bar.volume.cumsum().values
+        partial['num_candles'] = by_bar.cumcount().values + 1
+        self.partial = pd.DataFrame(
+            partial, index=bucket.values.astype('datetime64[s]')
+            )[columns + ['num_candles']]
+        self.partial.index.name = 'open_date'
+
+        self.arrays = {c:bars[c].values for c in bars.columns}
+
+    def __repr__(self):
+        return f'Timeframe({self.interval!r}, bars={len(self.bars)})'
+
+    def __len__(self):
+        """Number of bars completed by the current candle."""
+        return int(self.completed[self._cursor()])
+
+    def _cursor(self):
+        return self.engine.increments - self.engine.offset
+
+    def __getitem__(self, ind):
+        """
+        Access the most recent completed bar at index 0 and earlier bars with
+        negative indices. Bars that haven't completed can't be accessed.
+        """
+        position = len(self) - 1
+        try:
+            if isinstance(ind, slice):
+                start = 0 if ind.start is None else ind.start + position
+                stop = position + 1 if ind.stop is None else \
+                       min(ind.stop + position, position + 1)
+                if start < 0:
+                    raise IndexError
+                return self.bars.iloc[start:stop]
+
+            ind += position
+            if ind < 0 or ind > position:
+                raise IndexError
+            return self.bars.iloc[ind]
+
+        except IndexError:
+            warning('Timeframe: Index out of bounds')
+            return None
+
+    @property
+    def current(self):
+        """The bar in progress, up to and including the current candle."""
+        return self.partial.iloc[self._cursor()]
+
+    def values(self, column, n):
+        """
+        Array of the last <n> completed values of <column>, like
+        values('close', 7) for the last 7 closes, or fewer if fewer bars
+        have completed.
+        """
+        completed = len(self)
+        return self.arrays[column][max(0, completed - n):completed]
+
+
+class StreamingDataEngine(DataEngine):
+    """
+    DataEngine over a bounded window of candles, appended to in chunks by a
+    DataFeed. Only 'lookback' candles behind the current candle are kept.
+    Future candles are available up to the end of the loaded chunk.
+    """
+    def __init__(self, lookback):
+        self.data = pd.DataFrame()
+        self.lookback = lookback
+        self.feed = None
+        self.length = 0
+        self.increments = 0
+        self.offset = 0
+        self.finished = False
+        self._initial_close = None
+
+    def append(self, data):
+        """Add a time-ordered chunk of candles and trim the window."""
+
+        if self.data.empty:
+            if self._initial_close is None:
+                self._initial_close = data.close.iloc[0]
+            window = data
+        else:
+            window = pd.concat([self.data, data])
+
+        # Check continuity across the chunk boundary as well
+        self.data = window
+        self._check_data_continuity()
+
+        trim = max(0, self.increments - self.offset - self.lookback)
+        self.data = window.iloc[trim:]
+        self.offset += trim
+        self.length += len(data)
+
+    def restart(self):
+        """
+        Drop the window after a gap in the symbol's candles, so the next
+        appended chunk starts a new continuous series.
+        """
+        self.data = pd.DataFrame()
+        self.length = 0
+        self.increments = 0
+        self.offset = 0
+        self.finished = False
+
+    def increment(self):
+        """
+        Increment the current candle forward by one. Once the loaded window
+        is used up, the engine waits for the feed to load the next chunk,
+        and is finished if the feed has no candles left.
+        """
+        self.increments += 1
+        if self.increments == self.length:
+            if self.feed is not None:
+                self.feed.load_when_waiting()
+            if self.increments == self.length:
+                self.finished = self.feed is None or self.feed.exhausted
+
+    def reset_index(self):
+        raise NotImplementedError(
+            'A StreamingDataEngine cannot be reset to the begining.'
+        )
+
+    @property
+    def initial_close(self):
+        return self._initial_close
+
+
+class DataFeed:
+    """
+    Lazily read declared candles in time-ordered chunks, from the database or
+    a local cache, and hand each chunk to per-symbol StreamingDataEngines.
+    The next chunk is prefetched in a background thread while the current
+    one is iterated through.
+
+    An engine is created with the first chunk holding candles of its symbol,
+    and the next chunk is only loaded once every engine has used up its
+    candles, so symbols missing from a chunk wait for the others.
+    """
+    def __init__(self, requirements, symbols):
+
+        stream = requirements['stream']
+        if not isinstance(stream, dict):
+            stream = {}
+
+        self.requirements = requirements
+        self.symbols = symbols
+        self.chunk_size = stream.get('chunk_size', timedelta(days=30))
+        self.lookback = stream.get('lookback', 500)
+        self.cache_dir = stream.get('cache_dir')
+        self.table = requirements.get('table', 'engineered_data')
+
+        self.columns = requirements.get('columns')
+        if self.columns:
+            required = ['symbol','open_date','open','close','high','low']
+            self.columns = required + \
+                [c for c in self.columns if c not in required]
+
+        if self.cache_dir:
+            Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
+
+        self.start_date, self.end_date, self.total_candles = self._summarize()
+        if self.start_date is None:
+            raise ValueError('No data found for the declared requirements')
+
+        self.start_date = tb.DateConvert(self.start_date).datetime
+        self.end_date = tb.DateConvert(self.end_date).datetime
+
+        self.engines = {}
+        self.exhausted = False
+        self._queue = Queue(maxsize=1)
+        self._thread = Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def _summarize(self):
+        """(start_date, end_date, total_candles) of the declared candles."""
+        return Candles().get_date_summary(
+            symbols = self.symbols,
+            from_date = self.requirements.get('from_date'),
+            to_date = self.requirements.get('to_date'),
+            table = self.table
+            )
+
+    def load_when_waiting(self):
+        """Load the next chunk once no engine has candles left to use."""
+        while not self.exhausted and \
+              all(e.waiting for e in list(self.engines.values())):
+            self.load_next()
+
+    def load_next(self):
+        """
+        Append the next chunk to the engines of its symbols, creating
+        engines for new symbols.
+        """
+
+        if self.exhausted:
+            return
+
+        chunk = self._queue.get()
+        if isinstance(chunk, Exception):
+            self.exhausted = True
+            raise chunk
+        if chunk is None:
+            self.exhausted = True
+            for engine in self.engines.values():
+                if engine.waiting:
+                    engine.finished = True
+            return
+        if chunk.empty:
+            return self.load_next()
+
+        chunk.index = chunk.open_date
+        for symbol, candles in chunk.groupby('symbol', sort=False):
+            engine = self.engines.get(symbol)
+            if engine is None:
+                engine = StreamingDataEngine(self.lookback)
+                engine.feed = self
+                self.engines[symbol] = engine
+
+            # Every engine has used its candles by now, so after a gap the
+            # symbol starts over without losing any
+            try:
+                engine.append(candles)
+            except DiscontinuousError:
+                engine.restart()
+                engine.append(candles)
+
+    def _produce(self):
+        """Read chunks in order, blocking while one is waiting to be used."""
+        try:
+            for chunk in self._read_chunks():
+                self._queue.put(chunk)
+            self._queue.put(None)
+        except Exception as err:
+            self._queue.put(err)
+
+    def _read_chunks(self):
+        chunk_start = self.start_date
+        while chunk_start <= self.end_date:
+            chunk_end = chunk_start + self.chunk_size
+            yield self._read_chunk(chunk_start, chunk_end)
+            chunk_start = chunk_end
+
+    def _read_chunk(self, chunk_start, chunk_end):
+        """Read candles with chunk_start <= open_date < chunk_end."""
+
+        to_date = min(chunk_end - timedelta(seconds=1), self.end_date)
+
+        # The number of rows and latest date of the chunk are part of the
+        # key, so inserted or deleted candles aren't served from the cache
+        path = None
+        if self.cache_dir:
+            version = Candles().get_version(
+                symbols = self.symbols,
+                from_date = chunk_start,
+                to_date = to_date,
+                table = self.table
+                )
+            key = f'{self.table}{self.columns}{sorted(self.symbols)}' + \
+                  f'{chunk_start}{chunk_end}{version}'
+            path = Path(self.cache_dir)/(md5(key.encode()).hexdigest()+'.pkl')
+            if path.exists():
+                with open(path, 'rb') as f:
+                    return pickle.load(f)
+
+        chunk = Candles().get_columns(
+            columns = self.columns,
+            symbols = self.symbols,
+            from_date = chunk_start,
+            to_date = to_date,
+            table = self.table
+            )
+
+        # Only completed chunks are cached, the last one may still grow
+        if path and chunk_end <= self.end_date:
+            with open(path, 'wb') as f:
+                pickle.dump(chunk, f)
+
+        return chunk
+
 
 
 class SQLManager:
@@ -820,7 +1332,7 @@ class Metrics:
             unresolved = self.trades[symbol]['unresolved_trades']
 
             if unresolved:
-                most_recent_price = self.bot.data_dict[symbol].data.close.iloc[-1]
+                most_recent_price = self.bot.data_dict[symbol].final_close
 
                 for trade in unresolved:
                     curr_val = trade['amount_fs']*most_recent_price
@@ -875,7 +1387,7 @@ class Metrics:
             unresolved = self.trades[symbol]['unresolved_trades']
 
             if unresolved:
-                most_recent_price = self.bot.data_dict[symbol].data.close.iloc[-1]
+                most_recent_price = self.bot.data_dict[symbol].final_close
 
                 for trade in unresolved:
                     buy_price = trade['price']
@@ -899,9 +1411,11 @@ class Metrics:
 
         self.instrument_change = []
         for symbol in self.bot.symbols.symbol:
-            temp = self.bot.data_dict[symbol].data
-            ip = temp.loc[temp.open_date.min()].close # Initial price
-            fp = temp.loc[temp.open_date.max()].close # Final price
+            if symbol not in self.bot.data_dict:
+                continue
+            engine = self.bot.data_dict[symbol]
+            ip = engine.initial_close # Initial price
+            fp = engine.final_close # Final price
             self.instrument_change.append(100*((fp-ip)/fp))
 
         self.overall_market_change = round(np.average(self.instrument_change),4)
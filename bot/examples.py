@@ -1,14 +1,15 @@
-from bot import Backtest
-from utils.database import Database
+from bot.base import Backtest
 
 
 class ADABot(Backtest):
     """An example of a complete implementation of the Backtest class."""
 
-    def get_data(self):
-        """User returns hourly candles for the backtest to iterate through."""
-        sql = "SELECT * FROM engineered_data WHERE symbol = 'ADABTC'"
-        return tb.Database().read(sql)
+    def get_data_requirements(self):
+        """
+        User declares the columns the strategy uses. Core loads hourly
+        candles for the symbols from get_symbols with only these columns.
+        """
+        return {'table':'engineered_data', 'columns':['moving_avg_48']}
 
 
     def get_symbols(self):
@@ -35,11 +36,11 @@ class ADABot(Backtest):
         return {
             'purse':purse,
             'holdout':holdout,
-            'buy_sell_amount':buy_sell_amount
+            'buy_sell_amount':buy_sell_amount,
             'slippage':slippage,
             'trading_fee':trading_fee
             }
-        
+
 
     def generate_signals(self):
         """A mock trading strategy."""
@@ -122,3 +122,213 @@ user_symbols = {
          'KNC/BTC'
     ]
 }
+
+
+"""
+Configuration for query instrumentation in utils.database.Database.
+
+Parameters:
+-------------
+enabled: boolean
+    True ---> record duration, rows and bytes for every query.
+
+slow_query_threshold: float
+    Queries taking at least this many seconds are written to slow_query_log.
+
+slow_query_log: string | None
+    Path of the slow query log. None to disable.
+
+explain: boolean
+    True ---> capture an EXPLAIN plan for slow SELECT/UPDATE/DELETE queries.
+
+dump_path: string | None
+    File that ingestion.manager.Tasks appends query statistics to after
+    each task. None to disable.
+"""
+query_profiling_config = dict(
+    enabled = True,
+    slow_query_threshold = 1.0,
+    slow_query_log = './data/logs/slow_queries.log',
+    explain = True,
+    dump_path = './data/logs/query_stats.jsonl'
+)
+
+
+"""
+Configuration for fetching candles from exchange APIs.
+
+Parameters:
+-------------
+workers: int
+    Number of threads fetching symbol/date-range chunks concurrently in
+    ingestion.core.insert_hourly_candles. 1 fetches sequentially.
+
+max_concurrent_requests: int
+    Process-wide cap on candle requests in flight at once, shared by every
+    concurrent fetch.
+
+async_concurrency: int
+    Cap on candle requests in flight at once on the event loop of an asyncio
+    datasource (exchanges.base.AsyncExchangeData). Also the size of its HTTP
+    connection pool.
+
+datasource: string
+    Datasource used when none is passed to ingestion.core. 'async' fetches
+    with exchanges.binance.AsyncBinanceData on a single event loop, 'sync'
+    with the threaded exchanges.binance.BinanceData client.
+"""
+candle_fetch_config = dict(
+    workers = 8,
+    max_concurrent_requests = 8,
+    async_concurrency = 50,
+    datasource = 'async'
+)
+
+
+"""
+Configuration for the process-wide Binance request weight limiter.
+
+Parameters:
+-------------
+weight_per_minute: int
+    Request weight allowed by Binance per minute.
+
+safety_margin: float
+    Fraction of weight_per_minute to actually use.
+
+max_retries: int
+    Times to retry a request rejected with HTTP 429 or 418 before raising.
+
+default_backoff: float
+    Seconds to back off after a 429/418 if no Retry-After header is sent.
+"""
+binance_rate_limit_config = dict(
+    weight_per_minute = 1200,
+    safety_margin = 0.9,
+    max_retries = 5,
+    default_backoff = 30
+)
+
+
+"""
+Parameters for the candle ingestion pipeline in ingestion.pipeline.
+
+queue_size: int
+    Max items waiting between two pipeline stages. A full queue blocks the
+    stage feeding it, so fetching can't run arbitrarily far ahead of inserts.
+
+insert_batch_rows: int
+    Rows accumulated by the insert stage before each bulk insert.
+"""
+ingestion_pipeline_config = dict(
+    queue_size = 4,
+    insert_batch_rows = 4000
+)
+
+
+"""
+Configuration for computing engineered data in ingestion.core.engineer_data.
+
+Parameters:
+-------------
+workers: int | None
+    Processes computing indicators when ingestion.live.insert_engineered_data
+    recomputes engineered data. Symbols are partitioned across them. None
+    uses every core, 1 computes in-process.
+
+partitions_per_worker: int
+    Symbol partitions handed to each worker. More partitions even out
+    symbols with uneven history at the cost of more pickling.
+
+sql_pushdown: boolean
+    True ---> indicators declaring CustomIndicator.get_sql are calculated
+              inside MySQL with window functions when engineered data is
+              recomputed. Requires MySQL 8.
+
+interpolation_policy: string
+    How null candle values are filled before calculating indicators:
+    'ffill', 'linear' or 'drop'. See ingestion.core.interpolate_nulls.
+
+store: string
+    'table' ---> store indicators as columns of engineered_data, next to a
+                 copy of the candle columns. Each new indicator alters the
+                 table.
+    'long' ---> store indicators as rows of indicator_values, see
+                utils.database.IndicatorStore. New indicators need no schema
+                change. Read them back with the 'indicator_values' table in
+                Candles.get_columns or bot data requirements. sql_pushdown
+                only applies to the 'table' store.
+"""
+engineered_data_config = dict(
+    workers = None,
+    partitions_per_worker = 4,
+    sql_pushdown = False,
+    interpolation_policy = 'ffill',
+    store = 'table'
+)
+
+
+"""
+Configuration for higher-timeframe candles rolled up from hourly candles in
+ingestion.rollups.
+
+Parameters:
+-------------
+intervals: list of strings
+    Bar intervals, like '4h' or '1d'. Each is kept in a candles_<interval>
+    table and updated after every candle update.
+
+ranges_per_query: int
+    Symbol date ranges read from candles per query when updating rollups.
+"""
+rollup_config = dict(
+    intervals = ['4h', '1d'],
+    ranges_per_query = 20
+)
+
+
+"""
+Configuration for the long running scheduler started with
+`python main.py scheduler`, see ingestion.scheduler.
+
+Parameters:
+-------------
+tasks: dict
+    Tasks of ingestion.manager.Tasks to run, each with:
+        'frequency': string, like '1h' or '1d'
+        'offset': string, delay after each multiple of frequency since the
+            epoch, like '5min'. Runs happen at 00:05, 01:05, ... for an
+            hourly task with a 5 minute offset.
+
+custom_data_offset: string
+    Offset of each CustomData source, which runs at its own
+    automation_frequency. None skips custom data.
+
+workers: int
+    Maximum number of tasks run concurrently. A task is never started again
+    while a previous run of it is still going.
+
+poll_seconds: int
+    Seconds between checks for due tasks.
+
+reuse_connections: boolean
+    Keep a database connection open per worker thread between runs instead
+    of connecting for every query. See utils.database.reuse_connections.
+
+events: boolean
+    True ---> don't schedule insert_engineered_features. Engineered data is
+              built from the candles of every insert as soon as they are
+              stored, see ingestion.events.
+"""
+scheduler_config = dict(
+    tasks = dict(
+        insert_candles = dict(frequency='1h', offset='1min'),
+        insert_engineered_features = dict(frequency='1h', offset='5min'),
+        repair_data = dict(frequency='1d', offset='30min')
+    ),
+    custom_data_offset = '2min',
+    workers = 4,
+    poll_seconds = 5,
+    reuse_connections = True,
+    events = False
+)
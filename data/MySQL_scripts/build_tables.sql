@@ -17,6 +17,44 @@ CREATE TABLE `candles` (
    UNIQUE KEY `stamp` (`open_date`,`symbol`)
 );
 
+CREATE TABLE `candles_4h` (
+   `id` int(11) NOT NULL AUTO_INCREMENT,
+   `symbol` varchar(20),
+   `open_date` datetime,
+   `open` float(20,9),
+   `high` float(20,9),
+   `low` float(20,9),
+   `close` float(20,9),
+   `volume` float(20,9),
+   `close_date` datetime,
+   `quote_asset_volume` float(20,9),
+   `number_of_trades` int(11),
+   `taker_buy_base_asset_volume` float(20,9),
+   `taker_buy_quote_asset_volume` float(20,9),
+   `num_candles` int(11),
+   PRIMARY KEY (`id`),
+   UNIQUE KEY `stamp` (`open_date`,`symbol`)
+);
+
+CREATE TABLE `candles_1d` (
+   `id` int(11) NOT NULL AUTO_INCREMENT,
+   `symbol` varchar(20),
+   `open_date` datetime,
+   `open` float(20,9),
+   `high` float(20,9),
+   `low` float(20,9),
+   `close` float(20,9),
+   `volume` float(20,9),
+   `close_date` datetime,
+   `quote_asset_volume` float(20,9),
+   `number_of_trades` int(11),
+   `taker_buy_base_asset_volume` float(20,9),
+   `taker_buy_quote_asset_volume` float(20,9),
+   `num_candles` int(11),
+   PRIMARY KEY (`id`),
+   UNIQUE KEY `stamp` (`open_date`,`symbol`)
+);
+
 CREATE TABLE `engineered_data` (
    `id` int(11) NOT NULL AUTO_INCREMENT,
    `symbol` varchar(20),
@@ -36,6 +74,38 @@ CREATE TABLE `engineered_data` (
    UNIQUE KEY `stamp` (`open_date`,`symbol`)
 );
 
+CREATE TABLE `candle_coverage` (
+   `symbol` varchar(20),
+   `source` varchar(40),
+   `candle_interval` varchar(10),
+   `start_date` datetime,
+   `end_date` datetime,
+   UNIQUE KEY `stamp` (`symbol`,`source`,`candle_interval`,`start_date`)
+);
+
+CREATE TABLE `indicator_names` (
+   `indicator_id` int(11) NOT NULL AUTO_INCREMENT,
+   `indicator` varchar(60),
+   PRIMARY KEY (`indicator_id`),
+   UNIQUE KEY `stamp` (`indicator`)
+);
+
+CREATE TABLE `indicator_values` (
+   `symbol` varchar(20),
+   `open_date` datetime,
+   `indicator_id` int(11),
+   `value` float(20,9),
+   PRIMARY KEY (`symbol`,`open_date`,`indicator_id`)
+);
+
+CREATE TABLE `indicator_state` (
+   `indicator` varchar(60),
+   `symbol` varchar(20),
+   `open_date` datetime,
+   `state` mediumtext,
+   UNIQUE KEY `stamp` (`indicator`,`symbol`)
+);
+
 create table `ticker` (
   `date` datetime,
   `symbol` varchar(20),
@@ -1,5 +1,8 @@
 """Base classes for exchange data and order endpoints"""
 
+import asyncio
+import threading
+
 
 class ExchangeData:
     def ticker(self, symbol):
@@ -15,6 +18,65 @@ class ExchangeData:
         raise NotImplementedError('Must implement symbols method.')
 
 
+class AsyncExchangeData:
+    """
+    Asyncio counterpart of ExchangeData. Implementations should share one
+    pooled keep-alive HTTP session per instance, and an instance should only
+    be used from a single event loop.
+    """
+    async def ticker(self, symbol):
+        """Return the current market price for a given symbol."""
+        raise NotImplementedError('Must implement ticker method.')
+
+    async def candle(self, symbol, limit=None, startTime=None, endTime=None):
+        """Return candles for a given symbol."""
+        raise NotImplementedError('Must implement candle method.')
+
+    async def symbols(self):
+        """Return a list of all symbols traded on the exchange."""
+        raise NotImplementedError('Must implement symbols method.')
+
+    async def close(self):
+        """Close the HTTP session."""
+        pass
+
+
+class SyncExchangeData(ExchangeData):
+    """
+    Expose an AsyncExchangeData through the synchronous ExchangeData
+    interface. Coroutines run on a dedicated event loop in a background
+    thread, so calls are thread-safe and many can be in flight at once
+    through submit.
+    """
+    def __init__(self, datasource):
+        self.datasource = datasource
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, daemon=True
+            )
+        self._thread.start()
+
+    def submit(self, coroutine):
+        """Schedule a coroutine on the loop, return a concurrent Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def ticker(self, symbol):
+        return self.submit(self.datasource.ticker(symbol)).result()
+
+    def candle(self, symbol, limit=None, startTime=None, endTime=None):
+        return self.submit(self.datasource.candle(
+            symbol, limit=limit, startTime=startTime, endTime=endTime
+            )).result()
+
+    def symbols(self):
+        return self.submit(self.datasource.symbols()).result()
+
+    def close(self):
+        """Close the datasource's session and stop the event loop."""
+        self.submit(self.datasource.close()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
 class ExchangeOrders:
     def buy_order(self, symbol, quantity, test=True):
         """Place a buy order on a given exchange."""
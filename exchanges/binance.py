@@ -1,26 +1,170 @@
 """Module for interaction with the binance API."""
 
 # Base classes
-from exchanges.base import ExchangeData, ExchangeOrders
+from exchanges.base import ExchangeData, AsyncExchangeData, ExchangeOrders
 
 # Binance API
 from binance.client import Client
 from binance.enums import *
+from binance.exceptions import BinanceAPIException
 
 from time import time, sleep
+import threading
+import aiohttp
 import pandas as pd
 from datetime import datetime, timedelta
 
 # Custom
 from config import config
 import utils.toolbox as tb
+from exchanges.ratelimit import binance_limiter, binance_weight
+from config.data_collection import candle_fetch_config
+
+
+class RateLimitedClient(Client):
+    """
+    Binance Client whose requests all pass through the process-wide
+    binance_limiter. Each request waits for its endpoint weight, the limiter
+    is corrected with the used-weight response header, and requests rejected
+    with HTTP 429/418 are retried after the Retry-After period.
+
+    The client is shared by every thread, so the response Client keeps in
+    self.response is kept per thread.
+    """
+
+    _local = threading.local()
+
+    @property
+    def response(self):
+        return getattr(self._local, 'response', None)
+
+    @response.setter
+    def response(self, response):
+        self._local.response = response
+
+    def _request(self, method, uri, *args, **kwargs):
+        weight = binance_weight(uri, kwargs.get('data') or kwargs.get('params'))
+
+        for attempt in range(binance_limiter.max_retries + 1):
+            binance_limiter.acquire(weight)
+            try:
+                return super()._request(method, uri, *args, **kwargs)
+
+            except BinanceAPIException as err:
+                if err.status_code not in (418, 429) or \
+                   attempt == binance_limiter.max_retries:
+                    raise err
+                binance_limiter.backoff(
+                    err.response.headers.get('Retry-After')
+                    )
+
+    def _handle_response(self, *args):
+        """
+        Correct the limiter with the response's used weight before Client
+        handles it. Newer python-binance versions pass the response, older
+        ones read it from self.response.
+        """
+        response = args[0] if args else self.response
+        headers = response.headers
+        used = headers.get('X-MBX-USED-WEIGHT-1M', headers.get('X-MBX-USED-WEIGHT'))
+        if used is not None:
+            binance_limiter.update_used_weight(used)
+        return super()._handle_response(*args)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(config = config.binance):
+    """
+    Return the process-wide RateLimitedClient for a set of API credentials,
+    creating it on first use.
+    """
+    with _clients_lock:
+        key = config['api_key']
+        if key not in _clients:
+            _clients[key] = RateLimitedClient(
+                config['api_key'], config['api_secret']
+                )
+        return _clients[key]
+
+
+def _candle_params(limit = None, startTime = None, endTime = None):
+    """
+    Build the limit, startTime and endTime parameters of a klines request so
+    that only complete hourly candles are returned. Times are returned as
+    millisecond timestamps.
+    """
+    round_down = lambda date: date.replace(minute=0, second=0, microsecond=0)
+    now_rounded_down = round_down(datetime.utcnow())
+
+    if startTime:
+
+        # If requested date would return an incomplete candle, round down
+        st_rounded_down = round_down(tb.DateConvert(startTime).datetime)
+
+        if st_rounded_down == now_rounded_down:
+            startTime = now_rounded_down - timedelta(hours=1)
+
+        startTime = tb.DateConvert(startTime).timestamp*1000
+
+    elif not limit:
+        limit = 1
+
+    if not endTime:
+        endTime = now_rounded_down - timedelta(hours=1)
+    endTime = tb.DateConvert(endTime).timestamp*1000
+
+    return {'limit':limit, 'startTime':startTime, 'endTime':endTime}
+
+
+def _format_candles(candle, symbol):
+    """Convert a raw klines response to the candle DataFrame layout."""
+    cols = [
+        'open_date', 'open', 'high', 'low', 'close', 'volume',
+        'close_date', 'quote_asset_volume', 'number_of_trades',
+        'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume',
+        'ignore'
+    ]
+
+    df = pd.DataFrame(candle, columns = cols)
+    df = df.drop('ignore', axis=1)
+    df['symbol'] = symbol
+
+    reorder = [
+        'symbol', 'open_date', 'open', 'high', 'low', 'close', 'volume',
+        'close_date', 'quote_asset_volume', 'number_of_trades',
+        'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume',
+    ]
+
+    # Convert timestamp to datetime
+    df.open_date = tb.DateArrayConvert(df.open_date).date
+    df.close_date = tb.DateArrayConvert(df.close_date).date
+
+    return df[reorder]
+
+
+def _format_symbols(info):
+    """Convert an exchangeInfo response to the symbols DataFrame layout."""
+    symbols = []
+    for symbol in info['symbols']:
+        symbols.append({
+            'symbol':symbol['symbol'],
+            'from_symbol':symbol['baseAsset'],
+            'to_symbol':symbol['quoteAsset']
+            })
+
+    cols = ['symbol','from_symbol','to_symbol']
+    s =  pd.DataFrame.from_dict(symbols)[cols]
+    s.index = s.symbol
+    return s
 
 
 class BinanceData(ExchangeData):
     '''Handle data calls to binance.'''
 
     def __init__(self, config = config.binance):
-        self.client = Client(config['api_key'], config['api_secret'])
+        self.client = get_client(config)
 
     def ticker(self, symbol):
         """Get a single ticker price for a given symbol.
@@ -74,57 +218,13 @@ class BinanceData(ExchangeData):
             'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume',
 
         """
-        round_down = lambda date: date.replace(minute=0, second=0, microsecond=0)
-        now_rounded_down = round_down(datetime.utcnow())
-        
-        if startTime:
-
-            # If requested date would return an incomplete candle, round down
-            st_rounded_down = round_down(tb.DateConvert(startTime).datetime)
-
-            if st_rounded_down == now_rounded_down:
-                startTime = now_rounded_down - timedelta(hours=1)
-
-            startTime = tb.DateConvert(startTime).timestamp*1000
-
-        elif not limit:
-            limit = 1
-
-        if not endTime:
-            endTime = now_rounded_down - timedelta(hours=1)
-        endTime = tb.DateConvert(endTime).timestamp*1000
-
+        params = _candle_params(limit, startTime, endTime)
         candle = self.client.get_klines(
                     symbol = symbol,
                     interval = self.client.KLINE_INTERVAL_1HOUR,
-                    limit = limit,
-                    startTime = startTime,
-                    endTime = endTime
+                    **params
                     )
-
-        cols = [
-            'open_date', 'open', 'high', 'low', 'close', 'volume',
-            'close_date', 'quote_asset_volume', 'number_of_trades',
-            'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume',
-            'ignore'
-        ]
-
-        df = pd.DataFrame(candle, columns = cols)
-        df = df.drop('ignore', axis=1)
-        df['symbol'] = symbol
-
-        reorder = [
-            'symbol', 'open_date', 'open', 'high', 'low', 'close', 'volume',
-            'close_date', 'quote_asset_volume', 'number_of_trades',
-            'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume',
-        ]
-
-        # Convert timestamp to datetime
-        f = lambda x: tb.DateConvert(x).date
-        df.open_date = df.open_date.map(f)
-        df.close_date = df.close_date.map(f)
-
-        return df[reorder]
+        return _format_candles(candle, symbol)
 
     def symbols(self):
         """
@@ -136,27 +236,84 @@ class BinanceData(ExchangeData):
             Columns:
             | 'symbol' | 'from_symbol' | 'to_symbol' |
         """
+        return _format_symbols(self.client.get_exchange_info())
+
+
+class AsyncBinanceData(AsyncExchangeData):
+    """
+    Handle data calls to binance with asyncio. Requests share one pooled
+    keep-alive aiohttp session and pass through the process-wide
+    binance_limiter, so hundreds of candle requests can be in flight from a
+    single thread.
+    """
+
+    API_URL = 'https://api.binance.com/api'
+
+    def __init__(self, connection_limit = candle_fetch_config['async_concurrency']):
+        self.connection_limit = connection_limit
+        self._session = None
+
+    def _get_session(self):
+        # Sessions are bound to the running loop, so create on first use
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector = aiohttp.TCPConnector(limit = self.connection_limit),
+                timeout = aiohttp.ClientTimeout(total = 30)
+                )
+        return self._session
+
+    async def _get(self, path, params = None):
+        """GET an endpoint, respecting request weights and Retry-After."""
+        url = f'{self.API_URL}/{path}'
+        params = {k:v for k,v in (params or {}).items() if v is not None}
+        weight = binance_weight(url, params)
+        session = self._get_session()
+
+        for attempt in range(binance_limiter.max_retries + 1):
+            await binance_limiter.acquire_async(weight)
+            async with session.get(url, params = params) as response:
+                headers = response.headers
+                used = headers.get('X-MBX-USED-WEIGHT-1M',
+                                   headers.get('X-MBX-USED-WEIGHT'))
+                if used is not None:
+                    binance_limiter.update_used_weight(used)
+
+                if response.status in (418, 429) and \
+                   attempt < binance_limiter.max_retries:
+                    binance_limiter.backoff(headers.get('Retry-After'))
+                    continue
+
+                response.raise_for_status()
+                return await response.json()
+
+    async def ticker(self, symbol):
+        """Get a single ticker price for a given symbol."""
+        return await self._get('v3/ticker/price', {'symbol':symbol})
+
+    async def candle(self, symbol, limit = None, startTime = None, endTime = None):
+        """
+        Get hourly candles for a single symbol. Same parameters and return
+        value as BinanceData.candle.
+        """
+        params = _candle_params(limit, startTime, endTime)
+        params.update({'symbol':symbol, 'interval':'1h'})
+        candle = await self._get('v1/klines', params)
+        return _format_candles(candle, symbol)
 
-        info = self.client.get_exchange_info()['symbols']
-
-        symbols = []
-        for symbol in info:
-            symbols.append({
-                'symbol':symbol['symbol'],
-                'from_symbol':symbol['baseAsset'],
-                'to_symbol':symbol['quoteAsset']
-                })
+    async def symbols(self):
+        """Get all valid symbols from the binance API."""
+        return _format_symbols(await self._get('v1/exchangeInfo'))
 
-        cols = ['symbol','from_symbol','to_symbol']
-        s =  pd.DataFrame.from_dict(symbols)[cols]
-        s.index = s.symbol
-        return s
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
 
 class BinanceOrders(ExchangeOrders):
     '''Handle order calls to binance.'''
     def __init__(self, config = config.binance):
-        self.client = Client(config['api_key'], config['api_secret'])
+        self.client = get_client(config)
 
     def buy_order(self, symbol, quantity, test = True):
         """
@@ -255,7 +412,7 @@ def check_binance_server_time_diff(verbose=True, ret=False):
     time. If clocks are out of sync, Binance won't allow trades.
     '''
 
-    client = Client(config.binance['api_key'], config.binance['api_secret'])
+    client = get_client(config.binance)
 
     diffs = []
     for i in range(1, 3):
@@ -1,10 +1,122 @@
 """API wrapper for cryptocompare. Incomplete."""
 
+import aiohttp
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from exchanges.base import ExchangeData
-from utils.toolbox import decode_api_response, DateConvert
+from exchanges.base import ExchangeData, AsyncExchangeData
+from config.data_collection import candle_fetch_config
+from utils.toolbox import decode_api_response, DateConvert, DateArrayConvert
+
+
+SYMBOLS_URL = 'https://min-api.cryptocompare.com/data/all/exchanges'
+HISTOHOUR_URL = 'https://min-api.cryptocompare.com/data/histohour?'
+PRICE_URL = 'https://min-api.cryptocompare.com/data/price?'
+
+
+def _format_symbols(exchange_info, exchange):
+    """Convert an all/exchanges response to the symbols DataFrame layout."""
+    exchange_info = exchange_info[exchange]
+
+    symbols = []
+    for symbol in exchange_info:
+        for to_coin in exchange_info[symbol]:
+            symbols.append({
+                'symbol':symbol+to_coin,
+                'from_symbol':symbol,
+                'to_symbol':to_coin
+            })
+
+    cols = ['symbol','from_symbol','to_symbol']
+    symbols = pd.DataFrame.from_dict(symbols)[cols]
+    symbols.index = symbols.symbol
+    return symbols
+
+
+def _split_symbol(symbols, symbol, exchange):
+    """Parse symbol into from_symbol and to_symbol for API calls."""
+    try:
+        return symbols.loc[symbol].from_symbol, symbols.loc[symbol].to_symbol
+    except KeyError as e:
+        print(f'''
+        {symbol} is not a valid symbol for {exchange} within the
+        Cryptocompare system.
+        Options:
+            {sorted(list(symbols.symbol))}
+
+        ''')
+        raise e
+
+
+def _build_url(base, params):
+    """Append the non-empty params to a base URL."""
+    url = base
+    count = 0
+    for param, value in params.items():
+        if value:
+            sym = '&' if count > 0 else ''
+            url += f'{sym}{param}={value}'
+            count+=1
+    return url
+
+
+def _candle_url(from_symbol, to_symbol, exchange, limit = 1,
+                startTime = None, endTime = None):
+    """
+    Build the histohour URL for a candle request.
+
+    Returns:
+    -----------
+    (url, limit): the URL and the number of candles requested
+    """
+
+    # Parse startTime and endTime
+    if startTime:
+
+        if endTime:
+            endTime = DateConvert(endTime).datetime
+        else:
+            endTime = datetime.utcnow()
+
+        if endTime.minute:
+            endTime -= timedelta(hours=1)
+            endTime = endTime.replace(minute=0, second=0, microsecond=0)
+
+        startTime = DateConvert(startTime).datetime
+        date_range = pd.date_range(startTime, endTime, freq='1H')
+        limit = len(date_range)
+
+    elif not endTime:
+        endTime = datetime.utcnow()
+
+    endTime = DateConvert(endTime).timestamp
+
+    # URL parameters
+    params = {'fsym':from_symbol, 'tsym':to_symbol, 'e':exchange,
+              'toTs':endTime,     'limit':limit}
+
+    return _build_url(HISTOHOUR_URL, params), limit
+
+
+def _format_candles(data, symbol, limit):
+    """Convert a histohour response to candles."""
+    data = pd.DataFrame(data['Data'])
+
+    # Convert from timestamp to datetime, set as index
+    data['open_date'] = DateArrayConvert(data.time).date
+    data['symbol'] = symbol
+    data = data.drop('time', axis=1)
+
+    # TODO Figure out volume config
+    reorder = [
+        'symbol', 'open_date', 'open', 'high', 'low', 'close', 'volume',
+        'close_date', 'quote_asset_volume', 'number_of_trades',
+        'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume',
+    ]
+    if limit == 1:
+        return data.iloc[-1].T
+    else:
+        return data
 
 
 class CryptocompareData(ExchangeData):
@@ -22,22 +134,8 @@ class CryptocompareData(ExchangeData):
         intilization so <symbol> can be used rather than <from_symbol> and
         <to_symbol> in calls to candle and ticker.
         """
-        url = 'https://min-api.cryptocompare.com/data/all/exchanges'
-        exchange_info = decode_api_response(url)[1][self.exchange]
-
-        symbols = []
-        for symbol in exchange_info:
-            for to_coin in exchange_info[symbol]:
-                symbols.append({
-                    'symbol':symbol+to_coin,
-                    'from_symbol':symbol,
-                    'to_symbol':to_coin
-                })
-
-        cols = ['symbol','from_symbol','to_symbol']
-        symbols = pd.DataFrame.from_dict(symbols)[cols]
-        symbols.index = symbols.symbol
-        return symbols
+        exchange_info = decode_api_response(SYMBOLS_URL)[1]
+        return _format_symbols(exchange_info, self.exchange)
 
 
     def ticker(self):
@@ -75,74 +173,14 @@ class CryptocompareData(ExchangeData):
 
         """
 
-        # Parse symbol into from_symbol and to_symbol for API call
-        try:
-            from_symbol = self._symbols.loc[symbol].from_symbol
-            to_symbol = self._symbols.loc[symbol].to_symbol
-        except KeyError as e:
-            print(f'''
-            {symbol} is not a valid symbol for {self.exchange} within the
-            Cryptocompare system.
-            Options:
-                {sorted(list(self._symbols.symbol))}
-
-            ''')
-            raise e
-
-        # Parse startTime and endTime
-        if startTime:
-
-            if endTime:
-                endTime = DateConvert(endTime).datetime
-            else:
-                endTime = datetime.utcnow()
-
-            if endTime.minute:
-                endTime -= timedelta(hours=1)
-                endTime = endTime.replace(minute=0, second=0, microsecond=0)
-
-            startTime = DateConvert(startTime).datetime
-            date_range = pd.date_range(startTime, endTime, freq='1H')
-            limit = len(date_range)
-
-        elif not endTime:
-            endTime = datetime.utcnow()
-
-        endTime = DateConvert(endTime).timestamp
-
-        # URL parameters
-        params = {'fsym':from_symbol, 'tsym':to_symbol, 'e':self.exchange,
-                  'toTs':endTime,     'limit':limit}
-
-        # Build URL
-        url = 'https://min-api.cryptocompare.com/data/histohour?'
-        count = 0
-        for param, value in params.items():
-            if value:
-                sym = '&' if count > 0 else ''
-                url += f'{sym}{param}={value}'
-                count+=1
+        from_symbol, to_symbol = _split_symbol(self._symbols, symbol,
+                                               self.exchange)
+        url, limit = _candle_url(from_symbol, to_symbol, self.exchange,
+                                 limit, startTime, endTime)
 
         # Get Response from GET call
         data = decode_api_response(url)[1]
-        data = pd.DataFrame(data['Data'])
-
-        # Convert from timestamp to datetime, set as index
-        data['open_date'] = data.time.map(lambda x: DateConvert(x).date)
-        data['symbol'] = symbol
-        data = data.drop('time', axis=1)
-
-        # TODO Figure out volume config
-        reorder = [
-            'symbol', 'open_date', 'open', 'high', 'low', 'close', 'volume',
-            'close_date', 'quote_asset_volume', 'number_of_trades',
-            'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume',
-        ]
-        print(limit)
-        if limit == 1:
-            return data.iloc[-1].T
-        else:
-            return data
+        return _format_candles(data, symbol, limit)
 
 
     def symbols(self):
@@ -156,3 +194,63 @@ class CryptocompareData(ExchangeData):
             | 'symbol' | 'from_symbol' | 'to_symbol' |
         """
         return self._symbols
+
+
+class AsyncCryptocompareData(AsyncExchangeData):
+    """
+    Get data from Cryptocompare for a given exchange with asyncio. Requests
+    share one pooled keep-alive aiohttp session. Symbols are gathered on the
+    first call rather than on initialization.
+    """
+    def __init__(self, exchange,
+                 connection_limit = candle_fetch_config['async_concurrency']):
+        self.exchange = exchange
+        self.connection_limit = connection_limit
+        self._symbols = None
+        self._session = None
+
+    def _get_session(self):
+        # Sessions are bound to the running loop, so create on first use
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector = aiohttp.TCPConnector(limit = self.connection_limit),
+                timeout = aiohttp.ClientTimeout(total = 30)
+                )
+        return self._session
+
+    async def _get(self, url):
+        async with self._get_session().get(url) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def symbols(self):
+        """Return a pandas.DataFrame with all symbols for an exchange."""
+        if self._symbols is None:
+            exchange_info = await self._get(SYMBOLS_URL)
+            self._symbols = _format_symbols(exchange_info, self.exchange)
+        return self._symbols
+
+    async def ticker(self, symbol):
+        """Get a single ticker price for a given symbol."""
+        from_symbol, to_symbol = _split_symbol(await self.symbols(), symbol,
+                                               self.exchange)
+        url = _build_url(PRICE_URL, {'fsym':from_symbol, 'tsyms':to_symbol,
+                                     'e':self.exchange})
+        price = await self._get(url)
+        return {'symbol':symbol, 'price':price[to_symbol]}
+
+    async def candle(self, symbol, limit = 1, startTime = None, endTime = None):
+        """
+        Get hourly candles for a single symbol from an exchange. Same
+        parameters and return value as CryptocompareData.candle.
+        """
+        from_symbol, to_symbol = _split_symbol(await self.symbols(), symbol,
+                                               self.exchange)
+        url, limit = _candle_url(from_symbol, to_symbol, self.exchange,
+                                 limit, startTime, endTime)
+        return _format_candles(await self._get(url), symbol, limit)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
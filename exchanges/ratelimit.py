@@ -0,0 +1,136 @@
+"""Process-wide, weight-aware rate limiting for exchange API requests."""
+
+import asyncio
+import threading
+from time import monotonic, sleep
+from config.data_collection import binance_rate_limit_config
+
+
+# Request weight of Binance REST endpoints, keyed by the end of the URI path.
+# Endpoints not listed have a weight of 1.
+BINANCE_WEIGHTS = {
+    'klines': 1,
+    'exchangeInfo': 1,
+    'time': 1,
+    'ping': 1,
+    'ticker/price': 1,
+    'ticker/24hr': 1,
+    'depth': 1,
+    'order': 1,
+    'order/test': 1,
+    'account': 5,
+    'allOrders': 5,
+    'myTrades': 5,
+    'openOrders': 1
+    }
+
+# Weight of endpoints when called without a symbol
+BINANCE_ALL_SYMBOL_WEIGHTS = {
+    'ticker/price': 2,
+    'ticker/24hr': 40,
+    'openOrders': 40
+    }
+
+
+def binance_weight(uri, params=None):
+    """
+    Return the request weight of a Binance API call.
+
+    Parameters:
+    ------------
+    uri: string
+        The request URI, like 'https://api.binance.com/api/v1/klines'
+
+    params: dict
+        Request parameters.
+    """
+    params = params or {}
+    path = uri.split('?')[0].rstrip('/')
+    for endpoint in sorted(BINANCE_WEIGHTS, key=len, reverse=True):
+        if path.endswith('/' + endpoint):
+            if 'symbol' not in params and endpoint in BINANCE_ALL_SYMBOL_WEIGHTS:
+                return BINANCE_ALL_SYMBOL_WEIGHTS[endpoint]
+            return BINANCE_WEIGHTS[endpoint]
+    return 1
+
+
+class WeightLimiter:
+    """
+    Thread-safe token bucket of request weight.
+
+    The bucket refills continuously at weight_per_minute*safety_margin per
+    minute. Callers block in acquire until enough weight is available. The
+    bucket is corrected with the used weight reported by the exchange, and
+    drained entirely for the Retry-After period when the exchange rejects a
+    request for exceeding its limits.
+    """
+
+    def __init__(self, config=binance_rate_limit_config):
+        self.capacity = config['weight_per_minute']*config['safety_margin']
+        self.rate = self.capacity/60
+        self.max_retries = config['max_retries']
+        self.default_backoff = config['default_backoff']
+
+        self.tokens = self.capacity
+        self.updated = monotonic()
+        self.blocked_until = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated)*self.rate
+            )
+        self.updated = now
+
+    def _reserve(self, weight):
+        """Take weight if available, else return the seconds to wait."""
+        with self._lock:
+            now = monotonic()
+            self._refill(now)
+
+            if now < self.blocked_until:
+                return self.blocked_until - now
+
+            # Let requests heavier than the bucket through once it's full
+            weight = min(weight, self.capacity)
+            if self.tokens >= weight:
+                self.tokens -= weight
+                return 0
+            return (weight - self.tokens)/self.rate
+
+    def acquire(self, weight=1):
+        """Block until weight is available, then consume it."""
+        wait = self._reserve(weight)
+        while wait:
+            sleep(wait)
+            wait = self._reserve(weight)
+
+    async def acquire_async(self, weight=1):
+        """Wait in the event loop until weight is available, then consume it."""
+        wait = self._reserve(weight)
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self._reserve(weight)
+
+    def update_used_weight(self, used_weight):
+        """
+        Correct the bucket with the weight the exchange reports as used in
+        the current minute, e.g. from the X-MBX-USED-WEIGHT header.
+        """
+        with self._lock:
+            self._refill(monotonic())
+            self.tokens = min(self.tokens, self.capacity - float(used_weight))
+
+    def backoff(self, retry_after=None):
+        """Stop all requests for retry_after seconds."""
+        if retry_after is None:
+            retry_after = self.default_backoff
+        with self._lock:
+            now = monotonic()
+            self.blocked_until = max(self.blocked_until, now + float(retry_after))
+            self.tokens = 0
+            self.updated = now
+
+
+# Shared by every Binance client in the process
+binance_limiter = WeightLimiter()
@@ -1,19 +1,155 @@
 """Core data ingestion functionality."""
 
+import os
+import numpy as np
 import pandas as pd
+from time import perf_counter
+from collections import deque
+from contextlib import contextmanager
+from threading import BoundedSemaphore
+from concurrent.futures import (
+    ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+)
 from datetime import datetime, timedelta
-from errors.exceptions import DiscontinuousError
 
 from utils import toolbox as tb
-from exchanges.binance import BinanceData
-from utils.database import Database, Candles, get_symbols, get_max_from_column
-from ingestion.custom_indicators import CustomIndicator
+from exchanges.base import AsyncExchangeData, SyncExchangeData
+from exchanges.binance import BinanceData, AsyncBinanceData
+from utils.database import (
+    Database, Candles, Coverage, IndicatorState, get_symbols,
+    get_max_from_column
+)
+from ingestion.custom_indicators import get_indicators
+from ingestion.intermediates import compute_intermediates
+from ingestion.coverage import (
+    HOUR, current_hour, missing_ranges, fetch_ranges, page_requests,
+    candle_ranges, in_ranges
+)
+from ingestion.rollups import update_rollups
+from ingestion.pipeline import (
+    Pipeline, NormalizeCandles, DedupeCandles, CandleRanges, InsertFrames
+)
+from ingestion.events import bus, CandlesInserted
+from config.data_collection import (
+    candle_fetch_config, engineered_data_config
+)
+
+# Shared by every concurrent fetch in the process
+request_budget = BoundedSemaphore(candle_fetch_config['max_concurrent_requests'])
+
+
+@contextmanager
+def candle_datasource(datasource=None):
+    """
+    Yield <datasource>, or if None the datasource selected by
+    candle_fetch_config['datasource'], which is closed on exit.
+    """
+    if datasource:
+        yield datasource
+        return
+
+    if candle_fetch_config['datasource'] == 'async':
+        datasource = SyncExchangeData(AsyncBinanceData())
+    elif candle_fetch_config['datasource'] == 'sync':
+        datasource = BinanceData()
+    else:
+        raise ValueError(
+            "candle_fetch_config['datasource'] must be 'async' or 'sync'."
+        )
+
+    try:
+        yield datasource
+    finally:
+        if isinstance(datasource, SyncExchangeData):
+            datasource.close()
+
+
+def fetch_candles(datasource, requests, workers=1):
+    """
+    Fetch candles for a sequence of requests, yielding results in request
+    order. With workers > 1, requests are fetched by a bounded thread pool
+    that runs at most 2*workers requests ahead of the consumer. Every request
+    waits on the process-wide request_budget.
+
+    Asyncio datasources (AsyncExchangeData, or a SyncExchangeData wrapping
+    one) are fetched on their event loop instead, with up to
+    candle_fetch_config['async_concurrency'] requests in flight and no
+    threads; workers and request_budget don't apply.
+
+    Parameters:
+    -------------
+    datasource: initialized exchanges.base.ExchangeData or
+                exchanges.base.AsyncExchangeData object
+
+    requests: iterable of dicts
+        Keyword arguments for datasource.candle, like
+        {'symbol':<symbol>, 'startTime':<start>, 'endTime':<end>}
+
+    workers: int
+        Number of threads to fetch with.
+
+    Yields:
+    -------------
+    (request, candles): tuple of the request dict and a pandas.DataFrame
+    """
+
+    if isinstance(datasource, (AsyncExchangeData, SyncExchangeData)):
+        yield from _fetch_candles_async(datasource, requests)
+        return
+
+    def fetch(request):
+        with request_budget:
+            return datasource.candle(**request)
+
+    if workers <= 1:
+        for request in requests:
+            yield request, fetch(request)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for request in requests:
+            pending.append((request, executor.submit(fetch, request)))
+            if len(pending) >= 2*workers:
+                request, future = pending.popleft()
+                yield request, future.result()
+
+        while pending:
+            request, future = pending.popleft()
+            yield request, future.result()
+
+
+def _fetch_candles_async(datasource, requests,
+                         concurrency=candle_fetch_config['async_concurrency']):
+    """Ordered, windowed fetch of candles on an asyncio datasource's loop."""
+    if isinstance(datasource, SyncExchangeData):
+        adapter, owned = datasource, False
+    else:
+        adapter, owned = SyncExchangeData(datasource), True
+
+    try:
+        pending = deque()
+        for request in requests:
+            future = adapter.submit(adapter.datasource.candle(**request))
+            pending.append((request, future))
+            if len(pending) >= concurrency:
+                request, future = pending.popleft()
+                yield request, future.result()
+
+        while pending:
+            request, future = pending.popleft()
+            yield request, future.result()
+
+    finally:
+        if owned:
+            adapter.close()
+
 
 # TODO break into live and historical components
-# TODO Chunk number doesnt update in progress bar
 def insert_hourly_candles(symbols, startTime=None,    endTime=None,
                                    db='autonotrader', debug=False,
-                                   verbose=False,     datasource=None):
+                                   verbose=False,     datasource=None,
+                                   workers=None,      source='binance'):
     """
     Get candles from the binance API, insert into the database.
         - If no startTime or endTime is provided, inserts the most recent
@@ -47,13 +183,30 @@ def insert_hourly_candles(symbols, startTime=None,    endTime=None,
         database inserts.
 
     datasource: initialized exchanges.base.ExchangeData object
+        Defaults to the one selected by
+        config.data_collection.candle_fetch_config['datasource'].
+
+    workers: int
+        Number of symbol/date-range chunks to fetch concurrently. Defaults to
+        config.data_collection.candle_fetch_config['workers'].
 
+    source: string
+        Name of the datasource in the candle_coverage ledger.
 
+    Pages are fetched, normalized, deduplicated and bulk inserted by an
+    ingestion.pipeline.Pipeline, so database inserts overlap with fetching.
+    Fetched ranges are recorded in the candle_coverage ledger.
+
+    Returns the fetched [start, end) ranges of each symbol, with columns
+    'symbol', 'start', 'end', or the candles with debug.
     """
 
     if isinstance(symbols, str):
         symbols = [symbols]
 
+    if workers is None:
+        workers = candle_fetch_config['workers']
+
     # From startTime to most recent candle
     if startTime and not endTime:
         startTime = tb.DateConvert(startTime).datetime
@@ -68,10 +221,6 @@ def insert_hourly_candles(symbols, startTime=None,    endTime=None,
     elif endTime and not startTime:
         endTime = tb.DateConvert(endTime).datetime
 
-    # TODO generalize
-    if not datasource:
-        datasource = BinanceData()
-
     if startTime and endTime:
         daterange = pd.date_range(startTime, endTime, freq='1H')
 
@@ -79,73 +228,219 @@ def insert_hourly_candles(symbols, startTime=None,    endTime=None,
         total_chunks = len(daterange)//500
         if len(daterange) % 500:
             total_chunks+=1
-        total_iterations = total_chunks*len(symbols)
-
-        iteration = 0
-        chunk_num = 1
-        to_insert = pd.DataFrame()
 
         # API limited to 500 candles, so split date range into chunks if needed
-        for subrange in tb.chunker(daterange, 500):
-            sub_startTime = min(subrange)
-            sub_endTime = max(subrange)
+        def chunked_requests():
+            for subrange in tb.chunker(daterange, 500):
+                sub_startTime = min(subrange)
+                sub_endTime = max(subrange)
 
-            if total_chunks > 1:
-                sub_endTime+=timedelta(hours=1)
+                if total_chunks > 1:
+                    sub_endTime+=timedelta(hours=1)
 
-            for symbol in symbols:
+                for symbol in symbols:
+                    yield dict(symbol=symbol,
+                               startTime=sub_startTime,
+                               endTime=sub_endTime)
+        requests = chunked_requests()
 
-                # if datasource:
-                candles = datasource.candle(
-                    symbol, startTime=sub_startTime, endTime=sub_endTime
-                    )
-                to_insert = pd.concat([to_insert, candles])
+    else:
+        total_chunks = 1
+        requests = [dict(symbol=symbol, startTime=startTime, endTime=endTime)
+                    for symbol in symbols]
+
+    with candle_datasource(datasource) as datasource:
+        return _ingest_candles(
+            requests, total_chunks*len(symbols), db=db, debug=debug,
+            verbose=verbose, datasource=datasource, workers=workers,
+            coverage=Coverage(source=source, db=db)
+            )
 
-                iteration+=1
-                if verbose:
-                    tb.progress_bar(
-                        iteration, total_iterations,
-                        f'Getting {symbol}: chunk {chunk_num} of {total_iterations}'
-                    )
 
-            chunk_num+=1
+def insert_missing_candles(symbols=None, startTime=None,  endTime=None,
+                           db='autonotrader', debug=False, verbose=False,
+                           datasource=None,   workers=None, source='binance'):
+    """
+    Fetch only the candles missing from the candle_coverage ledger, per
+    symbol, in pages of the maximum size the exchange allows, and record the
+    fetched ranges in the ledger.
 
-            # To avoid losing data, insert in chunks if df becomes large
-            if len(to_insert) >= 4000 and not debug:
-                if verbose:
-                    tb.progress_bar(
-                        iteration, total_iterations,
-                        'Inserting into db....................'
-                    )
-                Database(db=db).insert(
-                    'candles', to_insert, auto_format=True, verbose=False
-                    )
-                to_insert = pd.DataFrame()
+    Parameters:
+    -------------
+    symbols: string | list of strings
+        Valid symbols for the given exchange. None uses the user symbols.
 
-        if debug:
-            return to_insert
-        else:
-            Database(db=db).insert(
-                'candles', to_insert, auto_format=True, verbose=False
-                )
+    startTime: python datetime object | date string like '%Y-%m-%d %H:%M:%S'
+        Plan from this date. None plans each symbol from the end of its
+        latest covered range, and symbols without coverage from the most
+        recent candle in the database.
 
-    else:
-        to_insert = pd.DataFrame()
-        for symbol in symbols:
-            candles = datasource.candle(
-                symbol, startTime = startTime, endTime = endTime
+    endTime: python datetime object | date string like '%Y-%m-%d %H:%M:%S'
+        Plan up to this date. Defaults to the most recent complete candle.
+
+    source: string
+        Name of the datasource in the ledger.
+
+    See insert_hourly_candles for the remaining parameters and the return
+    value.
+    """
+
+    if isinstance(symbols, str):
+        symbols = [symbols]
+    if symbols is None:
+        symbols = get_symbols()
+
+    if workers is None:
+        workers = candle_fetch_config['workers']
+
+    coverage = Coverage(source=source, db=db)
+    coverage.seed()
+
+    end = current_hour()
+    if endTime:
+        end = min(end, pd.Timestamp(tb.DateConvert(endTime).datetime) + HOUR)
+
+    start = tb.DateConvert(startTime).datetime if startTime else None
+    default_start = None
+    if start is None:
+        default_start = get_max_from_column(column='open_date', db=db)
+
+    missing = missing_ranges(coverage.get(symbols), symbols, end,
+                             start=start, default_start=default_start)
+    requests = list(page_requests(missing))
+
+    with candle_datasource(datasource) as datasource:
+        return _ingest_candles(
+            requests, len(requests), db=db, debug=debug, verbose=verbose,
+            datasource=datasource, workers=workers, coverage=coverage
             )
-            to_insert = pd.concat([to_insert, candles])
-        if debug:
-            return to_insert
-        else:
-            Database(db=db).insert(
-                'candles', to_insert, auto_format=True, verbose=verbose
+
+
+def _ingest_candles(requests, total_requests, db='autonotrader', debug=False,
+                    verbose=False, datasource=None, workers=1, coverage=None):
+    """
+    Fetch candle requests and insert them through a Pipeline, record the
+    ranges of the candles that came back with the coverage ledger, publish
+    them with the inserted candles as an ingestion.events.CandlesInserted
+    event and return them. Hours missing from short or empty pages stay
+    uncovered, so they're planned again.
+
+    Inserted candles are only kept in memory for the event if something
+    subscribes to CandlesInserted. Otherwise nothing is published, and
+    memory stays bounded by the pipeline's queues.
+    """
+
+    def pages():
+        iteration = 0
+        for request, candles in fetch_candles(datasource, requests, workers):
+            iteration+=1
+            if verbose:
+                tb.progress_bar(
+                    iteration, total_requests,
+                    f"Getting {request['symbol']}: request {iteration} of {total_requests}"
                 )
+            yield request, candles
+
+    # Fetch, normalize, dedupe and insert concurrently
+    covered = CandleRanges()
+    stages = [NormalizeCandles(), DedupeCandles(), covered]
+    publish = not debug and bool(bus.subscribed(CandlesInserted))
+    if not debug:
+        stages.append(InsertFrames('candles', db=db, pass_on=publish))
+
+    frames = Pipeline(pages(), stages).run()
+
+    if debug:
+        return pd.concat(frames) if frames else pd.DataFrame()
+
+    ranges = covered.ranges()
+    if coverage is not None:
+        coverage.record(ranges)
+    if publish and frames:
+        bus.publish(CandlesInserted(ranges, pd.concat(frames), db=db))
+    return ranges
+
+
+def interpolate_nulls(candles, policy=None, by='symbol'):
+    """
+    Fill null candle values within each symbol, a column at a time over the
+    whole frame, so values never leak from one symbol into another. Rows
+    that still have nulls afterwards, like those at the start of a symbol,
+    are dropped.
 
+    Parameters:
+    ---------------
+    candles: pandas.DataFrame
+        Candles of any number of symbols, in any order.
+
+    policy: string | None
+        'ffill' ---> carry the last value forward.
+        'linear' ---> interpolate float columns between the neighbouring
+                      values by position, carrying the last value forward at
+                      the end of a symbol. Other columns are carried forward.
+        'drop' ---> drop rows with nulls, leaving a gap in the symbol.
+        None uses config.data_collection.engineered_data_config
+        ['interpolation_policy'].
+
+    by: string
+        Column identifying the symbol.
+
+    Returns:
+    ---------------
+    candles: pandas.DataFrame
+        Sorted by <by> then open_date, with a boolean 'interpolated' column
+        marking filled rows.
+
+    counts: pandas.DataFrame
+        Interpolated and dropped rows of each symbol.
+        Columns: | interpolated | dropped |
+    """
+    if policy is None:
+        policy = engineered_data_config['interpolation_policy']
+    if policy not in ('ffill', 'linear', 'drop'):
+        raise ValueError(f"Unknown interpolation policy {policy}. "
+                         "Use 'ffill', 'linear' or 'drop'.")
+
+    candles = candles.sort_values([by, 'open_date']).reset_index(drop=True)
+    null = candles.isnull().any(axis=1).values
+    keys = candles[by]
+    columns = [c for c in candles.columns if c != by]
+
+    if policy == 'linear' and null.any():
+        position = pd.Series(np.arange(len(candles)), dtype=float)
+        linear = [c for c in columns if candles[c].dtype.kind == 'f']
+
+        for column in linear:
+            values = candles[column]
+            known = position.where(values.notnull())
+            before = values.groupby(keys).ffill()
+            after = values.groupby(keys).bfill()
+            start = known.groupby(keys).ffill()
+            end = known.groupby(keys).bfill()
+
+            weight = (position - start)/(end - start)
+            filled = (before + (after - before)*weight).fillna(before)
+            candles[column] = values.where(values.notnull(), filled)
+
+        columns = [c for c in columns if c not in linear]
+
+    if policy != 'drop' and null.any() and columns:
+        candles[columns] = candles.groupby(by)[columns].ffill()
+
+    dropped = candles.isnull().any(axis=1).values
+    candles['interpolated'] = null & ~dropped
 
+    counts = pd.DataFrame({'interpolated':candles.interpolated.values,
+                           'dropped':dropped})
+    counts = counts.groupby(keys.values).sum().astype(int)
+    counts.index.name = by
 
-def engineer_data(from_date = None, verbose=False):
+    candles = candles[~dropped].reset_index(drop=True)
+    return candles, counts
+
+
+def engineer_data(from_date = None, verbose=False, panel=True, workers=1,
+                  sql=False, interpolation=None):
     """
     Get candles from database, add custom indicators.
 
@@ -156,31 +451,27 @@ def engineer_data(from_date = None, verbose=False):
 
     verbose: boolean
         True to print a progress bar.
-    """
 
-    def interpolate_nulls(candles):
-        candles['interpolated'] = False
-        null_inds = pd.isnull(candles).any(1).nonzero()[0]
-        if null_inds.size:
-            candles = candles.fillna(method='ffill')
-            candles.interpolated.iloc[null_inds] = True
+    panel: boolean
+        True ---> candles are pivoted once into time x symbol frames and
+                  indicators implementing transform_panel are computed for
+                  every symbol in a single call. Other indicators are
+                  computed a symbol at a time.
 
-            # If nulls still in df, drop and check for continuity
-            if pd.isnull(candles).any().any():
-                candles = candles.dropna()
-                continuous = pd.date_range(start=candles.open_date.min(),
-                                           end=candles.open_date.max(),
-                                           freq = '1H')
+    workers: int | None
+        Processes to partition symbols across. 1 computes in-process, None
+        uses config.data_collection.engineered_data_config['workers'].
 
-                if not (continuous == candles.open_date).all():
-                    raise DiscontinuousError(
-                        '''DataFrame doesn't form a continuous date
-                            sequence after interpolation''' )
+    sql: boolean
+        True ---> leave out indicators that declare get_sql, for
+                  engineer_sql to calculate in the database.
 
-        return candles
+    interpolation: string | None
+        Policy for candles with null values, see interpolate_nulls.
+    """
 
     def indicators():
-        for indicator in CustomIndicator.__subclasses__():
+        for indicator in get_indicators():
             yield indicator
 
     # Get timedelta for data acquisition from DB
@@ -208,227 +499,625 @@ def engineer_data(from_date = None, verbose=False):
 
     # Get raw candles for transformation
     candles = Candles().get_raw(from_date = from_date)
-    candles = interpolate_nulls(candles)
-    candles.index = candles.symbol
+    candles, counts = interpolate_nulls(candles, policy=interpolation)
+
+    if verbose and counts.values.any():
+        print(f"Interpolated {counts.interpolated.sum()} and dropped "
+              f"{counts.dropped.sum()} candles with null values")
 
     symbols = get_symbols()
-    num_symbols = len(symbols)
-    total_iterations = num_symbols*num_indicators
+    candles = candles[candles.symbol.isin(symbols)]
+    candles = candles.sort_values(['symbol', 'open_date']).reset_index(drop=True)
+
+    calculated = list(indicators())
+    if sql:
+        calculated = [i for i in calculated if not i.get_sql()]
+    names = [indicator.__name__ for indicator in calculated]
+
+    if workers is None:
+        workers = engineered_data_config['workers'] or os.cpu_count()
+
+    if workers > 1 and candles.symbol.nunique() > 1:
+        values = _engineer_parallel(candles, calculated, panel, workers,
+                                    verbose=verbose)
+    else:
+        values = _compute_indicators(candles, calculated, panel,
+                                     verbose=verbose)
+
+    results = pd.DataFrame(values, columns=names)
+    ins = pd.concat([candles, results], axis=1)
+    return ins.dropna()
+
 
-    # Calculate indicators
-    ins = pd.DataFrame()
+def engineer_sql(from_date, indicators=None, db='autonotrader'):
+    """
+    Return one INSERT ... SELECT that calculates every indicator declaring
+    get_sql inside MySQL with window functions (MySQL 8+) and upserts its
+    columns into engineered_data for candles from from_date on. Candles
+    within one indicator window before from_date are read for the windows
+    but not written.
+
+    Candles aren't interpolated, so rows with a null in an indicator's
+    window are left out, like the rows engineer_data drops.
+
+    Parameters:
+    ---------------
+    from_date: UTC datetime, datestring, or second timestamp.
+        The first open_date to write.
+
+    indicators: list of CustomIndicator subclasses
+        Defaults to every indicator. Those without get_sql are ignored.
+
+    Returns:
+    ---------------
+    sql: string | None
+        None if no indicator declares get_sql.
+    """
+    if indicators is None:
+        indicators = get_indicators()
+    indicators = [i for i in indicators if i.get_sql()]
+    if not indicators:
+        return None
+
+    td = [i.get_timedelta() for i in indicators]
+    td = max([delta for delta in td if delta] or [timedelta(0)])
+    from_date = tb.DateConvert(from_date).datetime
+
+    fields = Database(db=db).execute('SHOW COLUMNS IN candles;').Field
+    candle_columns = ', '.join(f'`{c}`' for c in fields if c != 'id')
+    names = [f'`{i.__name__}`' for i in indicators]
+    expressions = ',\n           '.join(
+        f'{i.get_sql()} AS `{i.__name__}`' for i in indicators
+        )
+    symbols = ', '.join(f"'{symbol}'" for symbol in get_symbols())
+
+    return f"""
+    INSERT INTO engineered_data ({candle_columns}, `interpolated`, {', '.join(names)})
+    SELECT {candle_columns}, FALSE, {', '.join(names)}
+    FROM (
+        SELECT {candle_columns},
+           {expressions}
+        FROM candles
+        WHERE symbol IN ({symbols})
+        AND open_date >= '{tb.DateConvert(from_date - td).date}'
+    ) AS windowed
+    WHERE open_date >= '{tb.DateConvert(from_date).date}'
+    AND {' AND '.join(f'{name} IS NOT NULL' for name in names)}
+    {Database._on_duplicate(names).strip()};
+    """
+
+
+def _compute_indicators(candles, indicators, panel=True, verbose=False):
+    """
+    Calculate indicators for candles sorted by symbol then open_date.
+
+    Returns:
+    ---------------
+    values: numpy.ndarray of floats
+        One row per candle and one column per indicator, in order.
+    """
+    values = np.full((len(candles), len(indicators)), np.nan)
+    columns = {indicator:i for i, indicator in enumerate(indicators)}
+
+    batch = list(indicators)
+    panel_indicators = []
+    if panel:
+        panel_indicators = [i for i in batch if i.panel_enabled()]
+        batch = [i for i in batch if not i.panel_enabled()]
+
+    symbol_rows = candles.groupby('symbol').indices
+    total_iterations = len(panel_indicators) + len(symbol_rows)*len(batch)
     count = 0
-    for indicator in indicators():
 
-        indicator_data = pd.DataFrame()
-        for symbol in symbols:
+    if panel_indicators:
+        # Pivot every numeric field once into a time x symbol frame
+        fields = [c for c in candles.columns
+                  if c not in ('symbol', 'open_date') and
+                  candles[c].dtype.kind in 'biuf']
+        wide = candles.set_index(['open_date', 'symbol'])[fields]
+        wide = wide.unstack('symbol')
+        panel_data = {field:wide[field] for field in fields}
+
+        rows = wide.index.get_indexer(candles.open_date)
+        cols = wide[fields[0]].columns.get_indexer(candles.symbol)
+
+        # Compute every required intermediate once for the whole panel
+        cache = compute_intermediates(
+            [spec for i in panel_indicators for spec in i.requirements()],
+            panel_data
+            )
+
+        for indicator in panel_indicators:
+            transformed = indicator()._transform_panel(panel_data, cache)
+            values[:, columns[indicator]] = \
+                np.asarray(transformed, dtype=float)[rows, cols]
 
-            indicator_name = indicator.__name__
+            count+=1
+            if verbose:
+                tb.progress_bar(
+                    count, total_iterations,
+                    f'Calculating {indicator.__name__}'
+                )
 
-            sub_candles = candles.loc[symbol]
-            sub_candles.index = sub_candles.open_date
-            sub_candles = sub_candles.sort_index()
+    required = [spec for i in batch for spec in i.requirements()]
+    symbols = sorted(symbol_rows) if batch else []
+    for symbol in symbols:
+        sub_candles = candles.iloc[symbol_rows[symbol]]
+        sub_candles.index = sub_candles.open_date
 
-            transformed = pd.DataFrame(indicator()._transform(sub_candles))
-            transformed['symbol'] = symbol
-            transformed.columns = [indicator_name, 'symbol']
+        # Compute every required intermediate once for the symbol
+        cache = compute_intermediates(required, sub_candles)
 
-            indicator_data = pd.concat([indicator_data, transformed])
+        for indicator in batch:
+            transformed = indicator()._transform(sub_candles, cache)
+            values[symbol_rows[symbol], columns[indicator]] = \
+                np.asarray(transformed, dtype=float).ravel()
 
             count+=1
             if verbose:
                 tb.progress_bar(
                     count, total_iterations,
-                    f'Calculating {indicator_name}'
+                    f'Calculating {indicator.__name__}'
                 )
 
-        # return indicator_data
-        if ins.empty:
-            ins = indicator_data
-        else:
-            ins = ins.merge(indicator_data, on = ['symbol', 'open_date'])
+    return values
 
-    candles = candles.reset_index(drop=True)
-    ins = ins.merge(candles, on = ['symbol', 'open_date'])
-    return ins.dropna()
 
+def partition_symbols(symbols, partitions):
+    """
+    Split symbols into at most <partitions> contiguous groups of sorted
+    symbols. The same symbols and partitions always give the same groups.
+    """
+    symbols = sorted(set(symbols))
+    partitions = max(1, min(partitions, len(symbols)))
+    return [list(group) for group in np.array_split(symbols, partitions)]
 
-def repair_data(symbol = 'all', verbose=True):
-    '''Iterate though candles, find missing dates, replace with Binance data.'''
 
-    if verbose:
-        print('Repairing...')
+def _engineer_partition(task):
+    # Top level so it can be pickled to worker processes
+    candles, indicators, panel = task
+    return _compute_indicators(candles, indicators, panel)
 
-    TIME_RES = '1H' # If changed, must change timedelta parameters as well.
 
-    # Get data for symbol
-    if symbol == 'all':
-        symbols = get_symbols()
-    else:
-        symbols = [symbol]
+def _engineer_parallel(candles, indicators, panel, workers, verbose=False):
+    """
+    Calculate indicators for candles sorted by symbol then open_date across
+    a pool of <workers> processes. Each worker gets a contiguous partition
+    of symbols and returns only its array of indicator values.
+    """
+    partitions = partition_symbols(
+        candles.symbol.unique(),
+        workers*engineered_data_config['partitions_per_worker']
+        )
+
+    # Candles are sorted by symbol, so each partition is a slice of rows
+    symbols = candles.symbol.values
+    tasks = []
+    for partition in partitions:
+        start = np.searchsorted(symbols, partition[0], side='left')
+        stop = np.searchsorted(symbols, partition[-1], side='right')
+        tasks.append((candles.iloc[start:stop], indicators, panel))
+
+    values = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for i, result in enumerate(executor.map(_engineer_partition, tasks)):
+            values.append(result)
+            if verbose:
+                tb.progress_bar(
+                    i+1, len(tasks), 'Calculating indicators in parallel'
+                )
 
-    for symbol in symbols:
-        if verbose:
-            print(symbol)
-            print('------------------')
+    return np.vstack(values)
 
-        sql = f"select * from candles where symbol = '{symbol}'"
-        candles = Database().execute(sql)
-        candles.index = candles.open_date
 
-        # Get min, max date
-        start = candles.open_date.min()
-        end = candles.open_date.max()
+def engineer_incremental(verbose=False, db='autonotrader',
+                         table='engineered_data', candles=None):
+    """
+    Compute engineered data for only the candles that arrived since each
+    symbol's persisted indicator state, in O(new candles).
+
+    A symbol resumes from its state if every indicator has state for it up
+    to the same candle and the new candles continue from that candle. Other
+    symbols are bootstrapped from one indicator window before the most
+    recent engineered row, with each indicator's transform, and their state
+    is taken from streaming only the indicator's last window.
 
-        # Build date range
-        daterange = pd.date_range(start, end, freq=TIME_RES)
+    Parameters:
+    ---------------
+    table: string
+        Table engineered rows are stored in, 'engineered_data' or
+        'indicator_values'.
 
-        # Find holes in data, throw away non-nulls
-        missing = []
-        for date in daterange:
-            if date not in candles.open_date:
-                missing.append(date)
+    candles: pandas.DataFrame | None
+        Newly inserted candles, like those of an
+        ingestion.events.CandlesInserted event. Only their symbols are
+        engineered, and symbols whose candles continue from their state
+        without nulls are used as given instead of read from the database.
 
-        # Find chunks of continuous dates for Binance API call
-        chunks = []
-        chunk = []
-        for i, current_candle in enumerate(missing, start=1):
-            if i < len(missing):
+    Returns:
+    ---------------
+    (ins, states): tuple
+        ins: pandas.DataFrame of engineered rows, like engineer_data.
+        states: list of dicts for utils.database.IndicatorState.save. Save
+            them once ins is stored.
 
-                next_candle = missing[i]
+    None if any indicator doesn't implement the incremental protocol, in
+    which case engineer_data should be used instead.
+    """
 
-                if next_candle == current_candle + timedelta(hours=1):
-                    chunk.append(current_candle)
-                else:
-                    chunk.append(current_candle)
-                    chunks.append(chunk)
-                    chunk = []
+    indicators = get_indicators()
+    if not all(indicator.incremental() for indicator in indicators):
+        return None
 
-                if i == len(missing)-1:
-                    chunk.append(next_candle)
-                    chunks.append(chunk)
+    names = [indicator.__name__ for indicator in indicators]
+    symbols = get_symbols()
+    given = candles
+    if given is not None:
+        symbols = [symbol for symbol in symbols if symbol in set(given.symbol)]
+
+        # Inserted candles carry date strings, read candles datetimes
+        given = given.copy()
+        for column in ('open_date', 'close_date'):
+            if column in given.columns:
+                given[column] = pd.to_datetime(given[column])
+
+    # Symbols with state for every indicator up to the same candle
+    saved = IndicatorState(db=db).get(names)
+    resume = {}
+    for symbol, group in saved.groupby('symbol'):
+        if set(group.indicator) == set(names) and group.open_date.nunique() == 1:
+            resume[symbol] = (group.open_date.iloc[0],
+                              dict(zip(group.indicator, group.state)))
+
+    # Everything else starts one indicator window before the engineered data
+    td = [i.get_timedelta() for i in indicators if i.get_timedelta()]
+    td = max(td) if td else timedelta(0)
+    _, last_engineered, _ = Candles().get_date_summary(table=table)
+    if last_engineered is None:
+        bootstrap_from, _, _ = Candles().get_date_summary(table='candles')
+    else:
+        bootstrap_from = tb.DateConvert(last_engineered).datetime - td
+    bootstrap = [symbol for symbol in symbols if symbol not in resume]
+
+    def read(symbols, from_date):
+        if not symbols or from_date is None:
+            return pd.DataFrame()
+        return Candles().get_columns(symbols=symbols, from_date=from_date,
+                                     table='candles')
+
+    # Given candles that continue a state need no forward filling
+    handed = set()
+    if given is not None:
+        for symbol, group in given.groupby('symbol'):
+            if symbol in resume and not group.isnull().values.any() and \
+               pd.to_datetime(group.open_date).min() == \
+               pd.Timestamp(resume[symbol][0]) + HOUR:
+                handed.add(symbol)
+
+    # Read resumed symbols from their last candle, for forward filling
+    starts = {}
+    for symbol in symbols:
+        if symbol in resume and symbol not in handed:
+            starts.setdefault(resume[symbol][0], []).append(symbol)
 
-        if verbose:
-            if missing:
-                print(f'{len(missing)} missing dates found in {len(chunks)} chunks.')
+    if verbose:
+        print('Fetching data from database...')
+    candles = [read(group, start) for start, group in starts.items()]
+    candles.append(read(bootstrap, bootstrap_from))
+    if handed:
+        candles.append(given[given.symbol.isin(handed)])
+    candles = [c for c in candles if not c.empty]
+    candles = pd.concat(candles) if candles else pd.DataFrame()
+
+    # Fill nulls within each symbol, flagging interpolated rows
+    if not candles.empty:
+        candles, _ = interpolate_nulls(candles)
+
+    def engineer(symbol, symbol_candles, states=None, last=None):
+        symbol_candles = symbol_candles.sort_values('open_date')
+        symbol_candles = symbol_candles.reset_index(drop=True)
+        symbol_candles.open_date = pd.to_datetime(symbol_candles.open_date)
+
+        # The state already includes the last candle
+        if last is not None:
+            symbol_candles = symbol_candles[symbol_candles.open_date > last]
+        if symbol_candles.empty:
+            return None, []
+
+        # Bootstrapped symbols are transformed in batch, and each state
+        # is built by streaming only the indicator's last window
+        cache = None
+        if states is None:
+            required = [spec for i in indicators for spec in i.requirements()]
+            cache = compute_intermediates(required, symbol_candles)
+
+        out = symbol_candles.copy()
+        new_states = []
+        for indicator in indicators:
+            name = indicator.__name__
+            instance = indicator()
+            if states is None:
+                out[name] = np.asarray(
+                    instance._transform(symbol_candles, cache), dtype=float
+                    ).ravel()
+                window = indicator.get_timedelta() or timedelta(0)
+                dates = symbol_candles.open_date
+                instance._stream(
+                    symbol_candles[dates >= dates.iloc[-1] - window]
+                    )
             else:
-                print('No missing dates found!')
+                out[name] = instance._stream(symbol_candles, states[name]).values
+            new_states.append(dict(indicator=name, symbol=symbol,
+                                   open_date=symbol_candles.open_date.iloc[-1],
+                                   state=instance.snapshot()))
+        return out, new_states
+
+    groups = list(candles.groupby('symbol')) if not candles.empty else []
+    ins = []
+    states = []
+    rebootstrap = []
+    for i, (symbol, group) in enumerate(groups):
+        if verbose:
+            tb.progress_bar(i+1, len(groups), f'Calculating {symbol}')
+
+        saved_states, last = None, None
+        if symbol in resume:
+            last, saved_states = resume[symbol]
+            dates = pd.to_datetime(group.open_date)
+
+            # Resume only if the new candles continue from the state
+            start = last + HOUR if symbol in handed else last
+            if dates.min() != start or \
+               not tb.DateContinuity(dates).gaps.empty:
+                rebootstrap.append(symbol)
+                continue
+
+        out, new_states = engineer(symbol, group, saved_states, last)
+        if out is not None:
+            ins.append(out)
+            states += new_states
+
+    # Symbols whose state doesn't connect to the candles are recomputed
+    for symbol in rebootstrap:
+        last = resume[symbol][0]
+        group = read([symbol], tb.DateConvert(last).datetime - td)
+        if not group.empty:
+            out, new_states = engineer(symbol, group)
+            if out is not None:
+                ins.append(out)
+                states += new_states
+
+    ins = pd.concat(ins, ignore_index=True) if ins else pd.DataFrame()
+    return ins.dropna(), states
+
+
+def repair_data(symbol = 'all', verbose=True, workers=None, datasource=None,
+                db='autonotrader', source='binance'):
+    '''
+    Find missing candles and replace them with exchange data.
+
+    Gaps are found per symbol as the set difference between the expected
+    hourly dates and the dates with a close price. Placeholder rows are
+    retried unless the candle_coverage ledger records them as fetched.
+    Nearby gaps are merged into page-sized fetch ranges and fetched
+    concurrently. Dates the exchange returns are upserted in bulk, the rest
+    are inserted as NULL placeholders for interpolation, and both are
+    recorded in the ledger. Symbols are repaired in parallel, and a symbol
+    that fails doesn't stop the others. The higher-timeframe
+    rollups of the repaired candles are updated, and the candles are
+    published as an ingestion.events.CandlesInserted event.
 
-        if not missing:
-            print()
-            continue
+    Parameters:
+    -------------
+    symbol: string | list of strings
+        Symbol(s) to repair. 'all' repairs every user symbol.
 
-        # Date conversion functions for mapping
-        to_binance_ts = lambda x: tb.DateConvert(x).timestamp*1000
-        to_date = lambda x: tb.DateConvert(x).date
-
-        # Get Binance data
-        add = []
-        for chunk in chunks:
-            # Pad to be safe
-            startTime = tb.DateConvert(min(chunk) - timedelta(hours=10)).date
-            endTime = tb.DateConvert(max(chunk) + timedelta(hours=10)).date
-
-            limit = len(pd.date_range(startTime, endTime, freq=TIME_RES))
-
-            add += BinanceData().candle(
-                symbol = symbol,       limit = limit,
-                startTime = startTime, endTime = endTime
-                ).to_dict('records')
-
-        cols =  ['open_date', 'open', 'high', 'low', 'close', 'volume',
-                'close_date', 'quote_asset_volume', 'number_of_trades',
-                'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume',
-                'ignore']
-
-
-        add = pd.DataFrame(add, columns = cols).drop('ignore', axis=1)
-        add['symbol'] = symbol
-        add.open_date = add.open_date.map(to_date)
-        add.close_date = add.close_date.map(to_date)
-
-        missing = pd.DataFrame(missing, columns = ['open_date'])
-        missing.open_date = missing.open_date.map(to_date)
-        missing['symbol'] = symbol
-        for col in candles:
-            if col not in ['open_date', 'symbol']:
-                missing[col] = None
-
-        success = 0
-        for i, row in missing.iterrows():
-            missing_date = row.open_date
-            if add.open_date.isin([missing_date]).any():
-                missing.iloc[i,:] = add[add.open_date == missing_date].iloc[0,:]
-                success+=1
+    workers: int
+        Number of symbols to repair concurrently. Defaults to
+        config.data_collection.candle_fetch_config['workers'].
 
-        if verbose:
-            print(f'Binance call returned {success} missing dates.')
-            print(f'Inserting {len(missing)} items into db.')
-            print()
+    datasource: initialized exchanges.base.ExchangeData object
+        Defaults to the one selected by
+        config.data_collection.candle_fetch_config['datasource'].
 
-        # return add, missing, endTime, startTime
+    source: string
+        Name of the datasource in the candle_coverage ledger.
 
-        Database().insert('candles', missing)
+    Returns:
+    -------------
+    stats: pandas.DataFrame
+        One row per symbol with the number of gaps, missing dates, requests
+        made, dates fetched, placeholders inserted, seconds taken and the
+        error that stopped the symbol's repair, if any.
+    '''
 
-# TODO test
-def check_data_continuity(symbol='all', table='candles', verbose=True):
-    '''Check that candles form a fully continuous date range.'''
+    if verbose:
+        print('Repairing...')
 
+    # Get data for symbol
     if symbol == 'all':
         symbols = get_symbols()
+    elif isinstance(symbol, str):
+        symbols = [symbol]
     else:
-        if isinstance(symbol, str):
-            symbols = [symbol]
+        symbols = list(symbol)
+
+    if workers is None:
+        workers = candle_fetch_config['workers']
+
+    coverage = Coverage(source=source, db=db)
+    coverage.create_table()
+
+    # Results are collected as symbols finish, failures are kept per symbol
+    results = {}
+    with candle_datasource(datasource) as datasource, \
+         ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = {executor.submit(_repair_symbol, symbol, datasource, db,
+                                   coverage):symbol for symbol in symbols}
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                results[symbol] = future.result()
+            except Exception as err:
+                results[symbol] = (dict(symbol=symbol, error=repr(err)),
+                                   pd.DataFrame(columns=['symbol', 'open_date']))
+
+    cols = ['symbol', 'gaps', 'missing', 'requests', 'fetched',
+            'placeholders', 'seconds', 'error']
+    stats = pd.DataFrame([results[symbol][0] for symbol in symbols],
+                         columns=cols)
+    counts = ['gaps', 'missing', 'requests', 'fetched', 'placeholders']
+    stats[counts] = stats[counts].fillna(0).astype(int)
+    stats.seconds = stats.seconds.fillna(0.)
+
+    # Repaired hours change the bars containing them
+    repaired = [results[symbol][1] for symbol in symbols
+                if not results[symbol][1].empty]
+    if repaired:
+        repaired = pd.concat(repaired, ignore_index=True)
+        ranges = candle_ranges(repaired)
+        update_rollups(ranges, db=db)
+        if bus.subscribed(CandlesInserted):
+            bus.publish(CandlesInserted(ranges, repaired, db=db))
 
-    for symbol in symbols:
-        sql = f"SELECT open_date FROM {table} WHERE symbol = '{symbol}';"
-        dates = Database().execute(sql).open_date
-        min_date = dates.min()
-        max_date = dates.max()
-
-        continuous_date_range = pd.date_range(min_date, max_date, freq='1H')
-
-        discontinuous = 0
-        for i, date in enumerate(dates.iloc[1:], start=1):
-                prev_date = tb.DateConvert(dates.iloc[i-1]).datetime
-                date = tb.DateConvert(date).datetime
-
-                if date != prev_date + timedelta(hours=1):
-                    discontinuous+=1
-                    if verbose:
-                        print(date)
-
-        if discontinuous:
-            discontinuous = int(discontinuous/2)+1
-            print(f'There are {discontinuous} discontinuous dates in {symbol}')
-        else:
-            print(f'No discontinuous dates found in {symbol}')
+    if verbose:
+        print(stats.to_string(index=False))
+    return stats
+
+
+def _repair_symbol(symbol, datasource, db='autonotrader', coverage=None):
+    '''
+    Repair a single symbol, return its stats as a dict and the candles
+    found on the exchange and upserted.
+    '''
+
+    began = perf_counter()
+    stats = dict(symbol=symbol, gaps=0, missing=0, requests=0, fetched=0,
+                 placeholders=0, seconds=0., error=None)
+
+    sql = f"SELECT open_date, close FROM candles WHERE symbol = '{symbol}';"
+    dates = Database(db=db).execute(sql)
+
+    # Placeholders already recorded in the ledger aren't fetched again
+    if not dates.empty:
+        retried = dates.close.isnull().values
+        if coverage is not None and retried.any():
+            retried &= ~in_ranges(dates.open_date, coverage.get(symbol))
+        dates = dates[~retried]
+
+    gaps = tb.DateContinuity(dates.open_date).gaps if not dates.empty \
+           else pd.DataFrame(columns=['start', 'end', 'missing'])
+
+    if gaps.empty:
+        stats['seconds'] = perf_counter() - began
+        return stats, pd.DataFrame(columns=['symbol', 'open_date'])
+
+    # Expand gaps into the missing dates, in integer seconds
+    counts = gaps.missing.values.astype('int64')
+    starts = gaps.start.values.astype('datetime64[s]').astype('int64')
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+    missing = tb.DateArrayConvert(np.repeat(starts, counts) + offsets*3600).date
+
+    gaps = pd.DataFrame({'symbol':symbol,
+                         'start':pd.to_datetime(gaps.start.values),
+                         'end':pd.to_datetime(gaps.end.values) + HOUR},
+                        columns=['symbol', 'start', 'end'])
+    requests = list(page_requests(fetch_ranges(gaps)))
+
+    normalize = NormalizeCandles()
+    fetched = [frame for page in fetch_candles(datasource, requests)
+               for frame in normalize.process(page)]
+    fetched = pd.concat(fetched) if fetched else \
+              pd.DataFrame(columns=['symbol', 'open_date'])
+
+    # Keep only the dates that were missing, placeholders for the rest
+    found = fetched[fetched.open_date.isin(missing).values]
+    not_found = np.setdiff1d(missing, found.open_date.values)
+    placeholders = pd.DataFrame({'symbol':symbol, 'open_date':not_found},
+                                columns=['symbol', 'open_date'])
+
+    ins = pd.concat([found, placeholders], ignore_index=True)
+    Database(db=db).insert('candles', tb.format_frame(ins), auto_format=False,
+                           upsert=True)
+    if coverage is not None:
+        coverage.record(candle_ranges(ins))
+
+    stats.update(gaps=len(gaps), missing=len(missing), requests=len(requests),
+                 fetched=len(found), placeholders=len(placeholders),
+                 seconds=perf_counter() - began)
+    return stats, found
 
-# TODO test
-def clean_candles(symbol='all', table='candles', verbose=True):
-    '''Iterate through candles, deleting ones that don't start on the hour.'''
+
+def check_data_continuity(symbol='all', table='candles', verbose=True):
+    '''
+    Check that candles form a fully continuous hourly date range, reporting
+    gaps, duplicate dates and dates that don't fall on the hour.
+
+    Returns:
+    ------------
+    continuity: dict
+        dict like {'<symbol>':<utils.toolbox.DateContinuity>}
+    '''
 
     if symbol == 'all':
         symbols = get_symbols()
+    elif isinstance(symbol, str):
+        symbols = [symbol]
     else:
-        if isinstance(symbol, str):
-            symbols = [symbol]
+        symbols = symbol
 
+    continuity = {}
     for symbol in symbols:
         sql = f"SELECT open_date FROM {table} WHERE symbol = '{symbol}';"
-        dates = Database().execute(sql).open_date
+        dates = Database().execute(sql)
+        if dates.empty:
+            continue
+
+        c = tb.DateContinuity(dates.open_date.values, freq='1H')
+        continuity[symbol] = c
+
+        if c.continuous:
+            print(f'No discontinuous dates found in {symbol}')
+            continue
 
-        deleted = 0
-        for date in dates:
-            if date.minute and date.second:
-                d = tb.DateConvert(date).date
-                sql = f"DELETE FROM {table} WHERE open_date = '{d}' " + \
-                        f"AND symbol = '{symbol}';"
-                Database().write(sql)
-                deleted+=1
+        print(f'There are {len(c.gaps)} gaps ({c.num_missing} missing dates), '
+              f'{len(c.duplicates)} duplicate dates and {len(c.misaligned)} '
+              f'misaligned dates in {symbol}')
 
         if verbose:
-            print(f"Deleted {deleted} items from {symbol}")
+            for gap in c.gaps.itertuples():
+                print(f'    missing {gap.start} to {gap.end}')
+            for date in c.misaligned:
+                print(f'    misaligned {date}')
+
+    return continuity
+
+# TODO test
+def clean_candles(symbol='all', table='candles', verbose=True):
+    '''
+    Delete candles that don't start on the hour, with a single statement.
+
+    Returns:
+    ------------
+    deleted: int
+        The number of candles deleted.
+    '''
+
+    sql = f"DELETE FROM {table} " + \
+           "WHERE (MINUTE(open_date) <> 0 OR SECOND(open_date) <> 0)"
+
+    if symbol != 'all':
+        symbols = [symbol] if isinstance(symbol, str) else list(symbol)
+        sql += Candles()._assemble_where(
+            dict(column='symbol', operator='IN', value=symbols)
+            ).replace(' WHERE ', ' AND ', 1)
+
+    deleted = Database().write(sql + ';')
+
+    if verbose:
+        print(f"Deleted {deleted} items from {table}")
+    return deleted
 
 
 def check_ingestion_status():
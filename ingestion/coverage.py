@@ -0,0 +1,192 @@
+"""Plan candle fetches from the candle_coverage ledger."""
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from utils.toolbox import merge_ranges
+
+HOUR = pd.Timedelta(hours=1)
+
+# Max candles returned by a single exchange request
+PAGE_SIZE = 500
+
+
+def current_hour():
+    """The open date of the incomplete candle, i.e. the end of complete ones."""
+    return pd.Timestamp(datetime.utcnow()).floor('H')
+
+
+def missing_ranges(coverage, symbols, end, start=None, default_start=None):
+    """
+    Compute the hourly ranges that haven't been fetched for each symbol.
+
+    Parameters:
+    -------------
+    coverage: pandas.DataFrame
+        Covered ranges with columns 'symbol', 'start', 'end', as returned by
+        utils.database.Coverage.get
+
+    symbols: list of strings
+
+    end: datetime
+        Exclusive end of the window to plan for.
+
+    start: datetime
+        Start of the window. None starts each symbol at the end of its latest
+        covered range, so only the tail since the last fetch is planned.
+
+    default_start: datetime
+        Start for symbols without any coverage when start is None.
+
+    Returns:
+    -------------
+    missing: pandas.DataFrame
+        Columns 'symbol', 'start', 'end', one row per [start, end) range.
+    """
+    end = pd.Timestamp(end).floor('H')
+    covered = {symbol:group for symbol, group in
+               merge_ranges(coverage).groupby('symbol')}
+
+    missing = []
+    for symbol in symbols:
+        ranges = covered.get(symbol)
+
+        if start is not None:
+            cursor = start
+        elif ranges is not None:
+            cursor = ranges.end.max()
+        else:
+            cursor = default_start
+
+        if cursor is None:
+            continue
+        cursor = pd.Timestamp(cursor).ceil('H')
+
+        if ranges is not None:
+            for range_start, range_end in zip(ranges.start, ranges.end):
+                if range_end <= cursor:
+                    continue
+                if range_start >= end:
+                    break
+                if range_start > cursor:
+                    missing.append((symbol, cursor, range_start))
+                cursor = max(cursor, range_end)
+
+        if cursor < end:
+            missing.append((symbol, cursor, end))
+
+    return pd.DataFrame(missing, columns=['symbol', 'start', 'end'])
+
+
+def fetch_ranges(missing, page_size=PAGE_SIZE):
+    """
+    Combine consecutive missing ranges of a symbol whose total span fits in
+    a single page, so scattered small gaps are fetched with few requests.
+
+    Parameters:
+    -------------
+    missing: pandas.DataFrame
+        Columns 'symbol', 'start', 'end', sorted by symbol then start.
+
+    Returns:
+    -------------
+    ranges: pandas.DataFrame
+        Columns 'symbol', 'start', 'end'. Longer ranges are left to
+        page_requests to split.
+    """
+    span = page_size*HOUR
+    ranges = []
+    for symbol, group in missing.groupby('symbol', sort=False):
+        current = None
+        for start, end in zip(group.start, group.end):
+            if current and end - current[0] <= span:
+                current[1] = max(current[1], end)
+                continue
+            if current:
+                ranges.append((symbol, current[0], current[1]))
+            current = [start, end]
+        if current:
+            ranges.append((symbol, current[0], current[1]))
+
+    return pd.DataFrame(ranges, columns=['symbol', 'start', 'end'])
+
+
+def page_requests(missing, page_size=PAGE_SIZE):
+    """
+    Split missing ranges into candle requests of at most page_size candles.
+
+    Yields:
+    -------------
+    request: dict like {'symbol':<symbol>, 'startTime':<first open_date>,
+                        'endTime':<last open_date>}
+    """
+    for symbol, start, end in zip(missing.symbol, missing.start, missing.end):
+        hours = int((end - start)/HOUR)
+        for offset in range(0, hours, page_size):
+            page_start = start + offset*HOUR
+            page_end = min(page_start + page_size*HOUR, end)
+            yield dict(symbol=symbol,
+                       startTime=page_start.to_pydatetime(),
+                       endTime=(page_end - HOUR).to_pydatetime())
+
+
+def candle_ranges(candles):
+    """
+    The [start, end) ranges of open dates actually present in candles: one
+    range per run of consecutive hourly candles of a symbol. Candles at or
+    after the current hour are incomplete and ignored.
+
+    Parameters:
+    -------------
+    candles: pandas.DataFrame
+        Columns 'symbol' and 'open_date', as datetimes or date strings.
+
+    Returns:
+    -------------
+    ranges: pandas.DataFrame
+        Columns 'symbol', 'start', 'end'.
+    """
+    if candles is None or candles.empty:
+        return pd.DataFrame(columns=['symbol', 'start', 'end'])
+
+    dates = pd.DataFrame({'symbol':candles.symbol.values,
+                          'start':pd.to_datetime(candles.open_date.values)})
+    dates = dates[dates.start < current_hour()]
+    dates = dates.drop_duplicates().sort_values(['symbol', 'start'])
+    dates['end'] = dates.start + HOUR
+
+    # Adjacent hours are merged into runs, missing hours split them
+    return merge_ranges(dates)
+
+
+def in_ranges(dates, ranges):
+    """
+    Whether each date falls in one of the [start, end) ranges.
+
+    Parameters:
+    -------------
+    dates: pandas.Series | numpy.ndarray
+        Dates of a single symbol.
+
+    ranges: pandas.DataFrame
+        Columns 'start', 'end', non-overlapping, like the merged ranges of a
+        symbol returned by utils.database.Coverage.get.
+
+    Returns:
+    -------------
+    covered: numpy.ndarray of booleans
+    """
+    dates = pd.to_datetime(dates).values
+    if ranges.empty:
+        return np.zeros(len(dates), dtype=bool)
+
+    ranges = ranges.sort_values('start')
+    starts = pd.to_datetime(ranges.start).values
+    ends = pd.to_datetime(ranges.end).values
+
+    # The last range starting at or before each date
+    position = np.searchsorted(starts, dates, side='right') - 1
+    covered = position >= 0
+    covered[covered] = dates[covered] < ends[position[covered]]
+    return covered
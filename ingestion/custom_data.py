@@ -63,7 +63,6 @@ class BaseData(CustomData):
 
         pairs = db.get_pairs()
         ret = pd.DataFrame()
-        convert_dates = lambda x: tb.DateConvert(x).datetime
 
         for pair in pairs.iterrows():
 
@@ -85,7 +84,7 @@ class BaseData(CustomData):
             df.date = pd.to_datetime(df.date, unit='s')
             df['symbol'] = from_symbol + to_symbol
             df = df[['date', 'symbol', 'type', 'price']]
-            df.date = df.date.map(convert_dates)
+            df.date = tb.DateArrayConvert(df.date).datetime
 
             ret = pd.concat([ret, df], ignore_index=True)
 
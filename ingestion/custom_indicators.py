@@ -1,11 +1,16 @@
 """Add custom indicators that will be calculated each time a candle is acquired."""
 
+import json
 import pandas as pd
 import numpy as np
+from collections import deque
 from datetime import timedelta
 from utils import toolbox as tb
 from utils.database import Database
 from errors.exceptions import ImplementationError
+from ingestion.intermediates import (
+    compute_intermediates, RollingMean, RollingStd, RollingSum, TrueRange
+)
 
 
 class CustomIndicator:
@@ -16,6 +21,42 @@ class CustomIndicator:
 
     """
 
+    # Intermediates (ingestion.intermediates) read by transform through
+    # self.intermediate. engineer_data computes each one once per symbol and
+    # shares it between every indicator that requires it.
+    requires = []
+
+    # Base classes set abstract = True so engineer_data skips them and only
+    # calculates their subclasses.
+    abstract = False
+
+    @classmethod
+    def requirements(cls):
+        """
+        Return the intermediates transform reads. Defaults to requires,
+        override it when they depend on class parameters.
+        """
+        return list(cls.requires)
+
+    @classmethod
+    def get_sql(cls):
+        """
+        Optionally return a MySQL 8 expression of the indicator over the
+        candles table, like rolling_sql('AVG', 'close', 48). Window functions
+        should partition by symbol and order by open_date. engineer_sql then
+        computes the indicator in the database instead of with transform.
+        Return None to compute it in Python.
+        """
+        return None
+
+    @classmethod
+    def calculate(cls, candles):
+        """
+        Return the indicator over candles of a single symbol sorted by
+        open_date, like a DataEngine window in a backtest: self.data[-99:1].
+        """
+        return cls()._transform(candles)
+
     @staticmethod
     def get_timedelta():
         """
@@ -39,8 +80,134 @@ class CustomIndicator:
             Must implement transform method. See docs for details.
         """)
 
-    def _transform(self, candles):
-        self.candles = candles
+    def intermediate(self, spec):
+        """
+        Return an intermediate over self.candles, or self.panel in
+        transform_panel. Intermediates engineer_data hasn't computed, like
+        ones missing from requires, are computed here and cached.
+        """
+        if spec not in self.cache:
+            compute_intermediates([spec], self.data, self.cache)
+        return self.cache[spec]
+
+    # Optional panel mode. Indicators implementing transform_panel are
+    # computed for every symbol at once.
+
+    def transform_panel(self):
+        """
+        Return a pandas.DataFrame of the indicator for every symbol at once.
+        self.panel is a dict of DataFrames indexed by open_date with a column
+        per symbol, one for each candle field, like self.panel['close'].
+        The result should have the same index and columns.
+        """
+        raise NotImplementedError("""
+            Must implement transform_panel method for panel computation.
+        """)
+
+    @classmethod
+    def panel_enabled(cls):
+        """True if the indicator implements transform_panel."""
+        return cls.transform_panel is not CustomIndicator.transform_panel
+
+    def _transform_panel(self, panel, cache=None):
+        self.panel = self.data = panel
+        self.cache = {} if cache is None else cache
+        custom_indicator = self.transform_panel()
+
+        shape = panel['close'].shape
+        if custom_indicator.shape != shape:
+            raise ImplementationError(f"""
+                Shape of input to transform_panel method is different from
+                shape of output. They should be the same.
+
+                input shape: {shape}
+                output shape: {custom_indicator.shape}
+            """)
+        return custom_indicator
+
+    def _transform_columns(self):
+        """
+        transform_panel for recursive indicators, like ewm or
+        wilder_average, whose values depend on every earlier row. The panel
+        has a row for every date of any symbol, so a symbol without a candle
+        at a date inside its range would have a missing value in its
+        recursion. Those columns are transformed over their own rows only,
+        like engineer_data does per symbol.
+        """
+        panel, cache = self.panel, self.cache
+        custom_indicator = self.transform()
+
+        valid = panel['close'].notnull()
+        inside = valid.cummax() & valid[::-1].cummax()[::-1]
+        gaps = (inside & ~valid).any()
+        for symbol in gaps.index[gaps.values]:
+            rows = valid[symbol].values
+            self.data = {field:frame.loc[rows, [symbol]]
+                         for field, frame in panel.items()}
+            self.cache = {}
+            custom_indicator.loc[rows, symbol] = \
+                np.asarray(self.transform()[symbol], dtype=float)
+
+        self.data, self.cache = panel, cache
+        return custom_indicator
+
+    # Optional incremental protocol. Indicators implementing init_state and
+    # update can be computed from persisted state over only new candles.
+
+    def init_state(self):
+        """
+        Return the state of the indicator before any candle has been seen,
+        e.g. a rolling window and its sum.
+        """
+        raise NotImplementedError("""
+            Must implement init_state method for incremental computation.
+        """)
+
+    def update(self, candle):
+        """
+        Add a single candle to self.state and return the indicator's value
+        for it, or NaN while there's too little data. candle has the same
+        fields as a row of self.candles, accessed like candle.close.
+
+        Updates should take constant time, e.g. with RollingWindow, so the
+        indicator is cheap to compute live. check_streaming verifies that
+        updates reproduce transform.
+        """
+        raise NotImplementedError("""
+            Must implement update method for incremental computation.
+        """)
+
+    def snapshot(self):
+        """Return self.state as JSON-serializable objects."""
+        return self.state
+
+    def restore(self, state):
+        """Set self.state from the output of snapshot."""
+        self.state = state
+
+    @classmethod
+    def incremental(cls):
+        """True if the indicator implements the incremental protocol."""
+        return cls.init_state is not CustomIndicator.init_state and \
+               cls.update is not CustomIndicator.update
+
+    def _stream(self, candles, state=None):
+        """
+        Run update over candles in order, starting from a snapshot or from
+        init_state. Returns a Series of values indexed like candles.
+        """
+        if state is None:
+            self.state = self.init_state()
+        else:
+            self.restore(state)
+
+        values = [self.update(candle) for candle in
+                  candles.itertuples(index=False)]
+        return pd.Series(values, index=candles.index, dtype=float)
+
+    def _transform(self, candles, cache=None):
+        self.candles = self.data = candles
+        self.cache = {} if cache is None else cache
         custom_indicator = self.transform()
 
         if len(self.candles) != len(custom_indicator):
@@ -54,19 +221,620 @@ class CustomIndicator:
         return custom_indicator
 
 
+class RollingWindow:
+    """
+    The most recent <size> values with a running sum, and a running mean and
+    sum of squared deviations updated with Welford's method, for amortized
+    O(1) rolling statistics in CustomIndicator.update. The statistics are
+    recomputed from the values once every <size> updates and on restore, so
+    rounding error doesn't build up within or across runs.
+    """
+    def __init__(self, size, values=()):
+        self.size = size
+        self.values = deque(values, maxlen=size)
+        self._recompute()
+
+    def _recompute(self):
+        self.sum = float(sum(self.values))
+        self._mean = self.sum/len(self.values) if self.values else 0.
+        self._m2 = float(sum((v - self._mean)**2 for v in self.values))
+        self._updates = 0
+
+    def append(self, value):
+        if len(self.values) < self.size:
+            delta = value - self._mean
+            self._mean += delta/(len(self.values) + 1)
+            self._m2 += delta*(value - self._mean)
+            self.values.append(value)
+            self.sum += value
+            return
+
+        # Replace the oldest value in a single update
+        old = self.values[0]
+        previous = self._mean
+        self._mean += (value - old)/self.size
+        self._m2 += (value - old)*(value - self._mean + old - previous)
+        self.values.append(value)
+        self.sum += value - old
+
+        self._updates += 1
+        if self._updates == self.size:
+            self._recompute()
+
+    @property
+    def full(self):
+        return len(self.values) == self.size
+
+    def mean(self):
+        """Mean of a full window, else NaN, like pandas rolling(size).mean()."""
+        return self.sum/self.size if self.full else np.nan
+
+    def std(self):
+        """Sample standard deviation of a full window, else NaN."""
+        if not self.full or self.size < 2:
+            return np.nan
+        return np.sqrt(max(self._m2/(self.size - 1), 0.))
+
+    def snapshot(self):
+        return list(self.values)
+
+
+class ExponentialAverage:
+    """
+    Exponential moving average updated a value at a time, matching pandas
+    ewm(alpha=alpha, adjust=False, min_periods=min_periods).mean().
+    """
+    def __init__(self, alpha, min_periods=1, value=None, count=0):
+        self.alpha = alpha
+        self.min_periods = min_periods
+        self.value = value
+        self.count = count
+
+    def append(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha*(value - self.value)
+        self.count += 1
+
+    def mean(self):
+        return self.value if self.count >= self.min_periods else np.nan
+
+    def snapshot(self):
+        return [self.value, self.count]
+
+
+class WilderAverage:
+    """
+    Wilder's moving average updated a value at a time, matching
+    wilder_average. The first value is the mean of the first <period>
+    values, then avg = (avg*(period - 1) + value)/period.
+    """
+    def __init__(self, period, value=None, count=0, total=0.):
+        self.period = period
+        self.value = value
+        self.count = count
+        self.total = total
+
+    def append(self, value):
+        self.count += 1
+        if self.count < self.period:
+            self.total += value
+        elif self.count == self.period:
+            self.value = (self.total + value)/self.period
+        else:
+            self.value += (value - self.value)/self.period
+
+    def mean(self):
+        return self.value if self.count >= self.period else np.nan
+
+    def snapshot(self):
+        return [self.value, self.count, self.total]
+
+
+def wilder_average(values, period):
+    """
+    Wilder's moving average of a Series, or of each column of a DataFrame.
+    Leading NaNs are skipped; the first average is the mean of the first
+    <period> values, and the rest are an exponential average with
+    alpha = 1/period.
+    """
+    if isinstance(values, pd.DataFrame):
+        return values.apply(wilder_average, args=(period,))
+
+    valid = np.flatnonzero(values.notnull().values)
+    seeded = pd.Series(np.nan, index=values.index, name=values.name)
+    if len(valid) < period:
+        return seeded
+
+    seed = valid[0] + period - 1
+    seeded.iloc[seed] = values.iloc[valid[0]:seed+1].mean()
+    seeded.iloc[seed+1:] = values.iloc[seed+1:]
+    return seeded.ewm(alpha=1/period, adjust=False).mean()
+
+
+def rolling_sql(function, column, window):
+    """
+    Return a MySQL 8 window expression of function(column) over the last
+    <window> candles of each symbol, NULL until there are <window> non-null
+    values like pandas rolling(window). For CustomIndicator.get_sql.
+
+    Parameters:
+    ---------------
+    function: string
+        Aggregate like 'AVG', 'SUM', 'MIN', 'MAX' or 'STDDEV_SAMP'.
+    """
+    frame = 'OVER (PARTITION BY symbol ORDER BY open_date ' + \
+            f'ROWS BETWEEN {window - 1} PRECEDING AND CURRENT ROW)'
+    return f'CASE WHEN COUNT({column}) {frame} = {window} ' + \
+           f'THEN {function}({column}) {frame} END'
+
+
+def get_indicators(base=CustomIndicator):
+    """
+    Return every indicator to calculate: subclasses of base at any depth,
+    skipping classes that set abstract = True themselves.
+    """
+    indicators = []
+    for indicator in base.__subclasses__():
+        if not indicator.__dict__.get('abstract', False):
+            indicators.append(indicator)
+        for subclass in get_indicators(indicator):
+            if subclass not in indicators:
+                indicators.append(subclass)
+    return indicators
+
+
+def check_streaming(indicator, candles, split=None, rtol=1e-7):
+    """
+    Check that an indicator's incremental protocol reproduces its transform.
+
+    Candles are streamed in two parts with the state persisted between them
+    through JSON, like utils.database.IndicatorState, and compared with the
+    transform of all candles.
+
+    Parameters:
+    ---------------
+    indicator: CustomIndicator subclass
+
+    candles: pandas.DataFrame
+        Candles of a single symbol, sorted by open_date.
+
+    split: int
+        Row at which to snapshot and restore the state. Defaults to halfway.
+
+    rtol: float
+        Relative tolerance of the comparison.
+
+    Returns:
+    ---------------
+    streamed: pandas.Series
+        The streamed values.
+    """
+    if not indicator.incremental():
+        raise ImplementationError(f"""
+            {indicator.__name__} doesn't implement init_state and update.
+        """)
+
+    candles = candles.reset_index(drop=True)
+    if split is None:
+        split = len(candles)//2
+
+    first = indicator()
+    head = first._stream(candles.iloc[:split])
+    state = json.loads(json.dumps(first.snapshot()))
+    tail = indicator()._stream(candles.iloc[split:], state)
+    streamed = pd.concat([head, tail])
+
+    batch = np.asarray(indicator()._transform(candles), dtype=float).ravel()
+    mismatch = ~np.isclose(streamed.values, batch, rtol=rtol, equal_nan=True)
+
+    if mismatch.any():
+        i = np.flatnonzero(mismatch)[0]
+        raise ImplementationError(f"""
+            Streaming output of {indicator.__name__} differs from transform
+            for {mismatch.sum()} of {len(candles)} candles.
+
+            First difference at row {i}:
+                transform: {batch[i]}
+                streaming: {streamed.iloc[i]}
+        """)
+    return streamed
+
+
+# Library of common indicators. These are abstract, so subclass them with
+# the parameters you want calculated, e.g.
+#
+#     class EMA_12H(EMA):
+#         span = 12
+#
+# Each works in engineer_data per symbol, on panels and incrementally, and
+# on a DataEngine window through calculate.
+
+class EMA(CustomIndicator):
+    """
+    Exponential moving average of <column> over <span> candles, with
+    alpha = 2/(span + 1). NaN for the first span - 1 candles.
+    """
+    abstract = True
+    span = None
+    column = 'close'
+
+    @classmethod
+    def get_timedelta(cls):
+        # Start-up error of the average is under 0.1% after four spans
+        return timedelta(hours=4*cls.span)
+
+    def transform(self):
+        return self.data[self.column].ewm(
+            span=self.span, adjust=False, min_periods=self.span
+            ).mean()
+
+    def transform_panel(self):
+        return self._transform_columns()
+
+    def init_state(self):
+        return ExponentialAverage(2/(self.span + 1), self.span)
+
+    def update(self, candle):
+        self.state.append(getattr(candle, self.column))
+        return self.state.mean()
+
+    def snapshot(self):
+        return self.state.snapshot()
+
+    def restore(self, state):
+        self.state = ExponentialAverage(2/(self.span + 1), self.span, *state)
+
+
+class RSI(CustomIndicator):
+    """
+    Relative strength index of close over <period> candles, with Wilder's
+    smoothing of gains and losses. Between 0 and 100, NaN for the first
+    <period> candles.
+    """
+    abstract = True
+    period = 14
+
+    @classmethod
+    def get_timedelta(cls):
+        return timedelta(hours=4*cls.period)
+
+    def transform(self):
+        change = self.data['close'].diff()
+        gain = wilder_average(change.clip(lower=0), self.period)
+        loss = wilder_average((-change).clip(lower=0), self.period)
+        return 100*gain/(gain + loss)
+
+    def transform_panel(self):
+        return self._transform_columns()
+
+    def init_state(self):
+        return [None, WilderAverage(self.period), WilderAverage(self.period)]
+
+    def update(self, candle):
+        previous, gain, loss = self.state
+        self.state[0] = candle.close
+        if previous is None:
+            return np.nan
+
+        change = candle.close - previous
+        gain.append(max(change, 0.))
+        loss.append(max(-change, 0.))
+
+        total = gain.mean() + loss.mean()
+        return 100*gain.mean()/total if total else np.nan
+
+    def snapshot(self):
+        previous, gain, loss = self.state
+        return [previous, gain.snapshot(), loss.snapshot()]
+
+    def restore(self, state):
+        previous, gain, loss = state
+        self.state = [previous, WilderAverage(self.period, *gain),
+                      WilderAverage(self.period, *loss)]
+
+
+class MACD(CustomIndicator):
+    """
+    Moving average convergence divergence of close. output selects the MACD
+    line, EMA(fast) - EMA(slow), with 'macd', its EMA over <signal> candles
+    with 'signal', or their difference with 'histogram'.
+    """
+    abstract = True
+    fast = 12
+    slow = 26
+    signal = 9
+    output = 'macd'
+
+    @classmethod
+    def get_timedelta(cls):
+        return timedelta(hours=4*(cls.slow + cls.signal))
+
+    def transform(self):
+        close = self.data['close']
+        fast = close.ewm(span=self.fast, adjust=False,
+                         min_periods=self.fast).mean()
+        slow = close.ewm(span=self.slow, adjust=False,
+                         min_periods=self.slow).mean()
+        macd = fast - slow
+        signal = macd.ewm(span=self.signal, adjust=False,
+                          min_periods=self.signal).mean()
+        return self._output(macd, signal)
+
+    def transform_panel(self):
+        return self._transform_columns()
+
+    def _output(self, macd, signal):
+        if self.output == 'macd':
+            return macd
+        elif self.output == 'signal':
+            return signal
+        elif self.output == 'histogram':
+            return macd - signal
+        raise ImplementationError(f"""
+            MACD output must be 'macd', 'signal' or 'histogram', not
+            {self.output}.
+        """)
+
+    def _averages(self, state=([None, 0],)*3):
+        spans = (self.fast, self.slow, self.signal)
+        return [ExponentialAverage(2/(span + 1), span, *s)
+                for span, s in zip(spans, state)]
+
+    def init_state(self):
+        return self._averages()
+
+    def update(self, candle):
+        fast, slow, signal = self.state
+        fast.append(candle.close)
+        slow.append(candle.close)
+
+        macd = fast.mean() - slow.mean()
+        if not np.isnan(macd):
+            signal.append(macd)
+        return self._output(macd, signal.mean())
+
+    def snapshot(self):
+        return [average.snapshot() for average in self.state]
+
+    def restore(self, state):
+        self.state = self._averages(state)
+
+
+class Bollinger(CustomIndicator):
+    """
+    Bollinger band of close: the mean over <window> candles, plus ('upper')
+    or minus ('lower') <k> sample standard deviations, or just the mean
+    ('middle').
+    """
+    abstract = True
+    window = 20
+    k = 2
+    band = 'upper'
+
+    @classmethod
+    def get_timedelta(cls):
+        return timedelta(hours=cls.window)
+
+    @classmethod
+    def requirements(cls):
+        return [RollingMean('close', cls.window), RollingStd('close', cls.window)]
+
+    @property
+    def _sign(self):
+        try:
+            return {'upper':1, 'middle':0, 'lower':-1}[self.band]
+        except KeyError:
+            raise ImplementationError(f"""
+                Bollinger band must be 'upper', 'middle' or 'lower', not
+                {self.band}.
+            """)
+
+    def transform(self):
+        mean = self.intermediate(RollingMean('close', self.window))
+        std = self.intermediate(RollingStd('close', self.window))
+        return mean + self._sign*self.k*std
+
+    def transform_panel(self):
+        return self.transform()
+
+    def init_state(self):
+        return RollingWindow(self.window)
+
+    def update(self, candle):
+        self.state.append(candle.close)
+        return self.state.mean() + self._sign*self.k*self.state.std()
+
+    def snapshot(self):
+        return self.state.snapshot()
+
+    def restore(self, state):
+        self.state = RollingWindow(self.window, state)
+
+
+class ATR(CustomIndicator):
+    """
+    Average true range over <period> candles, with Wilder's smoothing. NaN
+    for the first period - 1 candles.
+    """
+    abstract = True
+    period = 14
+    requires = [TrueRange()]
+
+    @classmethod
+    def get_timedelta(cls):
+        return timedelta(hours=4*cls.period)
+
+    def transform(self):
+        return wilder_average(self.intermediate(TrueRange()), self.period)
+
+    def transform_panel(self):
+        return self._transform_columns()
+
+    def init_state(self):
+        return [None, WilderAverage(self.period)]
+
+    def update(self, candle):
+        previous, average = self.state
+        self.state[0] = candle.close
+
+        true_range = candle.high - candle.low
+        if previous is not None:
+            true_range = max(true_range, abs(candle.high - previous),
+                             abs(candle.low - previous))
+        average.append(true_range)
+        return average.mean()
+
+    def snapshot(self):
+        previous, average = self.state
+        return [previous, average.snapshot()]
+
+    def restore(self, state):
+        previous, average = state
+        self.state = [previous, WilderAverage(self.period, *average)]
+
+
+class VWAP(CustomIndicator):
+    """
+    Volume-weighted average of the typical price, (high + low + close)/3,
+    over the last <window> candles.
+    """
+    abstract = True
+    window = 24
+
+    @classmethod
+    def get_timedelta(cls):
+        return timedelta(hours=cls.window)
+
+    @classmethod
+    def requirements(cls):
+        return [RollingSum('volume', cls.window)]
+
+    def transform(self):
+        typical = (self.data['high'] + self.data['low'] + self.data['close'])/3
+        weighted = (typical*self.data['volume']).rolling(self.window).sum()
+        return weighted/self.intermediate(RollingSum('volume', self.window))
+
+    def transform_panel(self):
+        return self.transform()
+
+    def init_state(self):
+        return [RollingWindow(self.window), RollingWindow(self.window)]
+
+    def update(self, candle):
+        weighted, volume = self.state
+        typical = (candle.high + candle.low + candle.close)/3
+        weighted.append(typical*candle.volume)
+        volume.append(candle.volume)
+
+        if not volume.full or not volume.sum:
+            return np.nan
+        return weighted.sum/volume.sum
+
+    def snapshot(self):
+        return [window.snapshot() for window in self.state]
+
+    def restore(self, state):
+        self.state = [RollingWindow(self.window, values) for values in state]
+
+
+class OBV(CustomIndicator):
+    """
+    On-balance volume over the last <window> candles: the sum of volume for
+    candles that closed higher than the previous candle, minus volume for
+    candles that closed lower. Cumulative OBV depends on where the data
+    starts, so a rolling sum keeps it the same between engineer_data runs.
+    """
+    abstract = True
+    window = 24
+
+    @classmethod
+    def get_timedelta(cls):
+        return timedelta(hours=cls.window)
+
+    def transform(self):
+        direction = np.sign(self.data['close'].diff()).fillna(0)
+        return (direction*self.data['volume']).rolling(self.window).sum()
+
+    def transform_panel(self):
+        return self.transform()
+
+    def init_state(self):
+        return [None, RollingWindow(self.window)]
+
+    def update(self, candle):
+        previous, window = self.state
+        self.state[0] = candle.close
+
+        direction = 0. if previous is None else np.sign(candle.close - previous)
+        window.append(direction*candle.volume)
+        return window.sum if window.full else np.nan
+
+    def snapshot(self):
+        previous, window = self.state
+        return [previous, window.snapshot()]
+
+    def restore(self, state):
+        previous, window = state
+        self.state = [previous, RollingWindow(self.window, window)]
+
+
 class MA_48H(CustomIndicator):
+    requires = [RollingMean('close', 48)]
+
     def get_timedelta():
         return timedelta(hours=48)
 
     def transform(self):
-        return self.candles.close.rolling(48).mean()
+        return self.intermediate(RollingMean('close', 48))
+
+    def transform_panel(self):
+        return self.intermediate(RollingMean('close', 48))
+
+    def get_sql():
+        return rolling_sql('AVG', 'close', 48)
+
+    def init_state(self):
+        return RollingWindow(48)
+
+    def update(self, candle):
+        self.state.append(candle.close)
+        return self.state.mean()
+
+    def snapshot(self):
+        return self.state.snapshot()
+
+    def restore(self, state):
+        self.state = RollingWindow(48, state)
 
 class MA_72H(CustomIndicator):
+    requires = [RollingMean('close', 72)]
+
     def get_timedelta():
         return timedelta(hours=72)
 
     def transform(self):
-        return self.candles.close.rolling(72).mean()
+        return self.intermediate(RollingMean('close', 72))
+
+    def transform_panel(self):
+        return self.intermediate(RollingMean('close', 72))
+
+    def get_sql():
+        return rolling_sql('AVG', 'close', 72)
+
+    def init_state(self):
+        return RollingWindow(72)
+
+    def update(self, candle):
+        self.state.append(candle.close)
+        return self.state.mean()
+
+    def snapshot(self):
+        return self.state.snapshot()
+
+    def restore(self, state):
+        self.state = RollingWindow(72, state)
 
 class AVG(CustomIndicator):
     def get_timedelta():
@@ -76,3 +844,19 @@ class AVG(CustomIndicator):
         a = self.candles.close + self.candles.open
         b = self.candles.high + self.candles.low
         return a+b/4
+
+    def transform_panel(self):
+        a = self.panel['close'] + self.panel['open']
+        b = self.panel['high'] + self.panel['low']
+        return a+b/4
+
+    def get_sql():
+        return '(close + open) + (high + low)/4'
+
+    def init_state(self):
+        return None
+
+    def update(self, candle):
+        a = candle.close + candle.open
+        b = candle.high + candle.low
+        return a+b/4
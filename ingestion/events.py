@@ -0,0 +1,204 @@
+"""
+In-process events chaining ingestion steps.
+
+Steps publish an event as soon as their data is stored, and subscribers
+process exactly that delta right away, with the data handed over instead of
+re-queried. core._ingest_candles publishes CandlesInserted after every
+candle insert, live.insert_engineered_data publishes FeaturesEngineered
+after storing new engineered rows.
+
+Subscribers are called synchronously, in the publishing thread, in the
+order they subscribed. A failing subscriber is logged and doesn't stop the
+publisher or the other subscribers.
+
+    from ingestion.events import bus, FeaturesEngineered, ShadowBacktest
+    bus.subscribe(FeaturesEngineered, ShadowBacktest(MyBot()))
+"""
+
+import logging
+import threading
+from time import perf_counter
+from datetime import datetime
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class Event:
+    """Base class for events. created is the UTC time of publishing."""
+    def __init__(self):
+        self.created = datetime.utcnow()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.created})'
+
+
+class CandlesInserted(Event):
+    """
+    New hourly candles were inserted into the candles table.
+
+    Parameters:
+    ---------------
+    ranges: pandas.DataFrame
+        [start, end) ranges of the inserted open dates of each symbol.
+        Columns 'symbol', 'start', 'end'.
+
+    candles: pandas.DataFrame
+        The inserted candles.
+
+    db: string
+        The database they were inserted into.
+    """
+    def __init__(self, ranges, candles, db='autonotrader'):
+        super().__init__()
+        self.ranges = ranges
+        self.candles = candles
+        self.db = db
+
+    @property
+    def symbols(self):
+        return sorted(set(self.ranges.symbol))
+
+    @property
+    def end(self):
+        """Exclusive end of the newest inserted candle."""
+        return pd.to_datetime(self.ranges.end).max() if len(self.ranges) \
+               else None
+
+
+class FeaturesEngineered(Event):
+    """
+    New engineered rows were stored.
+
+    Parameters:
+    ---------------
+    ins: pandas.DataFrame
+        Candles and indicator columns of the new rows, like
+        core.engineer_data returns.
+    """
+    def __init__(self, ins):
+        super().__init__()
+        self.ins = ins
+
+    @property
+    def symbols(self):
+        return sorted(set(self.ins.symbol))
+
+
+class EventBus:
+    """Synchronous publish/subscribe by event class, with handler timing."""
+    def __init__(self):
+        self.handlers = {}
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, event_type, handler):
+        """Call handler(event) for every published event of event_type."""
+        with self._lock:
+            handlers = self.handlers.setdefault(event_type, [])
+            if handler not in handlers:
+                handlers.append(handler)
+
+    def unsubscribe(self, event_type, handler):
+        with self._lock:
+            if handler in self.handlers.get(event_type, []):
+                self.handlers[event_type].remove(handler)
+
+    def subscribed(self, event_type):
+        with self._lock:
+            return list(self.handlers.get(event_type, []))
+
+    def publish(self, event):
+        """
+        Call the subscribers of the event's class in order.
+
+        Returns:
+        ---------------
+        failed: list
+            Handlers that raised.
+        """
+        failed = []
+        for handler in self.subscribed(type(event)):
+            start = perf_counter()
+            try:
+                handler(event)
+            except Exception as err:
+                failed.append(handler)
+                logger.error(f'{_name(handler)} failed handling {event}.')
+                logger.error(err)
+            finally:
+                self._record(handler, perf_counter() - start,
+                             (datetime.utcnow() - event.created).total_seconds())
+        return failed
+
+    def _record(self, handler, duration, latency):
+        with self._lock:
+            stats = self.stats.setdefault(_name(handler), dict(
+                calls=0, total_duration=0, max_duration=0, last_latency=None
+                ))
+            stats['calls'] += 1
+            stats['total_duration'] += duration
+            stats['max_duration'] = max(stats['max_duration'], duration)
+            stats['last_latency'] = latency
+
+    def get_stats(self):
+        """
+        Return a DataFrame with one row per handler: calls, total and max
+        duration in seconds, and the seconds from publishing to the end of
+        its last call.
+        """
+        with self._lock:
+            stats = pd.DataFrame.from_dict(self.stats, orient='index')
+        columns = ['calls', 'total_duration', 'max_duration', 'last_latency']
+        return stats.reindex(columns=columns)
+
+
+def _name(handler):
+    return getattr(handler, '__name__', type(handler).__name__)
+
+
+# Shared by every publisher and subscriber in the process
+bus = EventBus()
+
+
+class ShadowBacktest:
+    """
+    Keep a bot running on newly engineered rows as they arrive. Subscribe it
+    to FeaturesEngineered.
+
+    The bot must declare a 'stream' data requirement, so its candles are held
+    by StreamingDataEngines that can be appended to, and is usually run over
+    its history first. Each event appends the new rows of the bot's symbols
+    and runs generate_signals on them in time order.
+
+    Parameters:
+    ---------------
+    bot: bot.base.Core subclass instance
+    """
+    def __init__(self, bot):
+        self.bot = bot
+
+    def __call__(self, event):
+        engines = self.bot.data_dict
+        rows = event.ins[event.ins.symbol.isin(list(engines))]
+        if rows.empty:
+            return
+
+        rows = rows.sort_values(['open_date', 'symbol'])
+        rows.index = pd.to_datetime(rows.open_date)
+        rows.open_date = rows.index
+
+        for symbol, candles in rows.groupby('symbol', sort=False):
+            engine = engines[symbol]
+
+            # Rows the bot already has are dropped
+            if len(engine.data):
+                last = engine.data.open_date.iloc[-1]
+                candles = candles[candles.open_date > last]
+            if candles.empty:
+                continue
+            engine.append(candles)
+            engine.finished = engine.increments == engine.length
+
+        self.bot.run_pending()
@@ -45,7 +45,8 @@ def insert_historical_candles(symbols, datestring, min_date=None, verbose=True):
     # Oldest dates from the DB as a dict, with None values if nothing's there
     oldest_dates = get_oldest_dates(symbols=symbols)
 
-    for i, symbol in enumerate(symbols):
+    # Requests are throttled by exchanges.ratelimit.binance_limiter
+    for symbol in symbols:
         endTime = oldest_dates[symbol]
 
         if endTime:
@@ -58,8 +59,3 @@ def insert_historical_candles(symbols, datestring, min_date=None, verbose=True):
         insert_hourly_candles(
             symbol, endTime=endTime, startTime=startTime, verbose=verbose
             )
-
-        if i != len(symbols)-1:
-            if verbose:
-                print('Sleeping...')
-            sleep(10)
@@ -0,0 +1,200 @@
+"""
+Named intermediate series shared between custom indicators.
+
+Indicators list the intermediates they read in CustomIndicator.requires and
+fetch them with CustomIndicator.intermediate. engineer_data resolves every
+indicator's requirements into one dependency graph and computes each
+intermediate once per symbol (or once per panel), so indicators built on
+the same rolling sums, returns or true ranges share the work.
+
+Intermediates operate on candles of a single symbol, where data['close'] is
+a Series, or on a panel, where data['close'] is a time x symbol DataFrame.
+"""
+
+import numpy as np
+from errors.exceptions import ImplementationError
+
+
+class Intermediate:
+    """
+    Base class for intermediates. An intermediate is identified by its class
+    and parameters, so RollingSum('close', 48) declared by two indicators is
+    the same node of the graph.
+
+    Subclasses pass their parameters to Intermediate.__init__, and implement
+    compute and, if they build on other intermediates, dependencies.
+    """
+    def __init__(self, *params):
+        self.params = params
+
+    @property
+    def key(self):
+        return (type(self).__name__,) + self.params
+
+    def __eq__(self, other):
+        return isinstance(other, Intermediate) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        params = ', '.join(repr(p) for p in self.params)
+        return f'{type(self).__name__}({params})'
+
+    def dependencies(self):
+        """Return the intermediates compute reads from inputs."""
+        return []
+
+    def compute(self, data, inputs):
+        """
+        Return the intermediate for data. inputs maps each of
+        self.dependencies() to its computed value.
+        """
+        raise NotImplementedError("""
+            Must implement compute method. See docs for details.
+        """)
+
+
+class Column(Intermediate):
+    """A candle column, like Column('close')."""
+    def __init__(self, column):
+        super().__init__(column)
+        self.column = column
+
+    def compute(self, data, inputs):
+        return data[self.column]
+
+
+class RollingSum(Intermediate):
+    """Sum of a column over the last <window> candles."""
+    def __init__(self, column, window):
+        super().__init__(column, window)
+        self.column = column
+        self.window = window
+
+    def dependencies(self):
+        return [Column(self.column)]
+
+    def compute(self, data, inputs):
+        return inputs[Column(self.column)].rolling(self.window).sum()
+
+
+class RollingMean(Intermediate):
+    """Mean of a column over the last <window> candles."""
+    def __init__(self, column, window):
+        super().__init__(column, window)
+        self.column = column
+        self.window = window
+
+    def dependencies(self):
+        return [RollingSum(self.column, self.window)]
+
+    def compute(self, data, inputs):
+        return inputs[RollingSum(self.column, self.window)]/self.window
+
+
+class RollingStd(Intermediate):
+    """Sample standard deviation of a column over the last <window> candles."""
+    def __init__(self, column, window):
+        super().__init__(column, window)
+        self.column = column
+        self.window = window
+
+    def dependencies(self):
+        return [Column(self.column)]
+
+    def compute(self, data, inputs):
+        return inputs[Column(self.column)].rolling(self.window).std()
+
+
+class LogReturn(Intermediate):
+    """Log of the ratio of a column to its value one candle earlier."""
+    def __init__(self, column='close'):
+        super().__init__(column)
+        self.column = column
+
+    def dependencies(self):
+        return [Column(self.column)]
+
+    def compute(self, data, inputs):
+        log = np.log(inputs[Column(self.column)])
+        return log - log.shift(1)
+
+
+class TrueRange(Intermediate):
+    """
+    Greatest of high - low and the distances from the previous close to the
+    high and low. The first candle's true range is high - low.
+    """
+    def __init__(self):
+        super().__init__()
+
+    def dependencies(self):
+        return [Column('high'), Column('low'), Column('close')]
+
+    def compute(self, data, inputs):
+        high = inputs[Column('high')]
+        low = inputs[Column('low')]
+        previous = inputs[Column('close')].shift(1)
+
+        # fmax ignores the missing previous close of the first candle
+        true_range = np.fmax(high - low, (high - previous).abs())
+        return np.fmax(true_range, (low - previous).abs())
+
+
+def topological_order(specs):
+    """
+    Return specs and everything they depend on, each once, ordered so every
+    intermediate comes after its dependencies.
+    """
+    order = []
+    state = {}
+
+    def visit(spec, path):
+        if state.get(spec) == 'done':
+            return
+        if state.get(spec) == 'visiting':
+            cycle = ' -> '.join(repr(s) for s in path + [spec])
+            raise ImplementationError(f"""
+                Intermediates depend on each other in a cycle: {cycle}
+            """)
+
+        state[spec] = 'visiting'
+        for dependency in spec.dependencies():
+            visit(dependency, path + [spec])
+        state[spec] = 'done'
+        order.append(spec)
+
+    for spec in specs:
+        visit(spec, [])
+    return order
+
+
+def compute_intermediates(specs, data, cache=None):
+    """
+    Compute specs and their dependencies over data, each exactly once.
+
+    Parameters:
+    ---------------
+    specs: iterable of Intermediates
+
+    data: pandas.DataFrame | dict of pandas.DataFrames
+        Candles of a single symbol, or a panel like the one passed to
+        CustomIndicator.transform_panel.
+
+    cache: dict
+        Intermediates already computed over data. Updated in place.
+
+    Returns:
+    ---------------
+    cache: dict
+        Maps every intermediate computed to its value.
+    """
+    if cache is None:
+        cache = {}
+
+    for spec in topological_order(specs):
+        if spec not in cache:
+            inputs = {dep:cache[dep] for dep in spec.dependencies()}
+            cache[spec] = spec.compute(data, inputs)
+    return cache
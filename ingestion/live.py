@@ -2,69 +2,174 @@
 
 from datetime import datetime, timedelta
 
-from utils.toolbox import parse_datestring, DateConvert
+from utils.toolbox import parse_datestring, DateConvert, DateArrayConvert
 from utils.database import Database, CreateTable
 from utils import database as db
-from ingestion.core import insert_hourly_candles, engineer_data
-from ingestion.custom_indicators import CustomIndicator
+from ingestion.core import (
+    insert_missing_candles, engineer_data, engineer_incremental, engineer_sql
+)
+from ingestion.custom_indicators import get_indicators
+from ingestion.rollups import update_rollups
+from ingestion.events import bus, FeaturesEngineered
 from ingestion.custom_data import CustomData
 from exchanges.binance import BinanceData
+from config.data_collection import engineered_data_config
 
 
 def update_candles(debug=False):
     """
-    Insert candles from the most recent open_date in the database to
-    the current time.
+    Insert candles for each symbol from the end of its fetched coverage to
+    the current time, as planned from the candle_coverage ledger, then
+    update the higher-timeframe rollups.
     """
 
     symbols = db.get_symbols()
-    startTime = db.get_max_from_column(column='open_date')
 
     if debug:
-        return insert_hourly_candles(symbols, startTime=startTime, debug=True)
+        return insert_missing_candles(symbols, debug=True)
     else:
-        insert_hourly_candles(
-            symbols, startTime=startTime, debug=False, verbose=True
-        )
+        ranges = insert_missing_candles(symbols, debug=False, verbose=True)
 
+        # Only the bars containing new hours are recomputed
+        update_rollups(ranges)
 
-def insert_engineered_data(verbose = True):
+
+def on_candles_engineer(event):
+    """
+    Engineer newly inserted candles as soon as they arrive, from the candles
+    handed over by the event. Subscribed by the scheduler in event mode.
+    """
+    if event.db == 'autonotrader':
+        insert_engineered_data(verbose=False, candles=event.candles)
+
+
+def insert_engineered_data(verbose = True, incremental = True, workers = None,
+                           sql = None, store = None, candles = None):
+    """
+    Add custom indicators to new candles and insert them into
+    engineered_data, or into the long-format IndicatorStore. Rows computed
+    in Python are published as an ingestion.events.FeaturesEngineered event
+    once stored.
+
+    Parameters:
+    ---------------
+    incremental: boolean
+        True ---> compute only new candles from persisted indicator state,
+                  falling back to a full recompute if an indicator doesn't
+                  implement the incremental protocol.
+        False ---> recompute every indicator over its full window.
+
+    workers: int | None
+        Processes to partition symbols across when recomputing. None uses
+        config.data_collection.engineered_data_config['workers'].
+
+    sql: boolean | None
+        True ---> when recomputing, calculate indicators that declare
+                  get_sql inside MySQL with core.engineer_sql. None uses
+                  config.data_collection.engineered_data_config['sql_pushdown'].
+                  Only applies to the 'table' store.
+
+    store: string | None
+        'table' or 'long'. None uses
+        config.data_collection.engineered_data_config['store'].
+
+    candles: pandas.DataFrame | None
+        Newly inserted candles to engineer incrementally without reading
+        them back, see core.engineer_incremental.
+    """
 
     # Get indicators from subclasses
-    indicators = list(CustomIndicator.__subclasses__())
+    indicators = get_indicators()
+    names = [indicator.__name__ for indicator in indicators]
+
+    if store is None:
+        store = engineered_data_config['store']
+
+    if store == 'long':
+        table = db.IndicatorStore.values_table
+
+        # New indicators are just new names, no schema change
+        db.IndicatorStore().register(names)
+    else:
+        table = 'engineered_data'
 
-    # Get columns for comparison to incoming indicators
-    sql = 'SHOW COLUMNS IN engineered_data;'
-    candle_cols = list(Database().execute(sql).Field)
+        # Get columns for comparison to incoming indicators
+        columns = Database().execute('SHOW COLUMNS IN engineered_data;')
+        candle_cols = list(columns.Field)
 
-    # TODO add_column assumes
-    for indicator in indicators:
-        if indicator.__name__ not in candle_cols:
-            db.add_column('engineered_data', indicator.__name__, 'float(20,9)')
+        # TODO add_column assumes
+        for name in names:
+            if name not in candle_cols:
+                db.add_column('engineered_data', name, 'float(20,9)')
+
+    result = None
+    if incremental:
+        result = engineer_incremental(verbose=verbose, table=table,
+                                      candles=candles)
+
+    if result is not None:
+        ins, states = result
+        if not ins.empty:
+            _insert_engineered(ins, names, store, verbose)
+
+            # Only advance indicator state once its rows are stored
+            if states:
+                db.IndicatorState().save(states)
+            bus.publish(FeaturesEngineered(ins))
+        return
 
     # Get starting date for insert
-    from_date = db.get_max_from_column(
-        table='engineered_data', column='open_date')
+    from_date = db.get_max_from_column(table=table, column='open_date')
 
     # If there's nothing in the table, populate the entire thing
     if not from_date:
         from_date = db.get_min_from_column(column='open_date')
 
-    ins = engineer_data(from_date=from_date, verbose=verbose)
+    if sql is None:
+        sql = engineered_data_config['sql_pushdown']
+    sql = sql and store != 'long'
 
-    # Convert to sql-friendly dates
-    convert_to_sql = lambda x: DateConvert(x).date
-    ins.open_date = ins.open_date.map(convert_to_sql)
-    ins.close_date = ins.close_date.map(convert_to_sql)
+    # Only ship candles to Python for indicators without a SQL form
+    if not sql or not all(i.get_sql() for i in indicators):
+        ins = engineer_data(from_date=from_date, verbose=verbose,
+                            workers=workers, sql=sql)
+        _insert_engineered(ins, names, store, verbose)
+
+        # Rows missing the SQL indicators aren't published
+        if not sql and not ins.empty:
+            bus.publish(FeaturesEngineered(ins))
 
+    if sql:
+        pushdown = engineer_sql(from_date, indicators)
+        if pushdown:
+            if verbose:
+                print('Calculating SQL indicators in the database...')
+            Database().write(pushdown)
+
+
+def _insert_engineered(ins, names, store='table', verbose=False):
     if verbose:
         print('Inserting engineered data into database...')
 
+    if store == 'long':
+        names = [name for name in names if name in ins.columns]
+        db.IndicatorStore().save(ins, names)
+        return
+
+    # Convert to sql-friendly dates
+    ins.open_date = DateArrayConvert(ins.open_date).date
+    ins.close_date = DateArrayConvert(ins.close_date).date
+
     Database().insert('engineered_data', ins, verbose=verbose, auto_format=True)
 
 
-def insert_custom_data(verbose=False):
-    datasources = list(CustomData.__subclasses__())
+def insert_custom_data(verbose=False, datasources=None):
+    '''
+    Collect and insert custom data sources, every CustomData subclass by
+    default or the given list of subclasses.
+    '''
+    if datasources is None:
+        datasources = list(CustomData.__subclasses__())
 
     for datasource in datasources:
         d = datasource()
@@ -7,6 +7,7 @@ import logging
 
 from utils import toolbox as tb
 from utils.database import get_symbols, Database
+from utils.instrumentation import profiler
 from ingestion import live, core
 from bot import base
 
@@ -20,9 +21,15 @@ logger = logging.getLogger(__name__)
 
 
 class Tasks:
+    """
+    Ingestion tasks that log their errors instead of raising them, unless
+    raise_errors is set, like when run by ingestion.scheduler.Scheduler,
+    which counts failed runs.
+    """
 
-    def __init__(self):
+    def __init__(self, raise_errors=False):
         self.symbols = get_symbols()
+        self.raise_errors = raise_errors
 
     # TODO Get working with new file structure
     def insert_ticker(self, verbose=False):
@@ -34,6 +41,10 @@ class Tasks:
         except Exception as err:
             logger.error('insert_ticker failed')
             logger.error(err)
+            if self.raise_errors:
+                raise
+        finally:
+            profiler.dump(label='insert_ticker')
 
     def insert_candles(self, verbose=False):
         try:
@@ -43,6 +54,10 @@ class Tasks:
         except Exception as err:
             logger.error(f'Insert_candle failed')
             logger.error(err)
+            if self.raise_errors:
+                raise
+        finally:
+            profiler.dump(label='insert_candles')
 
 
     def insert_engineered_features(self, verbose=False):
@@ -53,16 +68,24 @@ class Tasks:
         except Exception as err:
             logger.error('Insert_engineered_features failed.')
             logger.error(err)
+            if self.raise_errors:
+                raise
+        finally:
+            profiler.dump(label='insert_engineered_features')
 
 
-    def insert_custom_data(self, verbose=False):
+    def insert_custom_data(self, verbose=False, datasources=None):
         try:
             if verbose:
                 print('Inserting custom data sources.')
-            live.insert_custom_data(verbose=verbose)
+            live.insert_custom_data(verbose=verbose, datasources=datasources)
         except Exception as err:
             logger.error('insert_custom_data failed.')
             logger.error(err)
+            if self.raise_errors:
+                raise
+        finally:
+            profiler.dump(label='insert_custom_data')
 
 
     # TODO Setup metrics SQL table
@@ -91,6 +114,10 @@ class Tasks:
         except Exception as err:
             logger.error('Backtest process failed.')
             logger.error(err)
+            if self.raise_errors:
+                raise
+        finally:
+            profiler.dump(label='run_backtest')
 
 
     def repair_data(self, verbose = False):
@@ -101,3 +128,7 @@ class Tasks:
         except Exception as err:
             logger.error('Backtest process failed.')
             logger.error(err)
+            if self.raise_errors:
+                raise
+        finally:
+            profiler.dump(label='repair_data')
@@ -0,0 +1,248 @@
+"""
+Concurrent ingestion pipelines. Each stage runs in its own thread and hands
+its output to the next stage through a bounded queue, so network and
+database time overlap and a slow stage applies backpressure upstream.
+"""
+
+import threading
+import pandas as pd
+from queue import Queue, Empty, Full
+
+from utils import toolbox as tb
+from utils.database import Database
+from ingestion.coverage import candle_ranges
+from config.data_collection import ingestion_pipeline_config
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+class Stage:
+    """
+    A step of a Pipeline. process is called with every item produced by the
+    previous stage and returns an iterable of items to pass on, flush is
+    called once after the previous stage is exhausted.
+    """
+    def process(self, item):
+        return [item]
+
+    def flush(self):
+        return []
+
+
+class Pipeline:
+    """
+    Run a source iterable and a sequence of stages concurrently.
+
+    Parameters:
+    ------------
+    source: iterable
+        Produces the items fed to the first stage. Iterated in its own thread.
+
+    stages: list of Stage objects
+
+    queue_size: int
+        Max items waiting between two stages.
+    """
+
+    def __init__(self, source, stages,
+                       queue_size = ingestion_pipeline_config['queue_size']):
+        self.source = source
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self):
+        """
+        Run the pipeline to completion. The first exception raised by any
+        stage stops every stage and is re-raised here.
+
+        Returns:
+        ------------
+        output: list
+            Items produced by the last stage.
+        """
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._error = None
+        output = []
+
+        queues = [Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = [threading.Thread(target=self._produce, args=(queues[0],))]
+        for i, stage in enumerate(self.stages):
+            out = queues[i+1] if i+1 < len(queues) else None
+            threads.append(threading.Thread(
+                target=self._consume, args=(stage, queues[i], out, output)
+                ))
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._error is not None:
+            raise self._error
+        return output
+
+    def _fail(self, err):
+        with self._lock:
+            if self._error is None:
+                self._error = err
+        self._stop.set()
+
+    def _put(self, queue, item):
+        # Poll so a blocked stage notices when another stage fails
+        while not self._stop.is_set():
+            try:
+                queue.put(item, timeout=.1)
+                return
+            except Full:
+                continue
+
+    def _get(self, queue):
+        while not self._stop.is_set():
+            try:
+                return queue.get(timeout=.1)
+            except Empty:
+                continue
+        return _DONE
+
+    def _emit(self, items, out, output):
+        for item in items:
+            if out is None:
+                output.append(item)
+            else:
+                self._put(out, item)
+
+    def _produce(self, out):
+        try:
+            for item in self.source:
+                if self._stop.is_set():
+                    break
+                self._put(out, item)
+        except Exception as err:
+            self._fail(err)
+        finally:
+            self._put(out, _DONE)
+
+    def _consume(self, stage, queue, out, output):
+        try:
+            while True:
+                item = self._get(queue)
+                if item is _DONE:
+                    break
+                self._emit(stage.process(item), out, output)
+
+            if not self._stop.is_set():
+                self._emit(stage.flush(), out, output)
+        except Exception as err:
+            self._fail(err)
+        finally:
+            if out is not None:
+                self._put(out, _DONE)
+
+
+class NormalizeCandles(Stage):
+    """
+    Convert a fetched (request, candles) page to consistent types: date
+    strings, numeric prices and volumes, sorted by symbol and open_date with
+    duplicate rows dropped.
+    """
+    dates = ['open_date', 'close_date']
+
+    def process(self, item):
+        request, candles = item
+
+        # Single candles may come back as a Series
+        if isinstance(candles, pd.Series):
+            candles = candles.to_frame().T
+        if candles is None or candles.empty:
+            return []
+
+        candles = candles.copy()
+        for column in candles.columns:
+            if column in self.dates:
+                candles[column] = tb.DateArrayConvert(candles[column]).date
+            elif column != 'symbol':
+                candles[column] = pd.to_numeric(candles[column], errors='coerce')
+
+        candles = candles.drop_duplicates(['symbol', 'open_date'])
+        return [candles.sort_values(['symbol', 'open_date'])]
+
+
+class DedupeCandles(Stage):
+    """
+    Drop candles already passed on by an earlier page, like the candle shared
+    by two consecutive date-range chunks. Pages of a symbol are expected in
+    chronological order, so a per-symbol high-water mark is enough.
+    """
+    def __init__(self):
+        self.watermarks = {}
+
+    def process(self, candles):
+        marks = candles.symbol.map(self.watermarks).fillna('')
+        candles = candles[(candles.open_date > marks).values]
+        if candles.empty:
+            return []
+
+        self.watermarks.update(candles.groupby('symbol').open_date.max())
+        return [candles]
+
+
+class CandleRanges(Stage):
+    """
+    Collect the [start, end) ranges of the candles passing through, so
+    short or empty pages only cover the hours they actually returned.
+    """
+    def __init__(self):
+        self.frames = []
+
+    def process(self, candles):
+        self.frames.append(candle_ranges(candles))
+        return [candles]
+
+    def ranges(self):
+        """Merged ranges of every candle seen, columns 'symbol', 'start', 'end'."""
+        if not self.frames:
+            return tb.merge_ranges(pd.DataFrame())
+        return tb.merge_ranges(pd.concat(self.frames))
+
+
+class InsertFrames(Stage):
+    """
+    Accumulate DataFrames and bulk insert them into a table once
+    batch_rows rows have built up, and once more on flush. With upsert,
+    rows overwrite existing rows with the same unique key. With pass_on,
+    every frame is also passed on, so the pipeline returns what it inserted.
+    """
+    def __init__(self, table, db = 'autonotrader',
+                 batch_rows = ingestion_pipeline_config['insert_batch_rows'],
+                 upsert = False, pass_on = False):
+        self.table = table
+        self.db = db
+        self.upsert = upsert
+        self.pass_on = pass_on
+        self.batch_rows = batch_rows
+        self.frames = []
+        self.num_rows = 0
+        self.inserted = 0
+
+    def _insert(self):
+        if self.frames:
+            ins = tb.format_frame(pd.concat(self.frames))
+            Database(db=self.db).insert(self.table, ins, auto_format=False,
+                                        upsert=self.upsert)
+            self.inserted += self.num_rows
+        self.frames = []
+        self.num_rows = 0
+
+    def process(self, frame):
+        self.frames.append(frame)
+        self.num_rows += len(frame)
+        if self.num_rows >= self.batch_rows:
+            self._insert()
+        return [frame] if self.pass_on else []
+
+    def flush(self):
+        self._insert()
+        return []
@@ -0,0 +1,184 @@
+"""
+Higher-timeframe candles rolled up from hourly candles.
+
+Each interval in config.data_collection.rollup_config is kept in its own
+table, candles_<interval>, with the same columns as candles plus the number
+of hourly candles in each bar. Bars are aligned to multiples of the interval
+since the epoch, so 4h bars open at 00:00, 04:00, ... UTC. After each
+candle update only the bars containing newly inserted hours are
+recomputed and upserted.
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils import toolbox as tb
+from utils.database import Database
+from config.data_collection import rollup_config
+
+
+SUMS = ['volume', 'quote_asset_volume', 'number_of_trades',
+        'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume']
+
+
+def rollup_table(interval):
+    """Name of the rollup table of an interval like '4h'."""
+    return f'candles_{interval}'
+
+
+def create_rollup_table(interval, db='autonotrader'):
+    """Create the rollup table of an interval if it doesn't exist."""
+    Database(db=db).write(f"""
+        CREATE TABLE IF NOT EXISTS `{rollup_table(interval)}` (
+           `id` int(11) NOT NULL AUTO_INCREMENT,
+           `symbol` varchar(20),
+           `open_date` datetime,
+           `open` float(20,9),
+           `high` float(20,9),
+           `low` float(20,9),
+           `close` float(20,9),
+           `volume` float(20,9),
+           `close_date` datetime,
+           `quote_asset_volume` float(20,9),
+           `number_of_trades` int(11),
+           `taker_buy_base_asset_volume` float(20,9),
+           `taker_buy_quote_asset_volume` float(20,9),
+           `num_candles` int(11),
+           PRIMARY KEY (`id`),
+           UNIQUE KEY `stamp` (`open_date`,`symbol`)
+        );""")
+
+
+def bucket_ranges(ranges, interval):
+    """
+    Widen [start, end) ranges of hourly open dates to the whole bars of
+    <interval> that contain them, merging ranges that share a bar.
+
+    Parameters:
+    ---------------
+    ranges: pandas.DataFrame
+        Columns 'symbol', 'start', 'end'.
+
+    interval: string
+        Like '4h' or '1d'.
+    """
+    if ranges.empty:
+        return pd.DataFrame(columns=['symbol', 'start', 'end'])
+
+    step = int(pd.Timedelta(interval).total_seconds())
+    start = tb.DateArrayConvert(ranges.start).timestamp
+    end = tb.DateArrayConvert(ranges.end).timestamp
+
+    widened = pd.DataFrame({
+        'symbol':ranges.symbol.values,
+        'start':(start//step*step).astype('datetime64[s]'),
+        'end':(-(-end//step)*step).astype('datetime64[s]')
+        })
+    return tb.merge_ranges(widened)
+
+
+def aggregate_candles(candles, interval):
+    """
+    Aggregate hourly candles of any number of symbols into bars of
+    <interval> in one grouped pass: first open, highest high, lowest low,
+    last close and summed volumes.
+
+    Parameters:
+    ---------------
+    candles: pandas.DataFrame
+        Hourly candles, in any order.
+
+    interval: string
+        Like '4h' or '1d'.
+
+    Returns:
+    ---------------
+    bars: pandas.DataFrame
+        One row per symbol and bar, with the columns of candles and
+        num_candles, the number of hourly candles with a close in the bar.
+    """
+    step = int(pd.Timedelta(interval).total_seconds())
+    candles = candles.sort_values(['symbol', 'open_date'])
+    seconds = tb.DateArrayConvert(candles.open_date).timestamp
+    bucket = pd.Series(seconds//step*step, index=candles.index, name='bucket')
+
+    aggregations = dict(open='first', high='max', low='min', close='last')
+    aggregations.update({c:'sum' for c in SUMS if c in candles.columns})
+    if 'close_date' in candles.columns:
+        aggregations['close_date'] = 'last'
+
+    groups = candles.groupby([candles.symbol, bucket], sort=False)
+    bars = groups.agg(aggregations)
+    bars['num_candles'] = groups.close.count()
+    bars = bars.reset_index()
+
+    bars['open_date'] = bars.bucket.values.astype('int64') \
+                                          .astype('datetime64[s]')
+    columns = ['symbol', 'open_date'] + list(aggregations) + ['num_candles']
+    return bars[columns]
+
+
+def update_rollups(ranges=None, intervals=None, db='autonotrader'):
+    """
+    Recompute and upsert the bars containing the given hourly candles.
+
+    Parameters:
+    ---------------
+    ranges: pandas.DataFrame | None
+        Columns 'symbol', 'start', 'end' giving [start, end) ranges of
+        newly inserted hourly open dates, like the output of
+        ingestion.core.insert_missing_candles. None rebuilds every bar.
+
+    intervals: list of strings
+        Defaults to rollup_config['intervals'].
+
+    Returns:
+    ---------------
+    rows: dict
+        Number of bars upserted for each interval.
+    """
+    if intervals is None:
+        intervals = rollup_config['intervals']
+
+    if ranges is None:
+        ranges = Database(db=db).execute(
+            'SELECT symbol, MIN(open_date) AS start, MAX(open_date) AS end ' +
+            'FROM candles GROUP BY symbol;'
+            )
+        if not ranges.empty:
+            ranges.end = pd.to_datetime(ranges.end) + pd.Timedelta(hours=1)
+
+    rows = {}
+    for interval in intervals:
+        create_rollup_table(interval, db=db)
+        buckets = bucket_ranges(ranges, interval)
+
+        rows[interval] = 0
+        for chunk in tb.chunker(buckets, rollup_config['ranges_per_query']):
+            candles = _read_ranges(chunk, db=db)
+            if candles.empty:
+                continue
+
+            bars = aggregate_candles(candles, interval)
+            rows[interval] += len(bars)
+            Database(db=db).insert(
+                rollup_table(interval), tb.format_frame(bars),
+                auto_format=False, upsert=True
+                )
+    return rows
+
+
+def _read_ranges(ranges, db='autonotrader'):
+    """Read hourly candles in each symbol's [start, end) range in one query."""
+    conditions = ' OR '.join(
+        f"(symbol = '{symbol}' AND " +
+        f"open_date >= '{tb.DateConvert(start).date}' AND " +
+        f"open_date < '{tb.DateConvert(end).date}')"
+        for symbol, start, end in zip(ranges.symbol, ranges.start, ranges.end)
+        )
+    candles = Database(db=db).execute(
+        f'SELECT * FROM candles WHERE {conditions};'
+        )
+    if candles.empty:
+        return candles
+    return candles.drop('id', axis=1, errors='ignore')
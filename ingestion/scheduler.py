@@ -0,0 +1,257 @@
+"""
+Long running scheduler for ingestion tasks.
+
+Started once with `python main.py scheduler` instead of starting main.py
+from cron for every task, so imports, exchange clients, symbols and database
+connections are set up once. Tasks run on a thread pool at the schedules in
+config.data_collection.scheduler_config, and every CustomData source runs at
+its own automation_frequency. Independent tasks run concurrently, but a task
+is never started while its previous run is still going.
+
+In event mode, engineered data isn't scheduled. It is built from each
+candle insert as soon as it happens, through ingestion.events.
+"""
+
+import time
+import logging
+import threading
+from functools import partial
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utils import database
+from ingestion.events import bus, CandlesInserted
+from config.data_collection import scheduler_config
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """
+    A function run every <frequency>, at multiples of frequency since the
+    epoch plus <offset>, with timing of its runs.
+
+    Parameters:
+    ---------------
+    name: string
+
+    function: callable
+        Called without arguments.
+
+    frequency: timedelta | string
+        Like timedelta(hours=1) or '1h'.
+
+    offset: timedelta | string
+        Like timedelta(minutes=5) or '5min'.
+    """
+    def __init__(self, name, function, frequency, offset=timedelta(0)):
+        self.name = name
+        self.function = function
+        self.frequency = pd.Timedelta(frequency).to_pytimedelta()
+        self.offset = pd.Timedelta(offset).to_pytimedelta()
+        if self.frequency <= timedelta(0):
+            raise ValueError(f'Job {name} needs a positive frequency.')
+
+        self.next_run = None
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_start = None
+        self.last_duration = None
+        self.total_duration = 0
+        self.max_duration = 0
+
+    def __repr__(self):
+        return f'Job({self.name!r}, every {self.frequency}, next {self.next_run})'
+
+    def schedule(self, now):
+        """Set next_run to the first scheduled time after now."""
+        epoch = datetime(1970, 1, 1) + self.offset
+        periods = (now - epoch)//self.frequency + 1
+        self.next_run = epoch + periods*self.frequency
+
+    def record(self, start, duration, failed):
+        self.runs += 1
+        self.failures += failed
+        self.last_start = start
+        self.last_duration = duration
+        self.total_duration += duration
+        self.max_duration = max(self.max_duration, duration)
+
+
+class Scheduler:
+    """
+    Run Jobs on a thread pool at their scheduled times.
+
+    Parameters:
+    ---------------
+    jobs: list of Jobs
+
+    workers: int
+        Maximum number of jobs run concurrently.
+
+    poll_seconds: int
+        Seconds between checks for due jobs in run_forever.
+
+    reuse_connections: boolean
+        Keep a database connection per worker thread between runs.
+    """
+    def __init__(self, jobs=None, workers=None, poll_seconds=None,
+                       reuse_connections=None):
+        if workers is None:
+            workers = scheduler_config['workers']
+        if poll_seconds is None:
+            poll_seconds = scheduler_config['poll_seconds']
+        if reuse_connections is None:
+            reuse_connections = scheduler_config['reuse_connections']
+
+        self.jobs = {}
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.reuse_connections = reuse_connections
+        self.executor = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        for job in jobs or []:
+            self.add(job)
+
+    @classmethod
+    def from_config(cls, verbose=False):
+        """
+        Create a Scheduler with the tasks in scheduler_config and a job for
+        each CustomData source, sharing a single Tasks instance. In event
+        mode, engineered data is subscribed to candle inserts instead.
+        """
+        from ingestion import live
+        from ingestion.manager import Tasks
+        from ingestion.custom_data import CustomData
+
+        # Errors reach _run_job, so failed runs are counted
+        tasks = Tasks(raise_errors=True)
+        jobs = []
+        for name, schedule in scheduler_config['tasks'].items():
+            if scheduler_config['events'] and \
+               name == 'insert_engineered_features':
+                continue
+            function = partial(getattr(tasks, name), verbose=verbose)
+            jobs.append(Job(name, function, schedule['frequency'],
+                            schedule.get('offset', timedelta(0))))
+
+        offset = scheduler_config['custom_data_offset']
+        if offset is not None:
+            for datasource in CustomData.__subclasses__():
+                function = partial(tasks.insert_custom_data, verbose=verbose,
+                                   datasources=[datasource])
+                frequency = datasource().automation_frequency
+                jobs.append(Job(f'custom_data:{datasource.__name__}',
+                                function, frequency, offset))
+
+        if scheduler_config['events']:
+            bus.subscribe(CandlesInserted, live.on_candles_engineer)
+
+        return cls(jobs)
+
+    def add(self, job):
+        if job.name in self.jobs:
+            raise ValueError(f'There is already a job named {job.name}.')
+        self.jobs[job.name] = job
+
+    def run_pending(self, now=None):
+        """
+        Start every job that is due at <now> and isn't running. A due job
+        whose previous run is still going is skipped until its next slot.
+
+        Returns:
+        ---------------
+        started: list of strings
+            Names of the jobs started.
+        """
+        if now is None:
+            now = datetime.utcnow()
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        started = []
+        with self._lock:
+            for job in self.jobs.values():
+                if job.next_run is None:
+                    job.schedule(now)
+                if job.next_run > now:
+                    continue
+
+                job.schedule(now)
+                if job.running:
+                    job.skipped += 1
+                    logger.warning(f'{job.name} is still running, skipped.')
+                    continue
+
+                job.running = True
+                self.executor.submit(self._run_job, job)
+                started.append(job.name)
+        return started
+
+    def _run_job(self, job):
+        if self.reuse_connections:
+            database.reuse_connections()
+
+        start = datetime.utcnow()
+        clock = time.perf_counter()
+        failed = False
+        try:
+            job.function()
+        except Exception as err:
+            failed = True
+            logger.error(f'{job.name} failed.')
+            logger.error(err)
+        finally:
+            with self._lock:
+                job.record(start, time.perf_counter() - clock, failed)
+                job.running = False
+
+    def run_forever(self):
+        """Check for due jobs every poll_seconds until stop is called."""
+        for job in self.jobs.values():
+            job.schedule(datetime.utcnow())
+            logger.info(f'Scheduled {job}')
+
+        while not self._stop.is_set():
+            self.run_pending()
+            self._stop.wait(self.poll_seconds)
+
+        self.shutdown()
+
+    def stop(self):
+        self._stop.set()
+
+    def shutdown(self, wait=True):
+        """Wait for running jobs and stop the thread pool."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+
+    def get_stats(self):
+        """
+        Return a DataFrame with one row per job: runs, failures, skipped
+        runs, last start, last, mean and max duration in seconds, and the
+        next scheduled run.
+        """
+        with self._lock:
+            rows = [dict(
+                name=job.name,
+                runs=job.runs,
+                failures=job.failures,
+                skipped=job.skipped,
+                last_start=job.last_start,
+                last_duration=job.last_duration,
+                mean_duration=job.total_duration/job.runs if job.runs else None,
+                max_duration=job.max_duration,
+                next_run=job.next_run
+                ) for job in self.jobs.values()]
+
+        columns = ['name', 'runs', 'failures', 'skipped', 'last_start',
+                   'last_duration', 'mean_duration', 'max_duration', 'next_run']
+        return pd.DataFrame(rows, columns=columns)
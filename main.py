@@ -1,6 +1,7 @@
 from sys import argv
 import logging
 from ingestion.manager import Tasks
+from ingestion.scheduler import Scheduler
 
 # Set up logging
 logging.basicConfig(filename = './data/logs/main.log',
@@ -35,6 +36,15 @@ def main():
         Tasks().repair_data(verbose=verbose)
         logger.info('Sucessfully ran repair process')
 
+    # Long running replacement for starting each task above from cron
+    if 'scheduler' in args:
+        scheduler = Scheduler.from_config(verbose=verbose)
+        try:
+            scheduler.run_forever()
+        finally:
+            scheduler.shutdown()
+            logger.info('Scheduler stopped\n' + scheduler.get_stats().to_string())
+
 
 if __name__ == '__main__':
     try:
@@ -1,9 +1,16 @@
+import asyncio
 import numpy as np
 import pandas as pd
-from exchanges.base import ExchangeData, ExchangeOrders
+from exchanges.base import (
+    ExchangeData, ExchangeOrders, AsyncExchangeData, SyncExchangeData
+)
+from time import monotonic, sleep
 from exchanges.binance import (
-    BinanceData, BinanceOrders, check_binance_server_time_diff
+    BinanceData, BinanceOrders, check_binance_server_time_diff, get_client,
+    AsyncBinanceData
 )
+from ingestion.core import fetch_candles
+from exchanges.ratelimit import WeightLimiter, binance_weight
 
 
 class TestData:
@@ -91,3 +98,85 @@ class TestBaseClass:
 def test_server_time():
     diff = check_binance_server_time_diff(verbose=False, ret=True)
     assert np.abs(sum(diff)) < 1000, 'Binance server time dissagreement'
+
+
+class TestRateLimit:
+
+    def test_weights(self):
+        uri = 'https://api.binance.com/api/v1/'
+        assert binance_weight(uri + 'klines', {'symbol':'BTCUSDT'}) == 1
+        assert binance_weight(uri + 'ticker/price', {}) == 2
+        assert binance_weight(uri + 'ticker/price', {'symbol':'BTCUSDT'}) == 1
+        assert binance_weight(uri + 'order/test', {'symbol':'BTCUSDT'}) == 1
+
+    def test_limiter_rate(self):
+        config = dict(weight_per_minute=600, safety_margin=1,
+                      max_retries=1, default_backoff=1)
+        limiter = WeightLimiter(config)
+
+        start = monotonic()
+        for i in range(605):
+            limiter.acquire(1)
+        assert .4 < monotonic() - start < 1
+
+        limiter.backoff(.5)
+        start = monotonic()
+        limiter.acquire(1)
+        assert monotonic() - start >= .5
+
+    def test_shared_client(self):
+        assert BinanceData().client is BinanceOrders().client is get_client()
+
+
+class TestAsync:
+
+    def test_async_candle(self):
+        symbol = 'BTCUSDT'
+        start = '2018-09-10 12:00:00'
+        end = '2018-09-11 12:00:00'
+
+        datasource = SyncExchangeData(AsyncBinanceData())
+        async_candles = datasource.candle(symbol, startTime=start, endTime=end)
+        datasource.close()
+
+        sync_candles = BinanceData().candle(symbol, startTime=start, endTime=end)
+        assert async_candles.equals(sync_candles)
+
+    def test_fetch_order(self):
+        class Delayed(AsyncExchangeData):
+            async def candle(self, symbol, limit=None, startTime=None,
+                             endTime=None):
+                await asyncio.sleep(.2 - limit/1000)
+                return limit
+
+        requests = [{'symbol':'BTCUSDT', 'limit':i} for i in range(100)]
+        start = monotonic()
+        results = list(fetch_candles(Delayed(), requests))
+
+        # All requests were in flight at once, results arrive in order
+        assert monotonic() - start < 1
+        assert [r for _, r in results] == list(range(100))
+
+
+class TestFetchCandles:
+
+    def test_order_and_window(self):
+        started = []
+
+        class Delayed(ExchangeData):
+            def candle(self, symbol, limit=None, startTime=None, endTime=None):
+                started.append(limit)
+                sleep(.05 - limit/1000)
+                return limit
+
+        workers = 4
+        requests = [{'symbol':'BTCUSDT', 'limit':i} for i in range(40)]
+        results = []
+        for request, candles in fetch_candles(Delayed(), requests, workers):
+            # Requests run at most 2*workers ahead of the consumer
+            assert len(started) <= len(results) + 2*workers
+            assert candles == request['limit']
+            results.append(candles)
+
+        # Later requests finish first, results still arrive in order
+        assert results == list(range(40))
@@ -1,5 +1,8 @@
+import pandas as pd
 from unittest import TestCase
-from bot.base import DataEngine
+from bot.base import DataEngine, StreamingDataEngine, DataFeed
+from utils.toolbox import chunker
+from errors.exceptions import ImplementationError
 from datetime import datetime, timedelta
 
 class TestDataEngine(TestCase):
@@ -21,3 +24,119 @@ class TestDataEngine(TestCase):
         e.reset_index()
         self.assertTrue((e[0] == e.data.iloc[0]).all())
         self.assertTrue((e[:10] == e.data.iloc[:10]).all().all())
+
+
+class TestTimeframe(TestCase):
+
+    def setUp(self):
+        dates = pd.date_range('2018-09-01 02:00', periods=30, freq='1H')
+        self.data = pd.DataFrame({'open_date':dates, 'open':range(30),
+                                  'high':range(1, 31), 'low':range(-1, 29),
+                                  'close':range(30)})
+        self.data.index = self.data.open_date
+
+    def test_completed_bars_only(self):
+        e = DataEngine(self.data, timeframes=['4h'])
+        t = e.timeframe('4h')
+
+        # The first bar, 00:00-04:00, completes with the 03:00 candle
+        self.assertEqual(len(t), 0)
+        self.assertIsNone(t[0])
+        e.increment()
+        self.assertEqual(len(t), 1)
+        self.assertEqual(t[0].close, 1)
+        self.assertEqual(t[0].num_candles, 2)
+
+        for _ in range(6):
+            e.increment()
+        self.assertEqual(len(t), 2)
+        self.assertEqual(t[0].high, 6)
+        self.assertIsNone(t[1])
+        self.assertEqual(list(t.values('close', 7)), [1, 5])
+
+        # The 08:00 bar in progress covers 08:00 and 09:00 so far
+        self.assertEqual(t.current.open, 6)
+        self.assertEqual(t.current.high, 8)
+        self.assertEqual(t.current.close, 7)
+
+    def test_undeclared_timeframe(self):
+        e = DataEngine(self.data)
+        with self.assertRaises(ImplementationError):
+            e.timeframe('1d')
+
+
+class TestStreamingDataEngine(TestCase):
+
+    def setUp(self):
+        dates = pd.date_range('2018-09-01', periods=30, freq='1H')
+        self.data = pd.DataFrame({'open_date':dates, 'close':range(30)})
+        self.data.index = self.data.open_date
+
+    def test_bounded_window(self):
+        e = StreamingDataEngine(lookback=5)
+        for chunk in chunker(self.data, 10):
+            e.append(chunk)
+            while e.increments < e.length - 1:
+                e.increment()
+                self.assertEqual(e[0].close, e.increments)
+                if e.increments >= 5:
+                    self.assertEqual(e[-5].close, e.increments - 5)
+                self.assertTrue(len(e.data) <= 5 + 1 + 10)
+
+        self.assertEqual(e.initial_close, 0)
+        self.assertEqual(e.final_close, 29)
+
+
+class ListFeed(DataFeed):
+    """DataFeed over a list of chunks instead of the database."""
+    def __init__(self, chunks):
+        self.chunks = chunks
+        super().__init__({'stream':{'lookback':5}}, ['A','B','C'])
+
+    def _summarize(self):
+        dates = pd.concat(self.chunks).open_date
+        return dates.min(), dates.max(), dates.nunique()
+
+    def _read_chunks(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class TestDataFeed(TestCase):
+
+    def candles(self, symbol, start, periods):
+        dates = pd.date_range(start, periods=periods, freq='1H')
+        return pd.DataFrame({'symbol':symbol, 'open_date':dates,
+                             'close':range(len(dates))})
+
+    def test_symbols_missing_from_chunks(self):
+        # B starts in the second chunk, C is missing from it
+        chunks = [
+            pd.concat([self.candles('A', '2018-09-01 00:00', 10),
+                       self.candles('C', '2018-09-01 00:00', 10)]),
+            pd.concat([self.candles('A', '2018-09-01 10:00', 10),
+                       self.candles('B', '2018-09-01 15:00', 5)]),
+            pd.concat([self.candles('A', '2018-09-01 20:00', 10),
+                       self.candles('B', '2018-09-01 20:00', 10),
+                       self.candles('C', '2018-09-01 20:00', 10)])
+            ]
+
+        feed = ListFeed(chunks)
+        feed.load_next()
+        self.assertEqual(sorted(feed.engines), ['A','C'])
+
+        seen = {'A':[], 'B':[], 'C':[]}
+        while not all(e.finished for e in list(feed.engines.values())):
+            for symbol in ['A','B','C']:
+                engine = feed.engines.get(symbol)
+                if engine is None or engine.finished or engine.waiting:
+                    continue
+                seen[symbol].append(engine[0].open_date)
+                engine.increment()
+
+        for symbol in seen:
+            expected = pd.concat(chunks)
+            expected = expected[expected.symbol == symbol].open_date
+            self.assertEqual(seen[symbol], list(expected))
+
+        self.assertEqual(feed.engines['C'].initial_close, 0)
@@ -0,0 +1,97 @@
+import pandas as pd
+from datetime import timedelta
+from ingestion.coverage import (
+    missing_ranges, fetch_ranges, page_requests, current_hour,
+    candle_ranges, in_ranges
+)
+
+d = pd.Timestamp
+
+
+def coverage():
+    return pd.DataFrame({
+        'symbol':['BTCUSDT', 'BTCUSDT', 'ETHUSDT'],
+        'start':[d('2018-01-01'), d('2018-01-05'), d('2018-01-02')],
+        'end':[d('2018-01-03'), d('2018-01-06'), d('2018-01-04')]
+        })
+
+
+class TestCoverage:
+
+    def test_holes_within_window(self):
+        missing = missing_ranges(coverage(), ['BTCUSDT', 'ETHUSDT'],
+                                 end=d('2018-01-07'), start=d('2018-01-01'))
+
+        expected = [('BTCUSDT', d('2018-01-03'), d('2018-01-05')),
+                    ('BTCUSDT', d('2018-01-06'), d('2018-01-07')),
+                    ('ETHUSDT', d('2018-01-01'), d('2018-01-02')),
+                    ('ETHUSDT', d('2018-01-04'), d('2018-01-07'))]
+        assert list(missing.itertuples(index=False, name=None)) == expected
+
+    def test_tail_from_watermarks(self):
+        missing = missing_ranges(coverage(), ['BTCUSDT', 'ETHUSDT', 'XRPBTC'],
+                                 end=d('2018-01-07'),
+                                 default_start=d('2018-01-06 12:00'))
+
+        # Each symbol resumes from its own coverage, new symbols from default
+        assert list(missing.start) == [d('2018-01-06'), d('2018-01-04'),
+                                       d('2018-01-06 12:00')]
+        assert (missing.end == d('2018-01-07')).all()
+
+    def test_pages(self):
+        missing = pd.DataFrame({'symbol':['BTCUSDT'],
+                                'start':[d('2018-01-01')],
+                                'end':[d('2018-01-01') + timedelta(hours=1200)]})
+        requests = list(page_requests(missing))
+
+        assert len(requests) == 3
+        assert requests[0]['endTime'] - requests[0]['startTime'] == \
+            timedelta(hours=499)
+        assert requests[-1]['endTime'] == d('2018-01-01') + timedelta(hours=1199)
+
+        # Requests cover exactly what was planned
+        assert requests[0]['startTime'] == d('2018-01-01')
+
+    def test_fetch_ranges_merge_nearby_gaps(self):
+        hour = timedelta(hours=1)
+        start = d('2018-01-01')
+        missing = pd.DataFrame({
+            'symbol':['BTCUSDT']*3 + ['ETHUSDT'],
+            'start':[start, start + 100*hour, start + 700*hour, start],
+            'end':[start + 3*hour, start + 101*hour, start + 1300*hour,
+                   start + hour]
+            })
+        ranges = fetch_ranges(missing)
+
+        # The first two gaps fit in one page, the long gap stays separate
+        assert list(ranges.itertuples(index=False, name=None)) == [
+            ('BTCUSDT', start, start + 101*hour),
+            ('BTCUSDT', start + 700*hour, start + 1300*hour),
+            ('ETHUSDT', start, start + hour)
+            ]
+        assert len(list(page_requests(ranges))) == 4
+
+    def test_candle_ranges_split_on_missing_hours(self):
+        now = current_hour()
+        candles = pd.DataFrame({
+            'symbol':['BTCUSDT']*4 + ['ETHUSDT'],
+            'open_date':[d('2018-01-01 00:00'), d('2018-01-01 01:00'),
+                         d('2018-01-01 03:00'), now, d('2018-01-01 00:00')]
+            })
+        ranges = candle_ranges(candles)
+
+        # The incomplete current candle isn't covered
+        assert list(ranges.itertuples(index=False, name=None)) == [
+            ('BTCUSDT', d('2018-01-01 00:00'), d('2018-01-01 02:00')),
+            ('BTCUSDT', d('2018-01-01 03:00'), d('2018-01-01 04:00')),
+            ('ETHUSDT', d('2018-01-01 00:00'), d('2018-01-01 01:00'))
+            ]
+        assert candle_ranges(pd.DataFrame()).empty
+
+    def test_in_ranges(self):
+        ranges = coverage()
+        ranges = ranges[ranges.symbol == 'BTCUSDT']
+        dates = [d('2017-12-31'), d('2018-01-01'), d('2018-01-03'),
+                 d('2018-01-05 12:00'), d('2018-01-06')]
+        assert list(in_ranges(dates, ranges)) == [False, True, False, True,
+                                                  False]
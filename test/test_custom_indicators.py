@@ -1,3 +1,256 @@
 
+import json
+import numpy as np
 import pandas as pd
-from ingestion.custom_indicators import CustomIndicator
+from datetime import timedelta
+from errors.exceptions import ImplementationError
+from ingestion.custom_indicators import (
+    CustomIndicator, MA_48H, MA_72H, AVG, RollingWindow, check_streaming,
+    get_indicators, EMA, RSI, MACD, Bollinger, ATR, VWAP, OBV
+)
+from ingestion.intermediates import (
+    Intermediate, Column, RollingSum, RollingMean, LogReturn, TrueRange,
+    topological_order, compute_intermediates
+)
+
+
+def random_candles(n=200, seed=0):
+    rng = np.random.RandomState(seed)
+    return pd.DataFrame({
+        'open_date':pd.date_range('2018-01-01', periods=n, freq='1H'),
+        'open':rng.rand(n), 'high':rng.rand(n),
+        'low':rng.rand(n), 'close':rng.rand(n), 'volume':rng.rand(n)
+        })
+
+
+def concrete(base, **params):
+    # abstract keeps test indicators out of engineer_data
+    return type(base.__name__ + '_test', (base,), dict(abstract=True, **params))
+
+
+class TestIncremental:
+
+    def test_provided_indicators_are_incremental(self):
+        for indicator in (MA_48H, MA_72H, AVG):
+            assert indicator.incremental()
+        assert not CustomIndicator.incremental()
+
+    def test_resume_from_snapshot(self):
+        candles = random_candles()
+        for indicator in (MA_48H, MA_72H):
+            first = indicator()
+            head = first._stream(candles.iloc[:120])
+
+            # Persist and restore state through JSON, like IndicatorState
+            state = json.loads(json.dumps(first.snapshot()))
+            tail = indicator()._stream(candles.iloc[120:], state)
+
+            batch = indicator()._transform(candles)
+            streamed = pd.concat([head, tail])
+            assert np.allclose(streamed, batch, equal_nan=True)
+
+
+class TestStreaming:
+
+    def test_provided_indicators_match_transform(self):
+        candles = random_candles(300)
+        for indicator in (MA_48H, MA_72H, AVG):
+            for split in (0, 10, 150):
+                check_streaming(indicator, candles, split=split)
+
+    def test_mismatch_is_caught(self):
+        class Off(MA_48H):
+            abstract = True
+
+            def transform(self):
+                return self.candles.close.rolling(24).mean()
+
+        try:
+            check_streaming(Off, random_candles())
+        except ImplementationError:
+            return
+        assert False, 'Mismatching indicator passed check_streaming'
+
+    def test_rolling_window(self):
+        values = np.random.RandomState(1).rand(50)
+        window = RollingWindow(10)
+        for value in values:
+            window.append(value)
+        assert np.isclose(window.mean(), values[-10:].mean())
+        assert np.isclose(window.std(), values[-10:].std(ddof=1))
+
+        restored = RollingWindow(10, window.snapshot())
+        assert np.isclose(restored.sum, window.sum)
+
+    def test_rolling_std_at_large_price_levels(self):
+        values = 1e9 + np.random.RandomState(2).randn(2010)
+        window = RollingWindow(20)
+        for value in values:
+            window.append(value)
+        assert np.isclose(window.std(), values[-20:].std(ddof=1), rtol=1e-6)
+
+        candles = random_candles(300)
+        candles.close = 1e9 + np.random.RandomState(3).randn(300)
+        check_streaming(concrete(Bollinger, window=20, band='upper'),
+                        candles, rtol=1e-12)
+
+
+class TestPanel:
+
+    def test_provided_indicators_are_panel_enabled(self):
+        for indicator in (MA_48H, MA_72H, AVG):
+            assert indicator.panel_enabled()
+        assert not CustomIndicator.panel_enabled()
+
+    def test_panel_matches_transform(self):
+        candles = {s:random_candles(200, seed) for seed, s in enumerate('ABC')}
+        panel = {
+            field:pd.DataFrame({s:c[field].values for s, c in candles.items()})
+            for field in ('open', 'high', 'low', 'close')
+            }
+
+        for indicator in (MA_48H, MA_72H, AVG):
+            transformed = indicator()._transform_panel(panel)
+            for symbol, sub_candles in candles.items():
+                batch = indicator()._transform(sub_candles)
+                assert np.allclose(transformed[symbol], batch, equal_nan=True)
+
+
+class TestIntermediates:
+
+    def test_shared_intermediates_are_computed_once(self):
+        calls = []
+        class Counted(RollingSum):
+            def compute(self, data, inputs):
+                calls.append(self)
+                return super().compute(data, inputs)
+
+        specs = [RollingMean('close', 3), Counted('close', 3)]
+        order = topological_order(specs + [Counted('close', 3)])
+        assert order.index(Column('close')) < order.index(Counted('close', 3))
+
+        candles = random_candles(20)
+        cache = compute_intermediates(order, candles)
+        assert len(calls) == 1
+        assert np.allclose(cache[RollingMean('close', 3)],
+                           candles.close.rolling(3).mean(), equal_nan=True)
+
+    def test_true_range_and_log_return(self):
+        candles = random_candles(20)
+        cache = compute_intermediates([TrueRange(), LogReturn()], candles)
+
+        previous = candles.close.shift(1)
+        expected = pd.concat([candles.high - candles.low,
+                              (candles.high - previous).abs(),
+                              (candles.low - previous).abs()], axis=1).max(1)
+        assert np.allclose(cache[TrueRange()], expected)
+        assert np.allclose(cache[LogReturn()],
+                           np.log(candles.close/previous), equal_nan=True)
+
+    def test_cycle_is_caught(self):
+        class Loop(Intermediate):
+            def dependencies(self):
+                return [Loop()]
+
+        try:
+            topological_order([Loop()])
+        except ImplementationError:
+            return
+        assert False, 'Cyclic intermediates were ordered'
+
+
+class TestLibrary:
+
+    def test_reference_values(self):
+        nan = np.nan
+        candles = pd.DataFrame({
+            'high':[2., 3, 4, 5], 'low':[1., 1, 2, 3],
+            'close':[1., 2, 3, 4], 'volume':[1., 1, 2, 2]
+            })
+
+        def check(indicator, expected, data=candles):
+            values = indicator.calculate(data)
+            assert np.allclose(values, expected, equal_nan=True), values
+
+        check(concrete(EMA, span=3), [nan, nan, 9/4, 25/8])
+        check(concrete(MACD, fast=2, slow=3, signal=2),
+              [nan, nan, 11/36, 85/216])
+        check(concrete(MACD, fast=2, slow=3, signal=2, output='histogram'),
+              [nan, nan, nan, 19/648])
+        check(concrete(Bollinger, window=3), [nan, nan, 4, 5])
+        check(concrete(Bollinger, window=3, band='lower'), [nan, nan, 0, 1])
+
+        # True ranges 1, 2, 2, 2
+        check(concrete(ATR, period=2), [nan, 3/2, 7/4, 15/8])
+
+        # Typical prices 4/3, 2, 3, 4
+        check(concrete(VWAP, window=2), [nan, 5/3, 8/3, 7/2])
+
+        closes = pd.DataFrame({'close':[1., 2, 1, 2, 3],
+                               'volume':[10., 20, 30, 40, 50]})
+        check(concrete(RSI, period=2), [nan, nan, 50, 75, 87.5], closes)
+        check(concrete(OBV, window=2), [nan, 20, -10, 10, 90], closes)
+
+    def test_streaming(self):
+        candles = random_candles(300)
+        for indicator in self.indicators():
+            for split in (0, 10, 150):
+                check_streaming(indicator, candles, split=split)
+
+    def test_panel_matches_transform(self):
+        # Symbols start at different times, like a panel of new listings
+        candles = {s:random_candles(200 - 40*i, i) for i, s in enumerate('ABC')}
+        index = random_candles(200).open_date
+        panel = {
+            field:pd.DataFrame({
+                s:pd.Series(c[field].values, index=c.open_date + \
+                            (index.iloc[-1] - c.open_date.iloc[-1]))
+                for s, c in candles.items()
+                }, index=index)
+            for field in ('open', 'high', 'low', 'close', 'volume')
+            }
+
+        for indicator in self.indicators():
+            transformed = indicator()._transform_panel(panel)
+            for symbol, sub_candles in candles.items():
+                batch = np.asarray(indicator.calculate(sub_candles))
+                column = transformed[symbol].values[-len(sub_candles):]
+                assert np.allclose(column, batch, equal_nan=True), indicator
+
+    def test_panel_with_interior_gaps(self):
+        # B has no candles for 10 hours in the middle of its range
+        candles = {'A':random_candles(200, 0), 'B':random_candles(200, 1)}
+        candles['B'] = candles['B'].drop(range(80, 90)).reset_index(drop=True)
+        panel = {
+            field:pd.DataFrame({
+                s:pd.Series(c[field].values, index=c.open_date)
+                for s, c in candles.items()
+                })
+            for field in ('open', 'high', 'low', 'close', 'volume')
+            }
+
+        recursive = [concrete(EMA, span=12), concrete(RSI, period=14),
+                     concrete(MACD, output='signal'), concrete(ATR, period=14)]
+        for indicator in recursive:
+            transformed = indicator()._transform_panel(panel)
+            for symbol, sub_candles in candles.items():
+                batch = np.asarray(indicator.calculate(sub_candles))
+                column = transformed[symbol][sub_candles.open_date].values
+                assert np.allclose(column, batch, equal_nan=True), indicator
+
+    def test_library_is_abstract(self):
+        indicators = get_indicators()
+        assert MA_48H in indicators
+        for indicator in (EMA, RSI, MACD, Bollinger, ATR, VWAP, OBV):
+            assert indicator not in indicators
+
+    def indicators(self):
+        return [
+            concrete(EMA, span=12),
+            concrete(RSI, period=14),
+            concrete(MACD, output='signal'),
+            concrete(Bollinger, band='lower'),
+            concrete(ATR, period=14),
+            concrete(VWAP, window=24),
+            concrete(OBV, window=24)
+            ]
@@ -1,8 +1,10 @@
 from utils.database import (
     Database, get_symbols, get_pairs, get_symbols_and_pairs, Candles,
-    get_most_recent_dates, CreateTable, check_table_existence
+    get_most_recent_dates, CreateTable, check_table_existence, IndicatorStore,
+    reuse_connections
     )
 from utils.toolbox import DateConvert
+from utils.instrumentation import normalize_sql, profiler
 from pymysql.err import OperationalError, ProgrammingError
 from datetime import datetime, timedelta
 import pandas as pd
@@ -25,6 +27,23 @@ class TestDatabase:
             return True
 
 
+class TestReuseConnections:
+
+    def test_nested_databases_get_their_own_connection(self):
+        reuse_connections()
+        try:
+            outer = Database(db=DB)
+            inner = Database(db=DB)
+            assert outer.connection is not inner.connection
+
+            # Released connections are handed to the next Database
+            connection = inner.connection
+            del inner
+            assert Database(db=DB).connection is connection
+        finally:
+            reuse_connections(False)
+
+
 def test_get_symbols():
     symbols = get_symbols()
     assert symbols
@@ -110,3 +129,106 @@ class TestCreateTable:
 def test_check_table_existence():
     table='candles'
     assert check_table_existence(table)
+
+
+class TestQueryProfiler:
+
+    def test_normalize_sql(self):
+        sql = "SELECT * FROM candles WHERE symbol = 'BTCUSDT' AND close > 10.5;"
+        shape = normalize_sql(sql)
+        assert shape == 'SELECT * FROM candles WHERE symbol = ? AND close > ?'
+
+        sql = "INSERT IGNORE INTO candles (symbol, open) VALUES ('A', 1), ('B', 2);"
+        shape = normalize_sql(sql)
+        assert shape == 'INSERT IGNORE INTO candles (symbol, open) VALUES (...)'
+
+    def test_execute_is_recorded(self):
+        profiler.reset()
+        Database().execute('SELECT symbol FROM user_symbols;')
+        stats = profiler.get_stats()
+        assert 'SELECT symbol FROM user_symbols' in set(stats.sql)
+        assert stats.rows_read.iloc[0] > 0
+
+
+class TestDeclaredColumns:
+
+    def test_assemble_columns_and_in(self):
+        conditions = [dict(column='symbol', operator='IN', value=['A', 'B'])]
+        sql = Candles()._assemble_sql(
+            'candles', conditions=conditions, columns=['open_date', 'close']
+            )
+        assert sql == "SELECT `open_date`, `close` FROM candles " + \
+                      "WHERE symbol IN ('A', 'B')"
+
+    def test_get_columns(self):
+        symbol = get_symbols()[0]
+        candles = Candles().get_columns(
+            columns=['close'], symbols=symbol, table='candles'
+            )
+        assert list(candles.columns) == ['symbol', 'open_date', 'close']
+        assert candles.open_date.is_monotonic_increasing
+
+
+class TestDelete:
+
+    def test_chunked_delete_and_upsert(self):
+        table_name = 'test_delete'
+        data = pd.DataFrame({'symbol':['A', 'A', 'B'], 'value':[1, 2, 3]})
+
+        try:
+            Database(db=DB).write(
+                f'CREATE TABLE {table_name} (symbol varchar(20), ' +
+                'value int(11), UNIQUE KEY stamp (symbol));'
+                )
+            Database(db=DB).insert(table_name, data.iloc[[1, 2]])
+
+            # Upsert overwrites the row with the duplicate key
+            Database(db=DB).insert(table_name, data.iloc[[0]], upsert=True)
+            rows = Database(db=DB).execute(f'SELECT * FROM {table_name};')
+            assert set(rows.value) == {1, 3}
+
+            deleted = Database(db=DB).delete(
+                table_name, column='symbol', values=['A', 'B', 'C'],
+                chunk_size=2
+                )
+            assert deleted == 2
+
+            try:
+                Database(db=DB).delete(table_name)
+                assert False, 'Deleted without conditions'
+            except ValueError:
+                pass
+
+        finally:
+            Database(db=DB).execute(f'DROP TABLE {table_name};')
+
+
+class TestIndicatorStore:
+
+    def test_save_and_pivot(self):
+        store = IndicatorStore(db=DB)
+        candles = Database(db=DB).execute(
+            'SELECT symbol, open_date FROM candles LIMIT 2;'
+            )
+        candles['first'] = [1.5, 2.5]
+        candles['second'] = [3.5, None]
+
+        try:
+            ids = store.register(['first', 'second'])
+            assert store.register(['first']) == ids
+
+            assert store.save(candles, ['first', 'second']) == 3
+            values = store.get_columns(columns=['close', 'first'],
+                                       symbols=list(candles.symbol))
+            assert list(values.columns) == ['symbol', 'open_date', 'close',
+                                            'first']
+            assert sorted(values['first']) == [1.5, 2.5]
+
+            # Only candles with every requested indicator are returned
+            values = store.get_columns(columns=['first', 'second'],
+                                       symbols=list(candles.symbol))
+            assert len(values) == 1
+
+        finally:
+            for table in (store.names_table, store.values_table):
+                Database(db=DB).execute(f'DROP TABLE {table};')
@@ -3,7 +3,10 @@ from datetime import datetime, timedelta
 
 from ingestion import core
 from ingestion import live
-from utils.database import get_max_from_column, get_symbols
+from utils.database import get_max_from_column, get_symbols, Database
+from ingestion.custom_indicators import get_indicators
+import numpy as np
+import pandas as pd
 
 from importlib import reload
 core = reload(core)
@@ -47,3 +50,73 @@ class TestEngineeredData:
         max_date = get_max_from_column(column='open_date')
         engineered_data = core.engineer_data()
         assert engineered_data.open_date.max() == max_date
+
+
+class TestParallel:
+
+    def test_partition_symbols(self):
+        partitions = core.partition_symbols(['e', 'd', 'c', 'b', 'a'], 2)
+        assert partitions == [['a', 'b', 'c'], ['d', 'e']]
+        assert core.partition_symbols(['a'], 4) == [['a']]
+
+    def test_matches_serial(self):
+        max_date = get_max_from_column(column='open_date')
+        from_date = max_date - timedelta(hours=10)
+
+        serial = core.engineer_data(from_date=from_date, panel=False)
+        parallel = core.engineer_data(from_date=from_date, panel=False,
+                                      workers=2)
+        assert serial.equals(parallel)
+
+
+class TestSQLPushdown:
+
+    def test_matches_python(self):
+        max_date = get_max_from_column(column='open_date')
+        from_date = max_date - timedelta(hours=10)
+
+        sql = core.engineer_sql(from_date)
+        select = sql[sql.index('SELECT'):sql.index('ON DUPLICATE')]
+        pushed = Database().execute(select)
+        pushed = pushed.sort_values(['symbol', 'open_date'])
+
+        python = core.engineer_data(from_date=from_date)
+        python = python[python.open_date >= from_date]
+        python = python.sort_values(['symbol', 'open_date'])
+
+        names = [i.__name__ for i in get_indicators() if i.get_sql()]
+        assert names
+        assert np.allclose(pushed[names].values, python[names].values)
+
+    def test_no_sql_indicators(self):
+        assert core.engineer_sql(datetime.utcnow(), indicators=[]) is None
+
+
+class TestInterpolateNulls:
+
+    def candles(self):
+        nan = np.nan
+        return pd.DataFrame({
+            'symbol':['A', 'A', 'A', 'A', 'B', 'B', 'B'],
+            'open_date':list(pd.date_range('2018-01-01', periods=4, freq='1H')) +
+                        list(pd.date_range('2018-01-01', periods=3, freq='1H')),
+            'close':[1., nan, 3., nan, nan, 5., 6.]
+            })
+
+    def test_ffill_stays_within_symbol(self):
+        candles, counts = core.interpolate_nulls(self.candles(), policy='ffill')
+
+        # B's leading null isn't filled from A
+        assert list(candles.close) == [1, 1, 3, 3, 5, 6]
+        assert list(candles.interpolated) == [0, 1, 0, 1, 0, 0]
+        assert counts.loc['A'].tolist() == [2, 0]
+        assert counts.loc['B'].tolist() == [0, 1]
+
+    def test_linear_and_drop(self):
+        candles, _ = core.interpolate_nulls(self.candles(), policy='linear')
+        assert list(candles.close) == [1, 2, 3, 3, 5, 6]
+
+        candles, counts = core.interpolate_nulls(self.candles(), policy='drop')
+        assert list(candles.close) == [1, 3, 5, 6]
+        assert not candles.interpolated.any()
+        assert counts.dropped.sum() == 3
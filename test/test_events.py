@@ -0,0 +1,76 @@
+import pandas as pd
+from bot.base import StreamingDataEngine
+from ingestion.events import (
+    EventBus, CandlesInserted, FeaturesEngineered, ShadowBacktest
+)
+
+
+def candles(symbol, start, periods):
+    dates = pd.date_range(start, periods=periods, freq='1H')
+    return pd.DataFrame({'symbol':symbol, 'open_date':dates,
+                         'close':range(periods)})
+
+
+class TestEventBus:
+
+    def test_publish_in_order_and_isolate_failures(self):
+        bus = EventBus()
+        calls = []
+
+        def first(event):
+            calls.append('first')
+            raise ValueError('first failed')
+
+        def second(event):
+            calls.append('second')
+
+        bus.subscribe(CandlesInserted, first)
+        bus.subscribe(CandlesInserted, second)
+        bus.subscribe(CandlesInserted, second)
+        bus.subscribe(FeaturesEngineered, second)
+
+        ranges = pd.DataFrame({'symbol':['A'], 'start':['2018-09-01'],
+                               'end':['2018-09-02']})
+        event = CandlesInserted(ranges, candles('A', '2018-09-01', 24))
+        failed = bus.publish(event)
+
+        assert calls == ['first', 'second']
+        assert failed == [first]
+        assert bus.get_stats().loc['second', 'calls'] == 1
+
+        bus.unsubscribe(CandlesInserted, first)
+        bus.publish(CandlesInserted(ranges, None))
+        assert calls == ['first', 'second', 'second']
+
+
+class Bot:
+
+    def __init__(self, data_dict):
+        self.data_dict = data_dict
+        self.seen = []
+
+    def run_pending(self):
+        for symbol, engine in self.data_dict.items():
+            while not engine.finished:
+                self.seen.append((symbol, engine[0].close))
+                engine.increment()
+
+
+class TestShadowBacktest:
+
+    def test_only_new_rows_are_run(self):
+        engine = StreamingDataEngine(lookback=5)
+        history = candles('A', '2018-09-01', 3)
+        history.index = history.open_date
+        engine.append(history)
+        bot = Bot({'A':engine})
+        bot.run_pending()
+
+        shadow = ShadowBacktest(bot)
+        new = pd.concat([candles('A', '2018-09-01 01:00', 4),
+                         candles('B', '2018-09-01', 2)])
+        shadow(FeaturesEngineered(new))
+
+        # The overlapping rows and unknown symbols are skipped
+        assert bot.seen == [('A', 0), ('A', 1), ('A', 2), ('A', 2), ('A', 3)]
+        assert engine.finished
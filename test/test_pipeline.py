@@ -0,0 +1,80 @@
+import pandas as pd
+from time import sleep, monotonic
+from ingestion.pipeline import (
+    Pipeline, Stage, NormalizeCandles, DedupeCandles, CandleRanges
+)
+
+
+class Slow(Stage):
+    def __init__(self, delay):
+        self.delay = delay
+
+    def process(self, item):
+        sleep(self.delay)
+        return [item]
+
+
+def slow_source(n, delay):
+    for i in range(n):
+        sleep(delay)
+        yield i
+
+
+class TestPipeline:
+
+    def test_stages_overlap(self):
+        start = monotonic()
+        output = Pipeline(slow_source(10, .05), [Slow(.05)]).run()
+        assert output == list(range(10))
+
+        # Sequential would take 1s
+        assert monotonic() - start < .8
+
+    def test_errors_propagate(self):
+        class Fail(Stage):
+            def process(self, item):
+                raise ValueError('bad item')
+
+        try:
+            Pipeline(iter(range(100)), [Slow(0), Fail()], queue_size=1).run()
+        except ValueError:
+            return
+        assert False, 'Pipeline swallowed a stage error'
+
+    def test_normalize_dedupe(self):
+        def page(dates):
+            return {}, pd.DataFrame({
+                'symbol':'BTCUSDT',
+                'open_date':pd.to_datetime(dates).values.astype('int64')//10**6,
+                'close':['1.5']*len(dates)
+                })
+
+        pages = [page(['2018-01-01 00:00', '2018-01-01 01:00']),
+                 page(['2018-01-01 01:00', '2018-01-01 02:00'])]
+        frames = Pipeline(pages, [NormalizeCandles(), DedupeCandles()]).run()
+        candles = pd.concat(frames)
+
+        assert list(candles.open_date) == ['2018-01-01 00:00:00',
+                                           '2018-01-01 01:00:00',
+                                           '2018-01-01 02:00:00']
+        assert candles.close.dtype.kind == 'f'
+
+    def test_short_and_empty_pages_cover_returned_candles(self):
+        def page(symbol, dates):
+            return {'symbol':symbol}, pd.DataFrame({
+                'symbol':symbol,
+                'open_date':pd.to_datetime(dates).values.astype('int64')//10**6,
+                'close':['1.5']*len(dates)
+                })
+
+        # Five hours were requested for each symbol
+        pages = [page('BTCUSDT', ['2018-01-01 00:00', '2018-01-01 01:00']),
+                 page('ETHUSDT', [])]
+        covered = CandleRanges()
+        Pipeline(pages, [NormalizeCandles(), covered]).run()
+
+        ranges = covered.ranges()
+        assert list(ranges.itertuples(index=False, name=None)) == [
+            ('BTCUSDT', pd.Timestamp('2018-01-01 00:00'),
+             pd.Timestamp('2018-01-01 02:00'))
+            ]
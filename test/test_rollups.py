@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+from ingestion.rollups import aggregate_candles, bucket_ranges
+
+d = pd.Timestamp
+
+
+def hourly_candles(symbol, start, n, seed=0):
+    rng = np.random.RandomState(seed)
+    open_date = pd.date_range(start, periods=n, freq='1H')
+    return pd.DataFrame({
+        'symbol':symbol, 'open_date':open_date,
+        'open':rng.rand(n), 'high':rng.rand(n),
+        'low':rng.rand(n), 'close':rng.rand(n), 'volume':rng.rand(n),
+        'close_date':open_date + pd.Timedelta(minutes=59)
+        })
+
+
+class TestRollups:
+
+    def test_aggregate_matches_resample(self):
+        candles = pd.concat([hourly_candles('A', '2018-01-01 02:00', 50, 0),
+                             hourly_candles('B', '2018-01-01 00:00', 30, 1)])
+        bars = aggregate_candles(candles.sample(frac=1, random_state=0), '4h')
+
+        for symbol in ('A', 'B'):
+            hourly = candles[candles.symbol == symbol].set_index('open_date')
+            expected = hourly.resample('4H').agg({
+                'open':'first', 'high':'max', 'low':'min',
+                'close':'last', 'volume':'sum'
+                })
+            symbol_bars = bars[bars.symbol == symbol].set_index('open_date')
+            assert np.allclose(symbol_bars[expected.columns], expected)
+
+        # A's first bar opens at midnight but only has two hours
+        assert bars.num_candles.iloc[0] == 2
+        assert bars.open_date.iloc[0] == d('2018-01-01')
+
+    def test_bucket_ranges(self):
+        ranges = pd.DataFrame({
+            'symbol':['A', 'A', 'B'],
+            'start':[d('2018-01-01 05:00'), d('2018-01-01 07:00'),
+                     d('2018-01-02 01:00')],
+            'end':[d('2018-01-01 06:00'), d('2018-01-01 09:00'),
+                   d('2018-01-02 02:00')]
+            })
+
+        expected = [('A', d('2018-01-01 04:00'), d('2018-01-01 12:00')),
+                    ('B', d('2018-01-02 00:00'), d('2018-01-02 04:00'))]
+        buckets = bucket_ranges(ranges, '4h')
+        assert list(buckets.itertuples(index=False, name=None)) == expected
@@ -0,0 +1,65 @@
+import time
+import threading
+from datetime import datetime, timedelta
+from ingestion.scheduler import Job, Scheduler
+
+
+class TestJob:
+
+    def test_schedule_is_aligned(self):
+        job = Job('job', lambda: None, '1h', '5min')
+        job.schedule(datetime(2018, 9, 1, 3, 2))
+        assert job.next_run == datetime(2018, 9, 1, 3, 5)
+        job.schedule(datetime(2018, 9, 1, 3, 5))
+        assert job.next_run == datetime(2018, 9, 1, 4, 5)
+
+
+class TestScheduler:
+
+    def test_no_overlapping_runs(self):
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            release.wait(5)
+
+        scheduler = Scheduler([Job('slow', slow, '1h'),
+                               Job('fast', lambda: None, '1h')],
+                              workers=2, reuse_connections=False)
+        try:
+            start = datetime(2018, 9, 1, 0, 30)
+            assert scheduler.run_pending(start) == []
+            assert scheduler.run_pending(start + timedelta(hours=1)) == \
+                   ['slow', 'fast']
+
+            # slow is still running at its next slot
+            time.sleep(0.1)
+            assert scheduler.run_pending(start + timedelta(hours=2)) == \
+                   ['fast']
+        finally:
+            release.set()
+            scheduler.shutdown()
+
+        stats = scheduler.get_stats().set_index('name')
+        assert len(calls) == 1
+        assert stats.loc['slow', 'skipped'] == 1
+        assert stats.loc['fast', 'runs'] == 2
+        assert stats.loc['slow', 'last_duration'] > 0
+
+    def test_failed_runs_are_counted(self):
+        def fail():
+            raise ValueError('task failed')
+
+        scheduler = Scheduler([Job('fail', fail, '1h')], workers=1,
+                              reuse_connections=False)
+        try:
+            start = datetime(2018, 9, 1, 0, 30)
+            scheduler.run_pending(start)
+            scheduler.run_pending(start + timedelta(hours=1))
+        finally:
+            scheduler.shutdown()
+
+        stats = scheduler.get_stats().set_index('name')
+        assert stats.loc['fail', 'runs'] == 1
+        assert stats.loc['fail', 'failures'] == 1
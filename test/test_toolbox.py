@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from utils.toolbox import (
+    DateContinuity, DateArrayConvert, DateConvert, format_frame, format_records,
+    merge_ranges
+)
+
+
+class TestDateContinuity:
+
+    def test_continuous(self):
+        dates = pd.date_range('2018-09-01', periods=100, freq='1H')
+        assert DateContinuity(dates).continuous
+
+    def test_gaps_duplicates_misaligned(self):
+        dates = list(pd.date_range('2018-09-01', periods=10, freq='1H'))
+        dates = dates[:3] + dates[6:] + [dates[1]]
+        dates.append(pd.Timestamp('2018-09-01 04:30:00'))
+
+        c = DateContinuity(pd.Series(dates))
+        assert not c.continuous
+        assert len(c.gaps) == 1
+        assert c.gaps.start.iloc[0] == pd.Timestamp('2018-09-01 03:00:00')
+        assert c.gaps.end.iloc[0] == pd.Timestamp('2018-09-01 05:00:00')
+        assert c.num_missing == 3
+        assert list(c.duplicates) == [np.datetime64('2018-09-01 01:00:00')]
+        assert list(c.misaligned) == [np.datetime64('2018-09-01 04:30:00')]
+
+    def test_inferred_frequency(self):
+        dates = pd.date_range('2018-09-01', periods=10, freq='1D')
+        assert DateContinuity(dates, freq=None).continuous
+        assert not DateContinuity(dates, freq='1H').continuous
+
+
+class TestDateArrayConvert:
+
+    def test_formats(self):
+        expected = ['2018-09-10 12:00:00', '2018-09-10 13:00:00']
+        inputs = [
+            [1536580800000, 1536584400000],
+            pd.Series([1536580800, 1536584400]),
+            ['2018-09-10 12:00:00', '2018-09-10T13:00:00Z'],
+            [datetime(2018, 9, 10, 12), pd.Timestamp('2018-09-10 13:00:00')],
+            pd.date_range('2018-09-10 12:00:00', periods=2, freq='1H')
+            ]
+        for dates in inputs:
+            converted = DateArrayConvert(dates)
+            assert list(converted.date) == expected
+            assert list(converted.timestamp) == [1536580800, 1536584400]
+            assert converted.datetime.dtype == np.dtype('datetime64[s]')
+
+    def test_agrees_with_DateConvert(self):
+        dates = pd.date_range('2018-09-10', periods=50, freq='1H')
+        ts = [DateConvert(d).timestamp*1000 for d in dates]
+        assert list(DateArrayConvert(ts).date) == \
+               [DateConvert(t).date for t in ts]
+
+    def test_missing(self):
+        converted = DateArrayConvert(['2018-09-10 12:00:00', None])
+        assert converted.date[1] is None
+        assert format_records({'open_date':converted.date[1]}) == \
+               [{'open_date':'NULL'}]
+
+
+class TestFormatFrame:
+
+    def test_matches_format_records(self):
+        df = pd.DataFrame({
+            'symbol':['BTCUSDT', 'ETHUSDT'],
+            'open':['1.5', '2'],
+            'number_of_trades':[3, 4],
+            'name':['', 'red']
+            })
+        records = format_frame(df).to_dict('records')
+        assert records == format_records(df.to_dict('records'))
+
+    def test_nulls(self):
+        df = pd.DataFrame({'close':[1.5, np.nan],
+                           'open_date':pd.to_datetime(['2018-01-01', None])})
+        records = format_frame(df).to_dict('records')
+        assert records[0] == {'close':1.5, 'open_date':"'2018-01-01 00:00:00'"}
+        assert records[1] == {'close':'NULL', 'open_date':'NULL'}
+
+
+class TestMergeRanges:
+
+    def test_overlapping_and_adjacent(self):
+        d = pd.Timestamp
+        ranges = pd.DataFrame({
+            'symbol':['A', 'A', 'A', 'B', 'A'],
+            'start':[d('2018-01-01'), d('2018-01-03'), d('2018-01-02'),
+                     d('2018-01-01'), d('2018-02-01')],
+            'end':[d('2018-01-02'), d('2018-01-04'), d('2018-01-03'),
+                   d('2018-01-05'), d('2018-02-02')]
+            })
+        merged = merge_ranges(ranges)
+
+        assert list(merged.symbol) == ['A', 'A', 'B']
+        assert list(merged.start) == [d('2018-01-01'), d('2018-02-01'),
+                                      d('2018-01-01')]
+        assert list(merged.end) == [d('2018-01-04'), d('2018-02-02'),
+                                    d('2018-01-05')]
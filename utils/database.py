@@ -1,10 +1,43 @@
 """Module for handling interaction with the MySQL database."""
 
+import json
 import pymysql
+import threading
 import pandas as pd
+from time import perf_counter
 from config import config
 from pymysql.err import OperationalError, InternalError, ProgrammingError
-from utils.toolbox import format_records, progress_bar, chunker, DateConvert
+from utils.toolbox import (
+    format_records, progress_bar, chunker, DateConvert, DateArrayConvert,
+    merge_ranges
+)
+from utils.instrumentation import profiler
+
+
+_local = threading.local()
+
+
+def reuse_connections(enabled=True):
+    '''
+    Keep the connections of Database objects created in the calling thread
+    open once the objects are gone, and hand them to later Database objects
+    instead of connecting each time. A connection is only used by one live
+    Database at a time, so nested Databases get their own. Intended for long
+    running processes like ingestion.scheduler.Scheduler. Disabling closes
+    the thread's idle connections.
+    '''
+    if enabled:
+        if getattr(_local, 'connections', None) is None:
+            _local.connections = {}
+        return
+
+    for idle in (getattr(_local, 'connections', None) or {}).values():
+        for connection in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+    _local.connections = None
 
 
 class Database:
@@ -14,27 +47,72 @@ class Database:
         if not db:
             db = 'autonotrader'
 
-        # Establish connection to MySQL server
         self.config = config
-        self.connection = \
-                pymysql.connect(
-                     host=self.config['host'],
-                     user=self.config['user'],
-                     password=self.config['password'],
-                     port=self.config['port'],
-                     charset='utf8mb4',
-                     cursorclass=pymysql.cursors.DictCursor
-                     )
-        if db:
-            try:
-                self.connection.select_db(db)
-            except InternalError as err:
-                print(f'Cannot access database {db}. Most likely, it does not exist')
-                raise err
+        self._idle = None
+        self.connection = self._reused_connection(db)
+
+        # Establish connection to MySQL server
+        if self.connection is None:
+            self.connection = \
+                    pymysql.connect(
+                         host=self.config['host'],
+                         user=self.config['user'],
+                         password=self.config['password'],
+                         port=self.config['port'],
+                         charset='utf8mb4',
+                         cursorclass=pymysql.cursors.DictCursor
+                         )
+            if db:
+                try:
+                    self.connection.select_db(db)
+                except InternalError as err:
+                    print(f'Cannot access database {db}. Most likely, it does not exist')
+                    raise err
+
+        # Kept connections go back to the thread's idle ones in __del__
+        connections = getattr(_local, 'connections', None)
+        if connections is not None:
+            self._idle = connections.setdefault(self._connection_key(db), [])
 
         self.cursor = self.connection.cursor()
 
 
+    def _connection_key(self, db):
+        return (self.config['host'], self.config['port'],
+                self.config['user'], db)
+
+
+    def _reused_connection(self, db):
+        '''
+        Take an idle connection to db kept by this thread if reuse_connections
+        is enabled, otherwise return None.
+        '''
+        connections = getattr(_local, 'connections', None)
+        if connections is None:
+            return None
+
+        idle = connections.get(self._connection_key(db), [])
+        while idle:
+            connection = idle.pop()
+            if not connection.open:
+                continue
+            try:
+                connection.ping(reconnect=False)
+                # End the read snapshot left by the previous user's SELECTs,
+                # nothing else is using the connection
+                connection.rollback()
+            except Exception:
+                continue
+            return connection
+        return None
+
+
+    def __del__(self):
+        idle = getattr(self, '_idle', None)
+        if idle is not None and self.connection.open:
+            idle.append(self.connection)
+
+
     def check_connection(self):
         '''Check to see if connection to database is active'''
         return True if self.connection.open else False
@@ -45,9 +123,34 @@ class Database:
         self.connection.close()
 
 
+    def _record(self, sql, start, rows_read=0, rows_written=0, result=None):
+        '''
+        Record timing and size of a call with the query profiler, capturing
+        an EXPLAIN plan if the call was slow.
+        '''
+        duration = perf_counter() - start
+        bytes_received = 0
+        if result is not None and not result.empty:
+            bytes_received = int(result.memory_usage(index=False).sum())
+
+        slow = profiler.record(
+            sql, duration, rows_read=rows_read, rows_written=rows_written,
+            bytes_sent=len(sql), bytes_received=bytes_received
+        )
+
+        if slow and profiler.wants_explain(sql):
+            try:
+                with self.connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN {sql}')
+                    profiler.add_explain(sql, cursor.fetchall())
+            except Exception:
+                pass
+
+
     def write(self, sql):
         '''
         Perform any command that requires commiting a change to the database.
+        Returns the number of affected rows.
 
         Parameters:
         -----------
@@ -56,16 +159,19 @@ class Database:
 
         '''
         try:
+            start = perf_counter()
             with self.cursor as cursor:
-                cursor.execute(sql)
+                rows_written = cursor.execute(sql)
             self.connection.commit()
+            self._record(sql, start, rows_written=rows_written)
+            return rows_written
 
         except Exception as err:
             print(sql)
             raise err
 
 
-    def insert(self, table, ins, auto_format=True, verbose=False):
+    def insert(self, table, ins, auto_format=True, verbose=False, upsert=False):
         '''
         Insert a new row or set of rows into a table.
 
@@ -102,13 +208,26 @@ class Database:
         verbose: boolean
             True ---> If insert is large, display a progress bar.
 
+        upsert: boolean
+            True ---> Overwrite rows with a duplicate unique key rather than
+                      ignoring the new row.
+
         '''
 
         sql = None
+        verb = 'INSERT' if upsert else 'INSERT IGNORE'
 
         if isinstance(ins, pd.DataFrame):
             if ins.empty:
                 return
+
+            # Convert date columns in one pass rather than per record
+            dates = [c for c in ins.columns if ins[c].dtype.kind == 'M']
+            if dates and auto_format:
+                ins = ins.copy()
+                for column in dates:
+                    ins[column] = DateArrayConvert(ins[column]).date
+
             ins = ins.to_dict('records')
         elif not isinstance(ins, [list, dict]):
             raise TypeError(f'''
@@ -149,9 +268,14 @@ class Database:
                             add = add + ', ' if i < len(chunk)-1 else add
                             insert += add
 
-                        sql = f"INSERT IGNORE INTO {table} {columns} VALUES {insert};"
-                        cursor.execute(sql)
+                        sql = f"{verb} INTO {table} {columns} VALUES {insert}"
+                        if upsert:
+                            sql += self._on_duplicate(ins[0].keys())
+                        sql += ';'
+                        start = perf_counter()
+                        rows_written = cursor.execute(sql)
                         self.connection.commit()
+                        self._record(sql, start, rows_written=rows_written)
 
                         iteration+=1
                         if verbose and num_chunks:
@@ -168,9 +292,14 @@ class Database:
                     if len(ins.keys()) == 1:
                         columns = columns.replace(',', '')
 
-                    sql = f"INSERT IGNORE INTO {table} {columns} VALUES {insert};"
-                    cursor.execute(sql)
+                    sql = f"{verb} INTO {table} {columns} VALUES {insert}"
+                    if upsert:
+                        sql += self._on_duplicate(ins.keys())
+                    sql += ';'
+                    start = perf_counter()
+                    rows_written = cursor.execute(sql)
                     self.connection.commit()
+                    self._record(sql, start, rows_written=rows_written)
 
                     iteration+=1
                     if verbose and num_chunks:
@@ -186,10 +315,18 @@ class Database:
             raise err
 
 
+    @staticmethod
+    def _on_duplicate(columns):
+        '''Compose an upsert clause updating every inserted column.'''
+        updates = ', '.join(f'{c}=VALUES({c})' for c in columns)
+        return f' ON DUPLICATE KEY UPDATE {updates}'
+
+
     def execute(self, sql):
         '''Return a DataFrame containing data from a sql SELECT command.'''
 
         try:
+            start = perf_counter()
             with self.cursor as cursor:
                 cursor.execute(sql)
             result = self.cursor.fetchall()
@@ -197,24 +334,91 @@ class Database:
                 result = pd.DataFrame(result)
                 if 'id' in result.columns:
                     result = result.drop('id', axis=1)
-                return result
             else:
-                return pd.DataFrame()
+                result = pd.DataFrame()
+
+            self._record(sql, start, rows_read=len(result), result=result)
+            return result
 
         except Exception as err:
             print(sql)
             raise err
 
 
-    def delete(self):
-        pass
+    def delete(self, table, conditions=None, column=None, values=None,
+                     chunk_size=1000):
+        '''
+        Delete rows from a table in as few statements as possible, in a
+        single transaction.
+
+        Parameters:
+        -----------
+        table: string
+            The name of the SQL table to delete from.
+
+        conditions: dict | list of dicts
+            WHERE conditions in the format accepted by
+            AssembleSQL._assemble_sql, all of which must match. Ranges are
+            expressed with two conditions, like open_date >= <from> and
+            open_date < <to>.
+
+        column: string
+        values: list
+            Delete rows whose <column> is in <values>, with at most
+            chunk_size values per statement. Combined with conditions.
+
+        chunk_size: int
+            Max values in each IN list.
+
+        Returns:
+        -----------
+        deleted: int
+            The number of rows deleted.
+        '''
+        if isinstance(conditions, dict):
+            conditions = [conditions]
+        conditions = list(conditions or [])
+
+        if column is None and not conditions:
+            raise ValueError('Refusing to delete every row of a table.')
+
+        if column is None:
+            statements = [conditions]
+        else:
+            values = list(values)
+            statements = [
+                conditions + [dict(column=column, operator='IN', value=chunk)]
+                for chunk in chunker(values, chunk_size)
+                ]
+
+        deleted = 0
+        sql = None
+        try:
+            for statement in statements:
+                sql = f'DELETE FROM {table}' + \
+                      AssembleSQL()._assemble_where(statement) + ';'
+                start = perf_counter()
+                with self.connection.cursor() as cursor:
+                    rows_written = cursor.execute(sql)
+                self._record(sql, start, rows_written=rows_written)
+                deleted += rows_written
+            self.connection.commit()
+
+        except Exception as err:
+            self.connection.rollback()
+            if sql:
+                print(sql)
+            raise err
+
+        return deleted
 
 
 # TODO Should probably be moved to utils.toolbox
 class AssembleSQL:
     """Compose a SQL query given a table and set of logical conditions."""
 
-    def _assemble_sql(self, table, conditions = None):
+    def _assemble_sql(self, table, conditions = None, columns = None,
+                            select = None):
         """
         Parameters:
         ----------
@@ -232,35 +436,75 @@ class AssembleSQL:
                 'operator':>,
                 'value':2000}
 
+            With operator 'IN', value should be a list of values.
+
+        columns: list of strings
+            Columns to select. None selects all columns.
+
+        select: string
+            Raw select expression, such as 'MAX(open_date)'. Overrides columns.
+
         Returns:
         ---------
         sql: string
             Formatted SQL query.
         """
 
-        sql = f"SELECT * FROM {table}"
-        if conditions:
+        if not select:
+            select = ', '.join(f'`{c}`' for c in columns) if columns else '*'
+        sql = f"SELECT {select} FROM {table}"
+        return sql + self._assemble_where(conditions)
 
-            if isinstance(conditions, dict):
-                conditions = [conditions]
+    def _assemble_where(self, conditions = None):
+        """
+        Compose a WHERE clause, with a leading space, from conditions in the
+        format accepted by _assemble_sql. Returns '' for no conditions.
+        """
+        if not conditions:
+            return ''
+
+        if isinstance(conditions, dict):
+            conditions = [conditions]
+
+        add = []
+        for c in conditions:
+            if c['operator'].upper() == 'IN':
+                values = ', '.join(
+                    f"'{v}'" if isinstance(v, str) else str(v)
+                    for v in c['value']
+                )
+                add.append(f"{c['column']} IN ({values})")
+            elif isinstance(c['value'], str):
+                add.append(f"{c['column']} {c['operator']} '{c['value']}'")
+            else:
+                add.append(f"{c['column']} {c['operator']} {c['value']}")
 
-            add = []
-            for c in conditions:
-                if isinstance(c['value'], str):
-                    add.append(f"{c['column']} {c['operator']} '{c['value']}'")
-                else:
-                    add.append(f"{c['column']} {c['operator']} {c['value']}")
+        add = ' AND '.join(add)
+        return f" WHERE {add}"
 
-            add = ' AND '.join(add)
-            sql += f" WHERE {add}"
+    def _date_conditions(self, from_date = None, to_date = None,
+                               column = 'open_date'):
+        """Compose inclusive from_date/to_date conditions on a date column."""
 
-        return sql
+        conditions = []
+        if from_date:
+            from_date = DateConvert(from_date).date
+            conditions.append(dict(column = column,
+                                   operator = '>=',
+                                   value = from_date))
+        if to_date:
+            to_date = DateConvert(to_date).date
+            conditions.append(dict(column = column,
+                                   operator = '<=',
+                                   value = to_date))
+        return conditions
 
 
 class Candles(AssembleSQL):
     """Get candles from an SQL database."""
 
-    def get_raw(self, symbol = None, from_date = None, to_date = None):
+    def get_raw(self, symbol = None, from_date = None, to_date = None,
+                      ascending = False, interval = '1h'):
         """
         Get raw candles from the database. With no parameters, returns entire
         table.
@@ -274,6 +518,13 @@ class Candles(AssembleSQL):
             Dates for query, resulting in expression:
             from_date < open_date < to_date
 
+        ascending: boolean
+            True ---> order by open_date ascending rather than descending.
+
+        interval: string
+            '1h' for hourly candles, or an interval rolled up by
+            ingestion.rollups like '4h' or '1d'.
+
         Returns
         -----------
         candles: pd.DataFrame
@@ -296,13 +547,15 @@ class Candles(AssembleSQL):
                                    operator = '=',
                                    value = symbol))
 
-        sql = self._assemble_sql('candles', conditions = conditions)
-        sql += ' ORDER BY open_date DESC;'
+        table = 'candles' if interval == '1h' else f'candles_{interval}'
+        sql = self._assemble_sql(table, conditions = conditions)
+        sql += ' ORDER BY open_date ASC;' if ascending else ' ORDER BY open_date DESC;'
 
         return Database().execute(sql)
 
 
-    def get_engineered(self, symbol = None, from_date = None, to_date = None):
+    def get_engineered(self, symbol = None, from_date = None, to_date = None,
+                             ascending = False):
         """
         Get engineered candles from the database.
 
@@ -315,6 +568,9 @@ class Candles(AssembleSQL):
             Dates for query, resulting in expression:
             from_date < open_date < to_date
 
+        ascending: boolean
+            True ---> order by open_date ascending rather than descending.
+
         Returns
         -----------
         candles: pd.DataFrame
@@ -338,11 +594,537 @@ class Candles(AssembleSQL):
                                    value = symbol))
 
         sql = self._assemble_sql('engineered_data', conditions = conditions)
-        sql += ' ORDER BY open_date DESC;'
+        sql += ' ORDER BY open_date ASC;' if ascending else ' ORDER BY open_date DESC;'
+
+        return Database().execute(sql)
+
+
+    def get_columns(self, columns = None,   symbols = None,
+                          from_date = None, to_date = None,
+                          table = 'engineered_data'):
+        """
+        Get a subset of columns for a set of symbols in a single query, ordered
+        by open_date then symbol. The id column is never selected.
+
+        Parameters:
+        -----------
+        columns: list of strings
+            Columns to select. symbol and open_date are always included.
+            None selects every column in the table.
+
+        symbols: string | list of strings
+            Valid cryptocurreny symbols. None selects all symbols.
+
+        from_date, to_date: string, format '%Y-%m-%d %H:%M:%S'
+            Dates for query, resulting in expression:
+            from_date <= open_date <= to_date
+
+        table: string
+            The table to select from, usually 'candles' or 'engineered_data'.
+            'indicator_values' reads candles joined with the indicators in
+            IndicatorStore.
+
+        Returns
+        -----------
+        candles: pd.DataFrame
+            The results of the composed query.
+        """
+
+        if table == IndicatorStore.values_table:
+            return IndicatorStore().get_columns(columns, symbols, from_date,
+                                                to_date)
+
+        if columns:
+            columns = ['symbol', 'open_date'] + \
+                [c for c in columns if c not in ('symbol', 'open_date', 'id')]
+
+        if isinstance(symbols, str):
+            symbols = [symbols]
+
+        conditions = self._date_conditions(from_date, to_date)
+        if symbols:
+            conditions.append(dict(column = 'symbol',
+                                   operator = 'IN',
+                                   value = list(symbols)))
+
+        sql = self._assemble_sql(table, conditions = conditions,
+                                        columns = columns)
+        sql += ' ORDER BY open_date ASC, symbol ASC;'
 
         return Database().execute(sql)
 
 
+    def get_date_summary(self, symbols = None,   from_date = None,
+                               to_date = None,   table = 'engineered_data'):
+        """
+        Get the earliest date, latest date and number of distinct open_dates
+        for a set of symbols without reading the candles themselves.
+
+        Returns
+        -----------
+        summary: tuple
+            (min_date, max_date, num_dates). Dates are None if nothing matches.
+        """
+
+        if isinstance(symbols, str):
+            symbols = [symbols]
+
+        conditions = self._date_conditions(from_date, to_date)
+        if symbols:
+            conditions.append(dict(column = 'symbol',
+                                   operator = 'IN',
+                                   value = list(symbols)))
+
+        select = 'MIN(open_date) AS min_date, MAX(open_date) AS max_date, ' + \
+                 'COUNT(DISTINCT open_date) AS num_dates'
+        sql = self._assemble_sql(table, conditions = conditions,
+                                        select = select)
+
+        summary = Database().execute(sql + ';').iloc[0]
+        return summary.min_date, summary.max_date, int(summary.num_dates)
+
+
+    def get_version(self, symbols = None,   from_date = None,
+                          to_date = None,   table = 'engineered_data'):
+        """
+        Get the number of rows and latest date for a set of symbols, which
+        change whenever candles are inserted or deleted.
+
+        Returns
+        -----------
+        version: tuple
+            (num_rows, max_date). max_date is None if nothing matches.
+        """
+
+        if isinstance(symbols, str):
+            symbols = [symbols]
+
+        conditions = self._date_conditions(from_date, to_date)
+        if symbols:
+            conditions.append(dict(column = 'symbol',
+                                   operator = 'IN',
+                                   value = list(symbols)))
+
+        select = 'COUNT(*) AS num_rows, MAX(open_date) AS max_date'
+        sql = self._assemble_sql(table, conditions = conditions,
+                                        select = select)
+
+        version = Database().execute(sql + ';').iloc[0]
+        return int(version.num_rows), version.max_date
+
+
+class Coverage(AssembleSQL):
+    """
+    Ledger of the [start, end) candle ranges that have been fetched, per
+    symbol, source and candle interval. Ranges are kept merged, so a symbol
+    that's been collected without interruption has a single row.
+    """
+
+    table = 'candle_coverage'
+
+    create_sql = f"""
+        CREATE TABLE IF NOT EXISTS `{table}` (
+           `symbol` varchar(20),
+           `source` varchar(40),
+           `candle_interval` varchar(10),
+           `start_date` datetime,
+           `end_date` datetime,
+           UNIQUE KEY `stamp` (`symbol`,`source`,`candle_interval`,`start_date`)
+        );"""
+
+    def __init__(self, source = 'binance', interval = '1h', db = 'autonotrader'):
+        self.source = source
+        self.interval = interval
+        self.db = db
+
+    def _conditions(self, symbols = None):
+        conditions = [dict(column = 'source',
+                           operator = '=',
+                           value = self.source),
+                      dict(column = 'candle_interval',
+                           operator = '=',
+                           value = self.interval)]
+        if symbols:
+            conditions.append(dict(column = 'symbol',
+                                   operator = 'IN',
+                                   value = list(symbols)))
+        return conditions
+
+    def create_table(self):
+        """Create the ledger table if it doesn't exist."""
+        Database(db=self.db).write(self.create_sql)
+
+    def get(self, symbols = None):
+        """
+        Get covered ranges.
+
+        Parameters:
+        -----------
+        symbols: string | list of strings
+            Symbols to get coverage for. None gets all symbols.
+
+        Returns
+        -----------
+        coverage: pd.DataFrame
+            Columns 'symbol', 'start', 'end', one row per merged range.
+        """
+        if isinstance(symbols, str):
+            symbols = [symbols]
+
+        sql = self._assemble_sql(
+            self.table, conditions = self._conditions(symbols),
+            select = 'symbol, start_date AS start, end_date AS end'
+            )
+        coverage = Database(db=self.db).execute(sql + ' ORDER BY symbol, start;')
+
+        if coverage.empty:
+            return pd.DataFrame(columns=['symbol', 'start', 'end'])
+        coverage.start = pd.to_datetime(coverage.start)
+        coverage.end = pd.to_datetime(coverage.end)
+        return coverage[['symbol', 'start', 'end']]
+
+    def record(self, ranges):
+        """
+        Add fetched ranges to the ledger, merging them with the ranges already
+        recorded for their symbols. Existing rows are replaced in a single
+        transaction.
+
+        Parameters:
+        -----------
+        ranges: pd.DataFrame
+            Columns 'symbol', 'start', 'end' as datetimes, end exclusive.
+        """
+        if ranges.empty:
+            return
+
+        self.create_table()
+        symbols = sorted(ranges.symbol.unique())
+        merged = merge_ranges(pd.concat([self.get(symbols),
+                                         ranges[['symbol', 'start', 'end']]]))
+
+        values = ', '.join(
+            f"('{symbol}', '{self.source}', '{self.interval}', '{start}', '{end}')"
+            for symbol, start, end in zip(
+                merged.symbol,
+                DateArrayConvert(merged.start).date,
+                DateArrayConvert(merged.end).date
+                )
+            )
+
+        delete = f'DELETE FROM {self.table}' + \
+                 self._assemble_where(self._conditions(symbols)) + ';'
+        insert = f"INSERT INTO {self.table} (symbol, source, candle_interval, " \
+                 f"start_date, end_date) VALUES {values};"
+
+        database = Database(db=self.db)
+        try:
+            with database.connection.cursor() as cursor:
+                start = perf_counter()
+                cursor.execute(delete)
+                cursor.execute(insert)
+            database.connection.commit()
+            database._record(insert, start, rows_written=len(merged))
+        except Exception as err:
+            database.connection.rollback()
+            raise err
+
+    def seed(self):
+        """
+        Create the ledger if needed, and give every symbol in the candles
+        table without any coverage one range per run of consecutive hourly
+        candles. Holes between runs stay uncovered, so they're planned by
+        insert_missing_candles with a startTime. Requires MySQL 8.
+        """
+        self.create_table()
+
+        # Consecutive hours minus their row number are constant within a run
+        sql = f"""
+            INSERT INTO {self.table}
+                (symbol, source, candle_interval, start_date, end_date)
+            SELECT symbol, '{self.source}', '{self.interval}',
+                   MIN(open_date), MAX(open_date) + INTERVAL 1 HOUR
+            FROM (
+                SELECT c.symbol, c.open_date,
+                       TIMESTAMPDIFF(HOUR, '1970-01-01', c.open_date) -
+                       ROW_NUMBER() OVER (PARTITION BY c.symbol
+                                          ORDER BY c.open_date) AS run
+                FROM candles c
+                LEFT JOIN (
+                    SELECT DISTINCT symbol FROM {self.table}
+                    WHERE source = '{self.source}'
+                    AND candle_interval = '{self.interval}'
+                    ) covered ON covered.symbol = c.symbol
+                WHERE covered.symbol IS NULL
+                ) runs
+            GROUP BY symbol, run;"""
+        Database(db=self.db).write(sql)
+
+
+class IndicatorState(AssembleSQL):
+    """
+    Persisted state of incremental custom indicators, one row per indicator
+    and symbol, with the open_date of the last candle the state includes.
+    """
+
+    table = 'indicator_state'
+
+    create_sql = f"""
+        CREATE TABLE IF NOT EXISTS `{table}` (
+           `indicator` varchar(60),
+           `symbol` varchar(20),
+           `open_date` datetime,
+           `state` mediumtext,
+           UNIQUE KEY `stamp` (`indicator`,`symbol`)
+        );"""
+
+    def __init__(self, db = 'autonotrader'):
+        self.db = db
+
+    def create_table(self):
+        """Create the state table if it doesn't exist."""
+        Database(db=self.db).write(self.create_sql)
+
+    def get(self, indicators = None):
+        """
+        Get saved states.
+
+        Parameters:
+        -----------
+        indicators: list of strings
+            Names of the indicators. None gets every indicator.
+
+        Returns
+        -----------
+        states: pd.DataFrame
+            Columns 'indicator', 'symbol', 'open_date', 'state', with states
+            decoded from JSON.
+        """
+        self.create_table()
+
+        conditions = None
+        if indicators:
+            conditions = dict(column = 'indicator',
+                              operator = 'IN',
+                              value = list(indicators))
+
+        sql = self._assemble_sql(self.table, conditions = conditions)
+        states = Database(db=self.db).execute(sql + ';')
+
+        cols = ['indicator', 'symbol', 'open_date', 'state']
+        if states.empty:
+            return pd.DataFrame(columns=cols)
+        states.open_date = pd.to_datetime(states.open_date)
+        states.state = [json.loads(state) for state in states.state]
+        return states[cols]
+
+    def save(self, states):
+        """
+        Insert or replace states.
+
+        Parameters:
+        -----------
+        states: pd.DataFrame | list of dicts
+            With keys 'indicator', 'symbol', 'open_date', 'state'. States
+            must be JSON-serializable.
+        """
+        if isinstance(states, pd.DataFrame):
+            states = states.to_dict('records')
+        if not states:
+            return
+
+        self.create_table()
+
+        rows = [(s['indicator'], s['symbol'], DateConvert(s['open_date']).date,
+                 json.dumps(s['state'])) for s in states]
+        sql = f"INSERT INTO {self.table} (indicator, symbol, open_date, state) " \
+               "VALUES (%s, %s, %s, %s) ON DUPLICATE KEY UPDATE " \
+               "open_date=VALUES(open_date), state=VALUES(state);"
+
+        database = Database(db=self.db)
+        start = perf_counter()
+        with database.connection.cursor() as cursor:
+            rows_written = cursor.executemany(sql, rows)
+        database.connection.commit()
+        database._record(sql, start, rows_written=rows_written or 0)
+
+
+class IndicatorStore(AssembleSQL):
+    """
+    Long-format store of custom indicator values, one row per symbol,
+    open_date and indicator, as an alternative to a column per indicator in
+    engineered_data. Adding an indicator only adds a row to indicator_names,
+    and candle columns aren't duplicated; get_columns joins the requested
+    indicators back onto candles.
+    """
+
+    names_table = 'indicator_names'
+    values_table = 'indicator_values'
+
+    create_sql = [
+        f"""
+        CREATE TABLE IF NOT EXISTS `{names_table}` (
+           `indicator_id` int(11) NOT NULL AUTO_INCREMENT,
+           `indicator` varchar(60),
+           PRIMARY KEY (`indicator_id`),
+           UNIQUE KEY `stamp` (`indicator`)
+        );""",
+        f"""
+        CREATE TABLE IF NOT EXISTS `{values_table}` (
+           `symbol` varchar(20),
+           `open_date` datetime,
+           `indicator_id` int(11),
+           `value` float(20,9),
+           PRIMARY KEY (`symbol`,`open_date`,`indicator_id`)
+        );"""
+        ]
+
+    def __init__(self, db = 'autonotrader'):
+        self.db = db
+
+    def create_tables(self):
+        """Create the store's tables if they don't exist."""
+        for sql in self.create_sql:
+            Database(db=self.db).write(sql)
+
+    def get_ids(self):
+        """Return a dict of every registered indicator name to its id."""
+        self.create_tables()
+        sql = f'SELECT indicator, indicator_id FROM {self.names_table};'
+        names = Database(db=self.db).execute(sql)
+        if names.empty:
+            return {}
+        return dict(zip(names.indicator, names.indicator_id.astype(int)))
+
+    def register(self, indicators):
+        """
+        Register indicator names, ignoring ones already registered, and
+        return a dict of every registered name to its id.
+        """
+        self.create_tables()
+        if indicators:
+            values = ', '.join(f"('{name}')" for name in indicators)
+            Database(db=self.db).write(
+                f'INSERT IGNORE INTO {self.names_table} (indicator) ' +
+                f'VALUES {values};'
+                )
+        return self.get_ids()
+
+    def save(self, ins, indicators):
+        """
+        Insert or replace indicator values.
+
+        Parameters:
+        -----------
+        ins: pd.DataFrame
+            Columns 'symbol', 'open_date' and a column per indicator, like
+            the output of ingestion.core.engineer_data. Null values aren't
+            stored.
+
+        indicators: list of strings
+            Names of the indicator columns to store.
+
+        Returns
+        -----------
+        rows_written: int
+        """
+        ids = self.register(indicators)
+
+        values = ins[['symbol', 'open_date'] + list(indicators)].melt(
+            id_vars=['symbol', 'open_date'], var_name='indicator'
+            ).dropna()
+        if values.empty:
+            return 0
+
+        rows = list(zip(values.symbol.tolist(),
+                        DateArrayConvert(values.open_date).date.tolist(),
+                        values.indicator.map(ids).tolist(),
+                        values.value.astype(float).tolist()))
+        sql = f"INSERT INTO {self.values_table} " \
+               "(symbol, open_date, indicator_id, value) " \
+               "VALUES (%s, %s, %s, %s) ON DUPLICATE KEY UPDATE " \
+               "value=VALUES(value);"
+
+        database = Database(db=self.db)
+        start = perf_counter()
+        with database.connection.cursor() as cursor:
+            rows_written = cursor.executemany(sql, rows)
+        database.connection.commit()
+        database._record(sql, start, rows_written=rows_written or 0)
+        return rows_written or 0
+
+    def get_columns(self, columns = None,   symbols = None,
+                          from_date = None, to_date = None):
+        """
+        Get candles joined with stored indicators in a single query, ordered
+        by open_date then symbol, like Candles.get_columns on
+        engineered_data. Only candles with a value for every requested
+        indicator are returned.
+
+        Parameters:
+        -----------
+        columns: list of strings
+            Indicator names and candle columns to select. symbol and
+            open_date are always included. None selects every candle column
+            and every registered indicator.
+
+        symbols: string | list of strings
+            Valid cryptocurreny symbols. None selects all symbols.
+
+        from_date, to_date: string, format '%Y-%m-%d %H:%M:%S'
+            Dates for query, resulting in expression:
+            from_date <= open_date <= to_date
+
+        Returns
+        -----------
+        candles: pd.DataFrame
+            A column per candle column and indicator.
+        """
+        ids = self.get_ids()
+        if columns is None:
+            indicators = list(ids)
+            select = ['c.*']
+        else:
+            indicators = [c for c in columns if c in ids]
+            candle_columns = ['symbol', 'open_date'] + [
+                c for c in columns if c not in ids and
+                c not in ('symbol', 'open_date', 'id')
+                ]
+            select = [f'c.`{c}`' for c in candle_columns]
+
+        if not indicators:
+            return Candles().get_columns(columns, symbols, from_date,
+                                         to_date, table='candles')
+
+        if isinstance(symbols, str):
+            symbols = [symbols]
+
+        conditions = self._date_conditions(from_date, to_date,
+                                           column='c.open_date')
+        conditions.append(dict(column = 'v.indicator_id',
+                               operator = 'IN',
+                               value = [int(ids[i]) for i in indicators]))
+        if symbols:
+            conditions.append(dict(column = 'c.symbol',
+                                   operator = 'IN',
+                                   value = list(symbols)))
+
+        # Pivot with one conditional aggregate per indicator
+        select += [f'MAX(CASE WHEN v.indicator_id = {ids[i]} ' +
+                   f'THEN v.value END) AS `{i}`' for i in indicators]
+        table = f'candles AS c JOIN {self.values_table} AS v ' + \
+                'ON v.symbol = c.symbol AND v.open_date = c.open_date'
+
+        sql = self._assemble_sql(table, conditions = conditions,
+                                        select = ', '.join(select))
+        sql += f' GROUP BY c.id HAVING COUNT(*) = {len(indicators)}' + \
+               ' ORDER BY c.open_date ASC, c.symbol ASC;'
+
+        candles = Database(db=self.db).execute(sql)
+        if 'id' in candles.columns:
+            candles = candles.drop('id', axis=1)
+        return candles
+
+
 class Trades(AssembleSQL):
 
     def get_trades(self, symbol = None,   from_date = None,
@@ -0,0 +1,219 @@
+"""Per-query timing and slow-query instrumentation for the Database class."""
+
+import re
+import json
+import logging
+import threading
+import pandas as pd
+from datetime import datetime
+from config.data_collection import query_profiling_config
+
+
+# Upper bounds (in ms) of the duration histogram buckets
+HISTOGRAM_BUCKETS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000,
+                     10000, float('inf')]
+
+# Patterns used to collapse literal values out of SQL statements
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER = re.compile(r'(?<![\w`])-?\d+(?:\.\d+)?(?:e-?\d+)?\b', re.IGNORECASE)
+_NULL = re.compile(r'\bNULL\b', re.IGNORECASE)
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*\?\s*,?)+\)', re.IGNORECASE)
+_VALUES = re.compile(r'\bVALUES\s+\([^()]*\)(?:\s*,\s*\([^()]*\))*',
+                     re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """
+    Reduce a SQL statement to its shape by replacing literals with '?' and
+    collapsing IN lists and multi-row VALUES clauses.
+
+        SELECT * FROM candles WHERE symbol = 'BTCUSDT' AND close > 10
+        ---> SELECT * FROM candles WHERE symbol = ? AND close > ?
+    """
+    shape = _STRING.sub('?', sql)
+    shape = _NUMBER.sub('?', shape)
+    shape = _NULL.sub('?', shape)
+    shape = _IN_LIST.sub('IN (?+)', shape)
+    shape = _VALUES.sub('VALUES (...)', shape)
+    shape = _WHITESPACE.sub(' ', shape).strip().rstrip(';')
+    return shape
+
+
+class QueryProfiler:
+    """
+    Aggregate query statistics in-process, keyed by normalized SQL shape.
+
+    Each recorded call adds to the count, total/max duration, rows read and
+    written, bytes sent and received, and a duration histogram of its shape.
+    Calls slower than the slow query threshold are written to the slow query
+    log, and the Database capturing them can attach an EXPLAIN plan.
+    """
+
+    def __init__(self, config=query_profiling_config):
+        self.enabled = config['enabled']
+        self.slow_query_threshold = config['slow_query_threshold']
+        self.explain = config['explain']
+        self.dump_path = config['dump_path']
+
+        self.slow_log = logging.getLogger('autonotrader.slow_queries')
+        if config['slow_query_log'] and not self.slow_log.handlers:
+            handler = logging.FileHandler(config['slow_query_log'], delay=True)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            self.slow_log.addHandler(handler)
+            self.slow_log.setLevel(logging.INFO)
+            self.slow_log.propagate = False
+
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Discard all recorded statistics."""
+        with self._lock:
+            self.stats = {}
+            self.explains = {}
+
+    def record(self, sql, duration, rows_read=0, rows_written=0,
+                     bytes_sent=0, bytes_received=0):
+        """
+        Record a single call.
+
+        Parameters:
+        ------------
+        sql: string
+            The statement that was executed.
+
+        duration: float
+            Wall time of the call in seconds.
+
+        rows_read, rows_written: int
+            Rows returned by the call, rows affected by the call.
+
+        bytes_sent, bytes_received: int
+            Size of the statement sent, approximate size of the result.
+
+        Returns:
+        ------------
+        slow: boolean
+            True if the call exceeded the slow query threshold.
+        """
+        if not self.enabled:
+            return False
+
+        shape = normalize_sql(sql)
+        duration_ms = duration*1000
+
+        with self._lock:
+            if shape not in self.stats:
+                self.stats[shape] = {
+                    'count':0,
+                    'total_ms':0.0,
+                    'max_ms':0.0,
+                    'rows_read':0,
+                    'rows_written':0,
+                    'bytes_sent':0,
+                    'bytes_received':0,
+                    'slow':0,
+                    'histogram':[0]*len(HISTOGRAM_BUCKETS)
+                    }
+
+            s = self.stats[shape]
+            s['count'] += 1
+            s['total_ms'] += duration_ms
+            s['max_ms'] = max(s['max_ms'], duration_ms)
+            s['rows_read'] += rows_read
+            s['rows_written'] += rows_written
+            s['bytes_sent'] += bytes_sent
+            s['bytes_received'] += bytes_received
+
+            for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                if duration_ms <= bound:
+                    s['histogram'][i] += 1
+                    break
+
+            slow = duration >= self.slow_query_threshold
+            if slow:
+                s['slow'] += 1
+
+        if slow:
+            self.slow_log.info(
+                f'{round(duration_ms, 1)}ms rows_read={rows_read} '
+                f'rows_written={rows_written} sql={sql[:1000]}'
+            )
+        return slow
+
+    def wants_explain(self, sql):
+        """True if an EXPLAIN plan should be captured for a slow statement."""
+        if not self.explain:
+            return False
+        if not sql.lstrip().upper().startswith(('SELECT', 'DELETE', 'UPDATE')):
+            return False
+        return normalize_sql(sql) not in self.explains
+
+    def add_explain(self, sql, plan):
+        """Attach an EXPLAIN plan (list of dicts) to a statement's shape."""
+        with self._lock:
+            self.explains[normalize_sql(sql)] = plan
+
+    def get_stats(self):
+        """
+        Return recorded statistics as a DataFrame with one row per SQL shape,
+        sorted by total time spent.
+        """
+        with self._lock:
+            rows = []
+            for shape, s in self.stats.items():
+                row = {k:v for k,v in s.items() if k != 'histogram'}
+                row['sql'] = shape
+                row['mean_ms'] = s['total_ms']/s['count']
+                row['histogram'] = list(s['histogram'])
+                row['explain'] = self.explains.get(shape)
+                rows.append(row)
+
+        cols = ['sql', 'count', 'total_ms', 'mean_ms', 'max_ms', 'slow',
+                'rows_read', 'rows_written', 'bytes_sent', 'bytes_received',
+                'histogram', 'explain']
+        if not rows:
+            return pd.DataFrame(columns=cols)
+
+        stats = pd.DataFrame(rows)[cols]
+        return stats.sort_values('total_ms', ascending=False)
+
+    def dump(self, label=None, path=None, reset=True):
+        """
+        Append the current statistics to the dump file as a single JSON line.
+
+        Parameters:
+        ------------
+        label: string
+            Name of the task the statistics belong to.
+
+        path: string
+            File to append to. Defaults to the configured dump_path.
+
+        reset: boolean
+            True ---> clear statistics after dumping.
+        """
+        path = path or self.dump_path
+        if not self.enabled or not path:
+            return
+
+        with self._lock:
+            snapshot = {
+                'date':datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+                'label':label,
+                'buckets_ms':[str(b) for b in HISTOGRAM_BUCKETS],
+                'queries':{
+                    shape:dict(s, explain=self.explains.get(shape))
+                    for shape, s in self.stats.items()
+                    }
+                }
+
+        with open(path, 'a') as f:
+            f.write(json.dumps(snapshot, default=str) + '\n')
+
+        if reset:
+            self.reset()
+
+
+profiler = QueryProfiler()
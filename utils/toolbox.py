@@ -93,6 +93,148 @@ class DateConvert:
             ''')
 
 
+class DateArrayConvert:
+    '''
+    Vectorized counterpart of DateConvert. Convert a whole sequence of dates
+    in a single NumPy/pandas pass. All dates should be in UTC.
+
+    Attributes:
+    ------------
+    datetime: numpy.ndarray of datetime64[s]
+    date: numpy.ndarray of strings like '%Y-%m-%d %H:%M:%S'
+    timestamp: numpy.ndarray of int64 second timestamps
+
+    Missing values become NaT, None and the minimum int64 respectively.
+    '''
+    def __init__(self, dates):
+        '''
+        Parameters:
+        ------------
+        dates: pandas.Series | numpy.ndarray | list
+            Second or millisecond timestamps, date strings like
+            '%Y-%m-%d %H:%M:%S' or '%Y-%m-%dT%H:%M:%SZ', datetimes,
+            pandas Timestamps or datetime64 values.
+        '''
+
+        if isinstance(dates, (pd.Series, pd.Index)):
+            values = dates.values
+        else:
+            values = np.asarray(dates)
+
+        if values.dtype.kind in 'iuf':
+            # Millisecond timestamps have 13 digits, second timestamps 10
+            values = values.astype('float64')
+            values = np.where(values >= 1e11, values/1000, values)
+            missing = np.isnan(values)
+            values = np.floor(np.where(missing, 0, values)).astype('int64')
+            self._datetime = values.astype('datetime64[s]')
+            self._datetime[missing] = np.datetime64('NaT')
+
+        elif values.dtype.kind == 'M':
+            self._datetime = values.astype('datetime64[s]')
+
+        else:
+            converted = pd.to_datetime(pd.Series(values), utc=True)
+            self._datetime = converted.dt.tz_convert(None).values \
+                                                         .astype('datetime64[s]')
+
+    @property
+    def datetime(self):
+        return self._datetime
+
+    @property
+    def date(self):
+        date = np.datetime_as_string(self._datetime, unit='s')
+        date = np.char.replace(date, 'T', ' ')
+
+        # Missing dates are None, which format_records writes as NULL
+        missing = np.isnat(self._datetime)
+        if missing.any():
+            date = date.astype(object)
+            date[missing] = None
+        return date
+
+    @property
+    def timestamp(self):
+        return self._datetime.astype('int64')
+
+
+class DateContinuity:
+    '''
+    Vectorized continuity check of a sequence of dates.
+
+    Attributes:
+    ------------
+    gaps: pandas.DataFrame
+        One row per gap, with the first and last missing dates and the
+        number of missing dates. Columns: | start | end | missing |
+
+    duplicates: numpy.ndarray of datetime64[s]
+        Dates that occur more than once.
+
+    misaligned: numpy.ndarray of datetime64[s]
+        Dates that don't fall on the expected grid, e.g. not on the hour.
+    '''
+    def __init__(self, dates, freq='1H'):
+        '''
+        Parameters:
+        ------------
+        dates: pandas.Series | numpy.ndarray | list
+            Dates in any order, as datetimes or date strings.
+
+        freq: string | None
+            Expected spacing of the dates, e.g. '1H'. Dates are expected to
+            be multiples of freq since the epoch. None infers the spacing as
+            the smallest difference between dates, aligned to the first date.
+        '''
+
+        dates = np.sort(DateArrayConvert(dates).datetime)
+        self.gaps = pd.DataFrame(columns=['start', 'end', 'missing'])
+        self.duplicates = dates[:0]
+        self.misaligned = dates[:0]
+        if len(dates) < 2:
+            return
+
+        # Work in integer seconds since the epoch
+        seconds = dates.astype('int64')
+        diffs = np.diff(seconds)
+        self.duplicates = np.unique(dates[1:][diffs == 0])
+        seconds = np.unique(seconds)
+        if len(seconds) < 2:
+            return
+
+        if freq:
+            step = int(pd.Timedelta(freq).total_seconds())
+            aligned = seconds % step == 0
+        else:
+            step = int(np.diff(seconds).min())
+            aligned = (seconds - seconds[0]) % step == 0
+
+        self.misaligned = seconds[~aligned].astype('datetime64[s]')
+        seconds = seconds[aligned]
+        if len(seconds) < 2:
+            return
+
+        diffs = np.diff(seconds)
+        inds = np.flatnonzero(diffs > step)
+        self.gaps = pd.DataFrame({
+            'start':(seconds[inds] + step).astype('datetime64[s]'),
+            'end':(seconds[inds+1] - step).astype('datetime64[s]'),
+            'missing':diffs[inds]//step - 1
+            }, columns=['start', 'end', 'missing'])
+
+    @property
+    def continuous(self):
+        '''True if there are no gaps, duplicates or misaligned dates.'''
+        return self.gaps.empty and not len(self.duplicates) \
+                               and not len(self.misaligned)
+
+    @property
+    def num_missing(self):
+        '''Total number of missing dates across all gaps.'''
+        return int(self.gaps.missing.sum())
+
+
 def progress_bar(count, total, status):
     """
     Print refreshing progress bar to console.
@@ -148,6 +290,76 @@ def format_records(records, exclude=[]):
     return ret
 
 
+def merge_ranges(ranges, by='symbol'):
+    """
+    Merge overlapping or adjacent [start, end) ranges within each group.
+
+    Parameters:
+    ----------------
+    ranges: pandas.DataFrame
+        Columns <by>, 'start', 'end'.
+
+    by: string
+        Column to group ranges by.
+
+    Returns:
+    ----------------
+    merged: pandas.DataFrame
+        Columns <by>, 'start', 'end', sorted by <by> then start.
+    """
+    if ranges.empty:
+        return pd.DataFrame(columns=[by, 'start', 'end'])
+
+    ranges = ranges.sort_values([by, 'start']).reset_index(drop=True)
+
+    # A range starts a new group if it begins after every earlier range ends
+    starts = pd.Series(ranges.start.values.astype('int64'))
+    ends = pd.Series(ranges.end.values.astype('int64'))
+    reach = ends.groupby(ranges[by]).cummax()
+    previous_reach = reach.groupby(ranges[by]).shift()
+    new = previous_reach.isnull() | (starts > previous_reach)
+    group = new.cumsum()
+
+    merged = ranges.groupby(group).agg({by:'first', 'start':'min', 'end':'max'})
+    return merged[[by, 'start', 'end']].reset_index(drop=True)
+
+
+def format_frame(df, exclude=[]):
+    """
+    Vectorized counterpart of format_records for DataFrames. Numeric-like
+    columns are converted to numbers, dates and strings are enclosed in
+    apostrophes, and nulls become NULL, a column at a time. The result can be
+    passed to Database.insert with auto_format=False.
+
+    Parameters:
+    ----------------
+    exclude: list of strings
+        Columns that should be excluded from alteration.
+    """
+    df = df.copy()
+    for column in df.columns:
+        if column in exclude:
+            continue
+
+        values = df[column]
+        null = values.isnull().values
+
+        if values.dtype.kind == 'M':
+            values = pd.Series(DateArrayConvert(values).date, index=df.index)
+
+        elif values.dtype.kind == 'O':
+            null |= (values == '').values
+            numeric = pd.to_numeric(values, errors='coerce')
+            if numeric.notnull().sum() == (~null).sum():
+                values = numeric
+
+        if values.dtype.kind in 'OU':
+            values = "'" + values.astype(str) + "'"
+
+        df[column] = values.astype(object).where(~null, 'NULL')
+    return df
+
+
 def chunker(array, chunk_size):
     for i in range(0, len(array), chunk_size):
         yield array[i:i+chunk_size]